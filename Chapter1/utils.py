@@ -1,13 +1,20 @@
 # 載入需要的套件
+import json
 import os
-from datetime import datetime
-from typing import List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple, Union
 
 import finlab
+import numpy as np
 import pandas as pd
 import yfinance as yf
 from dotenv import load_dotenv
 from finlab import data
+from finlab.dataframe import FinlabDataFrame
 from pandas.core.indexes.datetimes import DatetimeIndex
 from typing_extensions import Annotated
 
@@ -28,6 +35,130 @@ def finlab_login() -> None:
 # finlab_login()
 
 
+# 本地端快取資料的預設存放資料夾
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+# 價量資料的欄位名稱
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+# yf.download 使用模組層級的共用狀態，同一時間只能有一個呼叫，需用 lock 保護
+_YF_DOWNLOAD_LOCK = threading.Lock()
+
+
+def load_finlab_dataset(
+    name: Annotated[str, "資料集名稱，例如：fundamental_features:營業利益"],
+) -> Annotated[pd.DataFrame, "FinLab 資料表"]:
+    """
+    函式說明:
+    FinlabDataCache 預設使用的資料來源(backend)，直接向 FinLab 取得資料集(name)。
+    名稱為 search:<資料型態> 時，回傳該資料型態下所有項目的列表(單一欄位 items)。
+    """
+    if name.startswith("search:"):
+        items = data.search(
+            keyword=name[len("search:") :],
+            display_info=["name", "description", "items"],
+        )[0]["items"]
+        return pd.DataFrame({"items": list(items)})
+    return data.get(name)
+
+
+class FinlabDataCache:
+    """
+    類別說明:
+    以資料集名稱為鍵值的 FinLab 資料快取，分成兩層：
+    1. 記憶體層: 最多保留 max_items 個最近使用的資料集(LRU)。
+    2. 磁碟層: 每個資料集存成一個 Parquet 檔案，檔案超過 ttl 後視為過期並重新取得。
+    backend 的介面為 backend(name)，回傳資料表，離線測試時可以換成假的資料來源，
+    例如：FinlabDataCache(cache_dir=None, backend={"company_basic_info": df}.__getitem__)。
+    回傳的資料表會共用快取中的物件，請勿直接就地修改。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Annotated[
+            Optional[str], "磁碟快取資料夾路徑，None 表示只使用記憶體快取"
+        ] = os.path.join(DEFAULT_CACHE_DIR, "finlab"),
+        ttl: Annotated[timedelta, "快取資料的有效期限"] = timedelta(days=1),
+        max_items: Annotated[int, "記憶體中最多保留的資料集數量"] = 32,
+        backend: Annotated[
+            Callable[[str], pd.DataFrame], "取得資料集的函式"
+        ] = load_finlab_dataset,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_items = max_items
+        self.backend = backend
+        # 記憶體快取: {資料集名稱: (取得資料的時間, 資料表)}
+        self._memory = OrderedDict()
+
+    def _path(self, name: str) -> str:
+        # 資料集名稱中的冒號不能作為 Windows 的檔名，改用兩個底線取代
+        return os.path.join(self.cache_dir, f"{name.replace(':', '__')}.parquet")
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return time.time() - loaded_at < self.ttl.total_seconds()
+
+    def get(
+        self, name: Annotated[str, "資料集名稱，例如：fundamental_features:營業利益"]
+    ) -> Annotated[pd.DataFrame, "FinLab 資料表"]:
+        """
+        函式說明:
+        依序從記憶體快取、磁碟快取取得資料集(name)，都沒有或已過期時才呼叫 backend 取得，
+        並將結果寫回兩層快取。
+        """
+        if name in self._memory:
+            loaded_at, dataset = self._memory[name]
+            if self._is_fresh(loaded_at):
+                self._memory.move_to_end(name)
+                return dataset
+            del self._memory[name]
+
+        path = self._path(name) if self.cache_dir else None
+        if path and os.path.exists(path) and self._is_fresh(os.path.getmtime(path)):
+            loaded_at = os.path.getmtime(path)
+            dataset = FinlabDataFrame(pd.read_parquet(path))
+        else:
+            loaded_at = time.time()
+            dataset = FinlabDataFrame(self.backend(name))
+            if path:
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    dataset.to_parquet(f"{path}.tmp")
+                    os.replace(f"{path}.tmp", path)
+                except (ValueError, TypeError, NotImplementedError, ImportError) as e:
+                    # 欄位型態無法存成 Parquet 時，只保留在記憶體快取中
+                    print(f"資料集 {name} 無法寫入磁碟快取: {e}")
+
+        self._memory[name] = (loaded_at, dataset)
+        self._memory.move_to_end(name)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+        return dataset
+
+    def invalidate(
+        self,
+        name: Annotated[
+            Optional[str], "要清除的資料集名稱，None 表示清除全部快取"
+        ] = None,
+    ) -> None:
+        """
+        函式說明:
+        清除指定資料集(name)在記憶體與磁碟中的快取，未指定時清除所有資料集的快取。
+        """
+        if name is None:
+            self._memory.clear()
+            if self.cache_dir and os.path.isdir(self.cache_dir):
+                for file_name in os.listdir(self.cache_dir):
+                    if file_name.endswith(".parquet"):
+                        os.remove(os.path.join(self.cache_dir, file_name))
+            return
+        self._memory.pop(name, None)
+        if self.cache_dir and os.path.exists(self._path(name)):
+            os.remove(self._path(name))
+
+
+# 模組共用的 FinLab 資料快取，測試時可以替換成使用假資料來源的 FinlabDataCache
+finlab_data_cache = FinlabDataCache()
+
+
 def get_top_stocks_by_market_value(
     excluded_industry: Annotated[List[str], "需要排除的特定產業類別列表"] = [],
     pre_list_date: Annotated[str, "上市日期須早於此指定日期"] = None,
@@ -41,7 +172,7 @@ def get_top_stocks_by_market_value(
     3. 選擇市值前 N 大的公司(top_n)。
     """
     # 從 FinLab 取得公司基本資訊表，內容包括公司股票代碼、公司名稱、上市日期和產業類別
-    company_info = data.get("company_basic_info")[
+    company_info = finlab_data_cache.get("company_basic_info")[
         ["stock_id", "公司名稱", "上市日期", "產業類別", "市場別"]
     ]
     # 如果有指定要排除的產業類別，則過濾掉這些產業的公司
@@ -54,7 +185,7 @@ def get_top_stocks_by_market_value(
     # 如果有設定top_n條件，則選取市值前 N 大的公司股票代碼
     if top_n:
         # 從 FinLab 取得最新的個股市值數據表，並重設索引名稱為 market_value
-        market_value = pd.DataFrame(data.get("etl:market_value"))
+        market_value = pd.DataFrame(finlab_data_cache.get("etl:market_value"))
         market_value = market_value[market_value.index == pre_list_date]
         market_value = market_value.reset_index().melt(
             id_vars="date", var_name="stock_id", value_name="market_value"
@@ -79,11 +210,213 @@ def get_top_stocks_by_market_value(
 # )
 
 
+def download_ohlcv_from_yfinance(
+    symbol: Annotated[str, "股票代碼(含交易所後綴)，例如：2330.TW"],
+    start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
+    end_date: Annotated[str, "結束日期(不包含當天)", "YYYY-MM-DD"],
+) -> Annotated[
+    pd.DataFrame, "單一股票的價量資料表", "索引是日期(datetime)，欄位包含開高低收量"
+]:
+    """
+    函式說明:
+    從 YFinance 下載單一股票(symbol)在給定日期範圍內(start_date~end_date)的每日價量資料，
+    這也是 PriceCache 預設使用的下載函式(fetcher)。
+    """
+    stock_data = pd.DataFrame(yf.download(symbol, start=start_date, end=end_date))
+    # 沒有任何資料時，回傳欄位完整的空資料表
+    if stock_data.empty:
+        return pd.DataFrame(
+            columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="datetime")
+        )
+    # YFinance 會回傳多層欄位(Price, Ticker)，只保留價量欄位名稱
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        stock_data = stock_data.droplevel("Ticker", axis=1)
+    stock_data.columns.name = None
+    stock_data.index.name = "datetime"
+    return stock_data[OHLCV_COLUMNS]
+
+
+def download_ohlcv_batch_from_yfinance(
+    symbols: Annotated[List[str], "一個批次的股票代碼列表(含交易所後綴)"],
+    start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
+    end_date: Annotated[str, "結束日期(不包含當天)", "YYYY-MM-DD"],
+) -> Annotated[
+    pd.DataFrame,
+    "多檔股票的價量資料表",
+    "索引是日期，欄位是 (Price, Ticker) 兩層欄位",
+]:
+    """
+    函式說明:
+    一次從 YFinance 下載一個批次的多檔股票(symbols)在給定日期範圍內的每日價量資料，
+    這是 get_daily_OHLCV_data 批次模式預設使用的下載函式(batch_fetcher)。
+    批次內的多檔股票由 yfinance 以多個執行緒平行下載(threads=True)；
+    yf.download 使用模組層級的共用狀態，不同批次之間無法同時下載，會依序執行。
+    """
+    with _YF_DOWNLOAD_LOCK:
+        return pd.DataFrame(
+            yf.download(
+                symbols,
+                start=start_date,
+                end=end_date,
+                group_by="column",
+                threads=True,
+            )
+        )
+
+
+class PriceCache:
+    """
+    類別說明:
+    本地端的每日價量資料快取，每檔股票存成一個 Parquet 檔案({cache_dir}/{symbol}.parquet)，
+    並在 _coverage.json 中記錄每檔股票已經下載過的日期區間。
+    讀取資料時只會透過 fetcher 下載快取中缺少的日期區間，
+    get_daily_OHLCV_data 和 get_daily_close_prices_data 可以共用同一個快取。
+    fetcher 的介面為 fetcher(symbol, start_date, end_date)，
+    回傳索引為日期、欄位包含開高低收量的資料表，測試時可以換成假的下載函式。
+    注意: YFinance 預設回傳還原權值的價格，除權息後如果要更新歷史價格，請呼叫 invalidate。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Annotated[str, "快取資料夾路徑"] = os.path.join(
+            DEFAULT_CACHE_DIR, "prices"
+        ),
+        fetcher: Annotated[
+            Callable[[str, str, str], pd.DataFrame], "下載單一股票價量資料的函式"
+        ] = download_ohlcv_from_yfinance,
+    ):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._coverage_path = os.path.join(self.cache_dir, "_coverage.json")
+        # 每檔股票已快取的日期區間: {symbol: [起始日期, 結束日期(不包含)]}
+        self._coverage = {}
+        if os.path.exists(self._coverage_path):
+            with open(self._coverage_path, encoding="utf-8") as f:
+                self._coverage = json.load(f)
+
+    def _asset_path(self, symbol: str) -> str:
+        return os.path.join(self.cache_dir, f"{symbol}.parquet")
+
+    def _read_asset(self, symbol: str) -> pd.DataFrame:
+        path = self._asset_path(symbol)
+        if symbol not in self._coverage or not os.path.exists(path):
+            return pd.DataFrame(
+                columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="datetime")
+            )
+        return pd.read_parquet(path)
+
+    def _write_asset(self, symbol: str, stock_data: pd.DataFrame) -> None:
+        # 先寫入暫存檔再取代原檔，避免寫到一半中斷時破壞既有的快取
+        path = self._asset_path(symbol)
+        stock_data.to_parquet(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        with open(f"{self._coverage_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self._coverage, f, indent=2)
+        os.replace(f"{self._coverage_path}.tmp", self._coverage_path)
+
+    def get(
+        self,
+        symbol: Annotated[str, "股票代碼(含交易所後綴)，例如：2330.TW"],
+        start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
+        end_date: Annotated[str, "結束日期(不包含當天)", "YYYY-MM-DD"],
+    ) -> Annotated[
+        pd.DataFrame, "單一股票的價量資料表", "索引是日期(datetime)，欄位包含開高低收量"
+    ]:
+        """
+        函式說明:
+        取得單一股票(symbol)在給定日期範圍內(start_date~end_date)的每日價量資料，
+        只有快取中缺少的日期區間才會呼叫 fetcher 下載，下載後的資料會寫回快取。
+        """
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date).normalize()
+        # 今天(含)以後的價量尚未收盤確定，不記錄為已快取的區間，下次讀取時會重新下載
+        settled_end = min(end, pd.Timestamp.today().normalize())
+
+        stock_data = self._read_asset(symbol)
+        # 計算快取中缺少的日期區間，已快取區間以外的部分才需要下載
+        # 每個區間記錄 (起始日期, 結束日期, 下載成功時已快取區間的新起點, 新終點)
+        if symbol in self._coverage:
+            covered_start, covered_end = map(pd.Timestamp, self._coverage[symbol])
+            missing_ranges = []
+            if start < covered_start:
+                missing_ranges.append((start, covered_start, start, covered_end))
+            if end > covered_end:
+                missing_ranges.append(
+                    (covered_end, end, covered_start, max(settled_end, covered_end))
+                )
+        else:
+            covered_start = covered_end = None
+            missing_ranges = [(start, end, start, settled_end)]
+
+        if missing_ranges:
+            fetched_data = []
+            new_start, new_end = covered_start, covered_end
+            for range_start, range_end, extended_start, extended_end in missing_ranges:
+                df = self.fetcher(
+                    symbol,
+                    range_start.strftime("%Y-%m-%d"),
+                    range_end.strftime("%Y-%m-%d"),
+                )
+                # YFinance 下載失敗時只會回傳空的資料表，空的區間不記錄為已快取，
+                # 下次讀取時會重新下載，避免一次網路錯誤讓該區間永遠是空的
+                if df.empty:
+                    continue
+                fetched_data.append(df)
+                new_start = (
+                    extended_start
+                    if new_start is None
+                    else min(new_start, extended_start)
+                )
+                new_end = (
+                    extended_end if new_end is None else max(new_end, extended_end)
+                )
+
+            if fetched_data:
+                stock_data = pd.concat(
+                    [df for df in [stock_data, *fetched_data] if not df.empty]
+                )
+                # 重複的日期以最新下載的資料為準
+                stock_data = stock_data[
+                    ~stock_data.index.duplicated(keep="last")
+                ].sort_index()[OHLCV_COLUMNS]
+                stock_data.index.name = "datetime"
+                if new_start < new_end:
+                    self._coverage[symbol] = [
+                        new_start.strftime("%Y-%m-%d"),
+                        new_end.strftime("%Y-%m-%d"),
+                    ]
+                    self._write_asset(symbol, stock_data)
+
+        return stock_data[(stock_data.index >= start) & (stock_data.index < end)]
+
+    def invalidate(
+        self,
+        symbol: Annotated[
+            Optional[str], "要清除的股票代碼，None 表示清除全部快取"
+        ] = None,
+    ) -> None:
+        """
+        函式說明:
+        清除指定股票(symbol)的快取資料，未指定時清除所有股票的快取資料。
+        """
+        symbols = [symbol] if symbol else list(self._coverage)
+        for s in symbols:
+            self._coverage.pop(s, None)
+            if os.path.exists(self._asset_path(s)):
+                os.remove(self._asset_path(s))
+        with open(self._coverage_path, "w", encoding="utf-8") as f:
+            json.dump(self._coverage, f, indent=2)
+
+
 def get_daily_close_prices_data(
     stock_symbols: Annotated[List[str], "股票代碼列表"],
     start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
     end_date: Annotated[str, "結束日期", "YYYY-MM-DD"],
     is_tw_stock: Annotated[bool, "stock_symbols 是否是台灣股票"] = True,
+    price_cache: Annotated[
+        Optional[PriceCache], "本地價量資料快取，None 表示直接從 YFinance 下載"
+    ] = None,
 ) -> Annotated[
     pd.DataFrame,
     "每日股票收盤價資料表",
@@ -93,6 +426,7 @@ def get_daily_close_prices_data(
     """
     函式說明:
     獲取指定股票清單(stock_symbols)在給定日期範圍內(start_date~end_date)每日收盤價資料。
+    如果有指定價量資料快取(price_cache)，則從快取讀取，只下載快取中缺少的日期區間。
     """
     # 如果是台灣股票，則在每個股票代碼後加上 ".TW"
     if is_tw_stock:
@@ -100,8 +434,18 @@ def get_daily_close_prices_data(
             f"{symbol}.TW" if ".TW" not in symbol else symbol
             for symbol in stock_symbols
         ]
-    # 從 YFinance 下載指定股票在給定日期範圍內的數據，並取出收盤價欄位(Close)的資料
-    stock_data = yf.download(stock_symbols, start=start_date, end=end_date)["Close"]
+    if price_cache is not None:
+        # 從本地快取取出每檔股票的收盤價欄位(Close)，並以日期為索引合併成一張資料表
+        stock_data = pd.concat(
+            {
+                symbol: price_cache.get(symbol, start_date, end_date)["Close"]
+                for symbol in stock_symbols
+            },
+            axis=1,
+        ).sort_index()
+    else:
+        # 從 YFinance 下載指定股票在給定日期範圍內的數據，並取出收盤價欄位(Close)的資料
+        stock_data = yf.download(stock_symbols, start=start_date, end=end_date)["Close"]
     # 如果只取一支股票，將其轉換為 DataFrame 並設定欄位名稱為該股票代碼
     if len(stock_symbols) == 1:
         stock_data = pd.DataFrame(stock_data)
@@ -133,10 +477,16 @@ def get_daily_close_prices_data(
 
 def get_factor_data(
     stock_symbols: Annotated[List[str], "股票代碼列表"],
-    factor_name: Annotated[str, "因子名稱"],
+    factor_name: Annotated[
+        Union[str, List[str]], "因子名稱", "asof 模式下可以是多個因子名稱的列表"
+    ],
     trading_days: Annotated[
         List[DatetimeIndex], "如果有指定日期，就會將資料的頻率從季頻擴充成此交易日頻率"
     ] = None,
+    asof: Annotated[bool, "是否使用 as-of 對應的方式擴充至交易日頻率"] = False,
+    wide: Annotated[
+        bool, "asof 模式下是否回傳寬表(索引是日期，欄位是股票代碼)"
+    ] = False,
 ) -> Annotated[
     pd.DataFrame,
     "有指定trading_days，回傳多索引資料表,索引是datetime和asset,欄位包含value(因子值)。",
@@ -147,9 +497,19 @@ def get_factor_data(
     從 FinLab 獲取指定股票清單(stock_symbols)的單個因子(factor_name)資料，
     並根據需求擴展至交易日頻率資料或是回傳原始季頻因子資料。
     如果沒有指定交易日(trading_days)，則回傳原始季頻因子資料。
+    如果指定 asof=True，則改用 get_factor_data_asof 擴充，並可一次取得多個因子。
     """
+    if asof:
+        return get_factor_data_asof(
+            stock_symbols=stock_symbols,
+            factor_names=factor_name,
+            trading_days=trading_days,
+            wide=wide,
+        )
     # 從 FinLab 獲取指定因子資料表，並藉由加上 .deadline() 將索引格式轉為財報截止日
-    factor_data = data.get(f"fundamental_features:{factor_name}").deadline()
+    factor_data = finlab_data_cache.get(
+        f"fundamental_features:{factor_name}"
+    ).deadline()
     # 如果指定了股票代碼列表，則篩選出特定股票的因子資料
     if stock_symbols:
         factor_data = factor_data[stock_symbols]
@@ -173,6 +533,82 @@ def get_factor_data(
     return factor_data
 
 
+def get_factor_data_asof(
+    stock_symbols: Annotated[List[str], "股票代碼列表"],
+    factor_names: Annotated[Union[str, List[str]], "因子名稱或多個因子名稱的列表"],
+    trading_days: Annotated[List[DatetimeIndex], "要擴充成的交易日列表"],
+    wide: Annotated[bool, "是否回傳寬表(索引是日期，欄位是股票代碼)"] = False,
+) -> Annotated[
+    pd.DataFrame,
+    "長表: 索引是datetime和asset，單一因子時欄位為value，多個因子時每個因子一個欄位。",
+    "寬表: 索引是datetime，單一因子時欄位是股票代碼，多個因子時欄位是(因子名稱, 股票代碼)。",
+]:
+    """
+    函式說明:
+    從 FinLab 獲取指定股票清單(stock_symbols)的一個或多個因子(factor_names)資料，
+    以 as-of 的方式將每個交易日對應到最近一次財報截止日的因子值，
+    多個因子會對齊到相同的日期和股票代碼，不需要合併、melt 或逐一股票向前填補。
+    """
+    if trading_days is None:
+        raise ValueError("asof 模式需要指定 trading_days。")
+    names = [factor_names] if isinstance(factor_names, str) else list(factor_names)
+    expanded_data = {}
+    for name in names:
+        # 從 FinLab 獲取指定因子資料表，並藉由加上 .deadline() 將索引格式轉為財報截止日
+        factor_data = finlab_data_cache.get(f"fundamental_features:{name}").deadline()
+        if stock_symbols:
+            factor_data = factor_data[stock_symbols]
+        expanded_data[name] = expand_factor_data_asof(
+            factor_data=factor_data, trading_days=trading_days
+        )
+    # 所有因子使用相同的日期與股票代碼索引
+    dates = expanded_data[names[0]].index
+    assets = pd.Index(
+        sorted(set().union(*[df.columns for df in expanded_data.values()]))
+    )
+    expanded_data = {
+        name: df.reindex(columns=assets) for name, df in expanded_data.items()
+    }
+    if wide:
+        if isinstance(factor_names, str):
+            return expanded_data[factor_names]
+        return pd.concat(expanded_data, axis=1)
+    # 將 (因子, 日期, 股票) 的矩陣轉成 (日期, 股票) 為索引、每個因子一個欄位的長表
+    values = np.stack([df.to_numpy() for df in expanded_data.values()], axis=-1)
+    return pd.DataFrame(
+        values.reshape(len(dates) * len(assets), len(names)),
+        index=pd.MultiIndex.from_product([dates, assets], names=["datetime", "asset"]),
+        columns=["value"] if isinstance(factor_names, str) else names,
+    )
+
+
+def expand_factor_data_asof(
+    factor_data: Annotated[
+        pd.DataFrame, "未擴充前的因子資料表", "索引是財報截止日，欄位是股票代碼"
+    ],
+    trading_days: Annotated[List[DatetimeIndex], "交易日的列表"],
+) -> Annotated[
+    pd.DataFrame, "擴充後的因子資料表", "索引是交易日(datetime)，欄位是股票代碼"
+]:
+    """
+    函式說明:
+    將因子資料(factor_data)擴展至交易日頻率(trading_days)資料，
+    以 searchsorted 找出每個交易日當天或之前最近一次的財報截止日，直接取出該期的因子值。
+    因子值先沿著財報期別向前填補，結果和 extend_factor_data 向前填補的方式一致。
+    """
+    factor_data = factor_data.sort_index(kind="stable").ffill()
+    trading_days = pd.DatetimeIndex(trading_days, name="datetime")
+    # 每個交易日對應到的財報列位置，-1 表示交易日早於第一份財報
+    report_idx = factor_data.index.searchsorted(trading_days, side="right") - 1
+    values = factor_data.to_numpy(dtype=float)
+    expanded_values = np.full((len(trading_days), values.shape[1]), np.nan)
+    has_report = report_idx >= 0
+    expanded_values[has_report] = values[report_idx[has_report]]
+    return pd.DataFrame(
+        expanded_values, index=trading_days, columns=factor_data.columns
+    )
+
+
 def extend_factor_data(
     factor_data: Annotated[
         pd.DataFrame,
@@ -346,6 +782,35 @@ def rank_stocks_by_factor(
 # )
 
 
+def rank_matrix_rows(
+    matrix: Annotated[np.ndarray, "因子值矩陣", "列是日期，欄是股票，遺失值為 NaN"],
+    ascending: Annotated[bool, "是否由小到大排名"] = True,
+) -> Annotated[np.ndarray, "排名矩陣", "與輸入相同形狀，遺失值的位置為 NaN"]:
+    """
+    函式說明:
+    對矩陣(matrix)的每一列一次計算排名，相同數值取平均排名，
+    結果和 pandas 的 rank(method="average") 相同。
+    """
+    values = matrix if ascending else -matrix
+    n_rows, n_cols = values.shape
+    # 每一列由小到大排序，NaN 會排在最後
+    order = np.argsort(values, axis=1, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    # 標記每一列中數值相同的區段，每一列的第一個位置一定是新的區段
+    new_group = np.ones((n_rows, n_cols), dtype=bool)
+    new_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    group_id = np.cumsum(new_group.ravel()) - 1
+    # 同一區段內的名次取平均，作為該區段的排名
+    positions = np.tile(np.arange(1, n_cols + 1, dtype=float), n_rows)
+    group_rank = np.bincount(group_id, weights=positions) / np.bincount(group_id)
+    ranks = np.empty((n_rows, n_cols))
+    np.put_along_axis(
+        ranks, order, group_rank[group_id].reshape(n_rows, n_cols), axis=1
+    )
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
 def calculate_weighted_rank(
     ranked_dfs: Annotated[
         List[pd.DataFrame],
@@ -366,40 +831,42 @@ def calculate_weighted_rank(
     函式說明:
     根據多個因子的加權排名計算最終的股票排名。
     len(ranked_dfs) 會等於 len(weights)
+    計算時將每個因子轉成共用日期和股票索引的矩陣，
+    以權重做矩陣乘積後，再對每一天(每一列)一次計算排名，不需要逐一合併資料表。
     """
     # 檢查 ranked_dfs 和 weights 的長度是否相同，否則拋出錯誤
     # 也就是有 n 個因子資料就需要有 n 個權重值
     if len(ranked_dfs) != len(weights):
         raise ValueError("ranked_dfs 和 weights 的長度必須相同。")
-    # 初始化 combined_ranks 為空的 DataFrame，用來儲存加權後的排名結果
-    combined_ranks = pd.DataFrame()
-    # 遍歷每個因子排名資料表及其對應的權重
+    # 取得所有因子資料表共用的日期索引與股票代碼索引
+    all_dates = pd.Index(
+        pd.concat([df["datetime"] for df in ranked_dfs]).unique()
+    ).sort_values()
+    all_assets = pd.Index(
+        pd.concat([df["asset"] for df in ranked_dfs]).unique()
+    ).sort_values()
+    # 將每個因子的排名放進 (因子, 日期, 股票) 的矩陣，缺少的資料以 NaN 表示
+    rank_matrices = np.full((len(ranked_dfs), len(all_dates), len(all_assets)), np.nan)
     for i, df in enumerate(ranked_dfs):
-        # 將每個因子的排名乘以對應的權重，並存入新的欄位 rank_i
-        df[f"rank_{i}"] = df[rank_column] * weights[i]
-        if combined_ranks.empty:
-            combined_ranks = df[["datetime", "asset", f"rank_{i}"]]
-        else:
-            # 根據 datetime 和 asset 這兩個欄位將資料進行合併
-            combined_ranks = pd.merge(
-                combined_ranks,
-                df[["datetime", "asset", f"rank_{i}"]],
-                on=["datetime", "asset"],
-                how="outer",
-            )
-    # 將合併後的資料中遺失值刪除
-    combined_ranks = combined_ranks.dropna()
-    # 最後，將所有乘上權重的排名進行每個股票每日的加總，得到最終的加權排名
-    combined_ranks["weighted"] = combined_ranks.filter(like="rank_").sum(axis=1)
-    # 根據加權總分計算最終的股票排名
-    # 使用 rank_stocks_by_factor 函數對加權排名結果進行排序
-    ranked_df = rank_stocks_by_factor(
-        factor_df=combined_ranks,
-        positive_corr=positive_corr,
-        rank_column="weighted",
-        rank_result_column="weighted_rank",
+        rank_matrices[
+            i,
+            all_dates.get_indexer(df["datetime"]),
+            all_assets.get_indexer(df["asset"]),
+        ] = df[rank_column].to_numpy(dtype=float)
+    # 以權重向量和排名矩陣相乘，得到每個股票每日的加權總分，
+    # 只要有任一因子缺少資料，加權總分就會是 NaN
+    weighted = np.einsum("f,fda->da", np.asarray(weights, dtype=float), rank_matrices)
+    # 根據加權總分計算每天的股票排名
+    weighted_rank = rank_matrix_rows(matrix=weighted, ascending=positive_corr)
+    # 只保留有加權總分的資料，並轉回 datetime、asset、weighted_rank 的長表格式
+    date_idx, asset_idx = np.nonzero(~np.isnan(weighted))
+    return pd.DataFrame(
+        {
+            "datetime": all_dates[date_idx],
+            "asset": all_assets[asset_idx],
+            "weighted_rank": weighted_rank[date_idx, asset_idx],
+        }
     )
-    return ranked_df[["datetime", "asset", "weighted_rank"]]
 
 
 # trading_days = pd.date_range(start="2020-01-01", end="2020-01-02", freq="D")
@@ -436,40 +903,155 @@ def get_daily_OHLCV_data(
     start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
     end_date: Annotated[str, "結束日期", "YYYY-MM-DD"],
     is_tw_stock: Annotated[bool, "stock_symbols 是否是台灣股票"] = True,
+    price_cache: Annotated[
+        Optional[PriceCache], "本地價量資料快取，None 表示直接從 YFinance 下載"
+    ] = None,
+    batch_size: Annotated[
+        Optional[int], "批次模式下每批下載的股票數量，None 表示逐檔下載"
+    ] = None,
+    max_workers: Annotated[
+        Optional[int],
+        "批次模式下同時下載的批次數量上限，None 表示依序下載",
+        "預設的 YFinance 下載函式無法同時下載多個批次，只適用於可平行呼叫的 batch_fetcher",
+    ] = None,
+    batch_fetcher: Annotated[
+        Callable[[List[str], str, str], pd.DataFrame],
+        "批次模式下載多檔股票價量資料的函式",
+    ] = download_ohlcv_batch_from_yfinance,
 ) -> Annotated[pd.DataFrame, "價量的資料集", "欄位名稱包含股票代碼、日期、開高低收量"]:
     """
     函式說明:
     取得指定股票(stock_symbols)在給定日期範圍內(start_date~end_date)的每日價量資料。
+    如果有指定價量資料快取(price_cache)，則從快取讀取，只下載快取中缺少的日期區間。
+    如果有指定批次大小(batch_size)，則改用批次模式，將股票分批交給 batch_fetcher 下載。
+    預設的 batch_fetcher 在每個批次內平行下載多檔股票，批次之間依序執行；
+    自訂的 batch_fetcher 可以平行呼叫時，可指定 max_workers 同時下載多個批次。
     """
+    if price_cache is not None and batch_size:
+        raise ValueError("price_cache 和 batch_size 不能同時指定。")
     # 如果是台灣股票，則在股票代碼後加上 ".TW"
     if is_tw_stock:
         stock_symbols = [
             f"{symbol}.TW" if ".TW" not in symbol else symbol
             for symbol in stock_symbols
         ]
+    if batch_size:
+        return reshape_wide_OHLCV_data(
+            wide_data=download_ohlcv_in_batches(
+                stock_symbols=stock_symbols,
+                start_date=start_date,
+                end_date=end_date,
+                batch_size=batch_size,
+                max_workers=max_workers,
+                batch_fetcher=batch_fetcher,
+            ),
+            stock_symbols=stock_symbols,
+        )
+    # 有指定快取時從快取讀取，否則直接從 YFinance 下載
+    download = (
+        price_cache.get if price_cache is not None else download_ohlcv_from_yfinance
+    )
     # 使用 pd.concat 合併多隻股票的數據
     all_stock_data = pd.concat(
         [
-            # 從 YFinance 下載每隻股票在指定日期範圍內的數據
-            pd.DataFrame(yf.download(symbol, start=start_date, end=end_date)).droplevel(
-                "Ticker", axis=1
-            )
+            # 取得每隻股票在指定日期範圍內的數據
+            download(symbol, start_date, end_date)
             # 新增一個 "asset" 的欄位，用來儲存股票代碼
             .assign(asset=symbol.split(".")[0])
-            # 重設索引並將日期欄位名稱從 Date 改為 datetime
-            .reset_index().rename(columns={"Date": "datetime"})
+            # 重設索引，日期欄位名稱為 datetime
+            .reset_index()
             # 使用向前填補的方法處理資料中的遺失值
             .ffill()
             for symbol in stock_symbols
         ]
     )
-    all_stock_data.columns.name = None
     all_stock_data = all_stock_data[
         ["Open", "High", "Low", "Close", "Volume", "datetime", "asset"]
     ]
     return all_stock_data.reset_index(drop=True)
 
 
+def download_ohlcv_in_batches(
+    stock_symbols: Annotated[List[str], "股票代碼列表(含交易所後綴)"],
+    start_date: Annotated[str, "起始日期", "YYYY-MM-DD"],
+    end_date: Annotated[str, "結束日期", "YYYY-MM-DD"],
+    batch_size: Annotated[int, "每批下載的股票數量"],
+    max_workers: Annotated[
+        Optional[int], "同時下載的批次數量上限，None 表示依序下載"
+    ] = None,
+    batch_fetcher: Annotated[
+        Callable[[List[str], str, str], pd.DataFrame], "下載多檔股票價量資料的函式"
+    ] = download_ohlcv_batch_from_yfinance,
+) -> Annotated[
+    pd.DataFrame,
+    "所有股票的價量資料表",
+    "索引是日期，欄位是 (Price, Ticker) 兩層欄位",
+]:
+    """
+    函式說明:
+    將股票代碼列表(stock_symbols)切成每批 batch_size 檔，依序呼叫 batch_fetcher 下載，
+    最後依日期合併成一張寬表。
+    只有 batch_fetcher 可以平行呼叫時，才指定 max_workers 以多個執行緒同時下載多個批次；
+    預設的 download_ohlcv_batch_from_yfinance 會以 lock 保護 yf.download，指定也不會更快。
+    """
+    batches = [
+        stock_symbols[i : i + batch_size]
+        for i in range(0, len(stock_symbols), batch_size)
+    ]
+    if max_workers is None or max_workers <= 1:
+        batch_data = [batch_fetcher(batch, start_date, end_date) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch_data = list(
+                executor.map(
+                    lambda batch: batch_fetcher(batch, start_date, end_date), batches
+                )
+            )
+    return pd.concat(batch_data, axis=1).sort_index()
+
+
+def reshape_wide_OHLCV_data(
+    wide_data: Annotated[
+        pd.DataFrame,
+        "多檔股票的價量資料表",
+        "索引是日期，欄位是 (Price, Ticker) 兩層欄位",
+    ],
+    stock_symbols: Annotated[List[str], "股票代碼列表(含交易所後綴)"],
+) -> Annotated[pd.DataFrame, "價量的資料集", "欄位名稱包含股票代碼、日期、開高低收量"]:
+    """
+    函式說明:
+    將批次下載的寬表(wide_data)一次轉換成與逐檔下載相同格式的長表，
+    欄位為 [Open, High, Low, Close, Volume, datetime, asset]，
+    資料順序依照股票代碼列表(stock_symbols)排列，每檔股票內依日期排序。
+    """
+    wide_data = wide_data.reindex(
+        columns=pd.MultiIndex.from_product([OHLCV_COLUMNS, stock_symbols])
+    )
+    n_dates, n_assets = len(wide_data), len(stock_symbols)
+    # 當天有任一價量欄位的股票才保留，和逐檔下載時只有交易日的資料一致
+    has_bar = (
+        wide_data.notna()
+        .to_numpy()
+        .reshape(n_dates, len(OHLCV_COLUMNS), n_assets)
+        .any(axis=1)
+    )
+    # 每檔股票各自向前填補遺失值後，轉成 (股票, 日期, 價量欄位) 再攤平成長表
+    values = (
+        wide_data.ffill()
+        .to_numpy(dtype=float)
+        .reshape(n_dates, len(OHLCV_COLUMNS), n_assets)
+        .transpose(2, 0, 1)
+        .reshape(n_assets * n_dates, len(OHLCV_COLUMNS))
+    )
+    keep = has_bar.T.ravel()
+    all_stock_data = pd.DataFrame(values[keep], columns=OHLCV_COLUMNS)
+    all_stock_data["datetime"] = np.tile(wide_data.index.to_numpy(), n_assets)[keep]
+    all_stock_data["asset"] = np.repeat(
+        [symbol.split(".")[0] for symbol in stock_symbols], n_dates
+    )[keep]
+    return all_stock_data
+
+
 # print(
 #     get_daily_OHLCV_data(
 #         stock_symbols=["2330", "1101"],
@@ -495,11 +1077,7 @@ def list_factors_by_type(
     函式說明:
     根據資料型態列出所有相關的因子名稱。
     """
-    return list(
-        data.search(keyword=data_type, display_info=["name", "description", "items"])[
-            0
-        ]["items"]
-    )
+    return finlab_data_cache.get(f"search:{data_type}")["items"].tolist()
 
 
 # print(list_factors_by_type(data_type="fundamental_features"))
@@ -0,0 +1,187 @@
+# %%
+# 載入需要的套件
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+
+# 載入 Chapter2/utils/ 資料夾中的 Alpha 因子與增量計算模組
+import Chapter2.utils.Alpha_code_1 as Alpha_code_1  # noqa: E402
+import Chapter2.utils.alpha_incremental as alpha_incremental  # noqa: E402
+import Chapter2.utils.alphas191 as alphas191  # noqa: E402
+
+# %%
+"""
+備註:
+這個檔案用來檢查 Alpha 因子的增量計算結果和完整重新計算是否一致，
+並比較兩者每新增一天資料所需的時間。
+資料是多檔股票的寬表(日期 x (欄位, 股票))，與 Alphas.get_stocks_data 和
+Alpha_code_1.get_alpha_panel 使用的格式相同，排名(rank)等橫截面運算會跨股票計算。
+完整重新計算的時間會隨著歷史資料長度增加，增量計算只和滾動視窗長度與股票數量有關。
+"""
+
+# 產生 200 檔股票、760 個交易日的隨機股票資料，並加入少量成交量遺失值
+rng = np.random.default_rng(seed=0)
+n_days, n_assets = 760, 200
+dates = pd.bdate_range("2020-01-01", periods=n_days)
+assets = [f"{i:06d}" for i in range(n_assets)]
+shape = (n_days, n_assets)
+close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=shape), axis=0))
+fields = {
+    "open": close * (1 + rng.normal(0, 0.01, size=shape)),
+    "close": close,
+    "high": close * (1 + np.abs(rng.normal(0, 0.01, size=shape))),
+    "low": close * (1 - np.abs(rng.normal(0, 0.01, size=shape))),
+    "volume": rng.integers(1000, 100000, size=shape).astype(float),
+}
+fields["volume"][rng.random(shape) < 0.01] = np.nan
+# 指數資料每檔股票都相同
+fields["benchmark_open"] = np.repeat(10 + rng.random((n_days, 1)), n_assets, axis=1)
+fields["benchmark_close"] = np.repeat(10 + rng.random((n_days, 1)), n_assets, axis=1)
+
+
+def to_panel(fields, names):
+    # 轉成 (欄位, 股票) 兩層欄位的寬表
+    return pd.concat(
+        {
+            new_name: pd.DataFrame(fields[name], index=dates, columns=assets)
+            for name, new_name in names.items()
+        },
+        axis=1,
+    )
+
+
+# Alphas191 使用 Alphas.get_stocks_data 的欄位名稱
+data_191 = to_panel(fields, {name: name for name in fields})
+alpha_methods = alphas191.Alphas191.get_alpha_methods(alphas191.Alphas191)
+# Alpha_code_1 使用 S_DQ_ 開頭的欄位名稱
+data_101 = to_panel(
+    fields,
+    {
+        "open": "S_DQ_OPEN",
+        "high": "S_DQ_HIGH",
+        "low": "S_DQ_LOW",
+        "close": "S_DQ_CLOSE",
+        "volume": "S_DQ_VOLUME",
+    },
+)
+
+# 以前 750 天建立檢查點，再逐日新增 10 天的資料
+history_days = 750
+new_days = 10
+
+
+def reload(checkpoint):
+    # 存檔並重新讀取，確認檢查點可以跨次執行使用
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "checkpoint.pkl")
+        checkpoint.save(path)
+        return alpha_incremental.IncrementalAlphas.load(path)
+
+
+def assert_same(incremental, full, name):
+    # 增量計算與完整計算以相同的順序累加，只允許極小的浮點數誤差
+    np.testing.assert_allclose(
+        np.asarray(incremental, dtype=float),
+        np.asarray(full, dtype=float),
+        rtol=1e-7,
+        atol=1e-9,
+        err_msg=name,
+    )
+
+
+# %%
+def benchmark_alphas191():
+    """
+    函式說明:
+    以 Alphas191 的多檔股票寬表比較增量計算與完整重新計算，回傳兩種方式每天所需的時間。
+    """
+    start_time = time.perf_counter()
+    checkpoint, _, _ = alphas191.Alphas191.start_incremental(
+        data_191.iloc[:history_days], alpha_methods
+    )
+    start_seconds = time.perf_counter() - start_time
+    checkpoint = reload(checkpoint)
+
+    # 增量計算：每天只計算新的一列
+    incremental = {method: [] for method in alpha_methods}
+    start_time = time.perf_counter()
+    for day in range(history_days, history_days + new_days):
+        results, _ = checkpoint.append(data_191.iloc[day : day + 1])
+        for method, value in results.items():
+            incremental[method].append(value)
+    incremental_seconds = (time.perf_counter() - start_time) / new_days
+
+    # 完整重新計算：每天以所有歷史資料重新計算一次
+    full_data = data_191.iloc[: history_days + new_days]
+    start_time = time.perf_counter()
+    full_results, _ = alphas191.Alphas191.evaluate_alphas(full_data, alpha_methods)
+    full_seconds = time.perf_counter() - start_time
+
+    for method, values in incremental.items():
+        if method in full_results and values:
+            assert_same(
+                pd.concat(values), full_results[method].iloc[history_days:], method
+            )
+    return {
+        "alphas": "Alphas191",
+        "incremental_alphas": len(checkpoint.roots),
+        "full_recompute_alphas": len(checkpoint.eager_names),
+        "pandas_fallback_nodes": checkpoint.fallback_nodes(),
+        "start_seconds": start_seconds,
+        "full_recompute_seconds_per_day": full_seconds,
+        "incremental_seconds_per_day": incremental_seconds,
+        "speedup": full_seconds / incremental_seconds,
+    }
+
+
+def benchmark_alpha101():
+    """
+    函式說明:
+    以 Alpha_code_1 的 get_alpha_panel 比較增量計算與完整重新計算，回傳兩種方式每天所需的時間。
+    """
+    start_time = time.perf_counter()
+    checkpoint, _ = Alpha_code_1.start_alpha_panel_incremental(
+        data_101.iloc[:history_days]
+    )
+    start_seconds = time.perf_counter() - start_time
+    checkpoint = reload(checkpoint)
+
+    incremental = []
+    start_time = time.perf_counter()
+    for day in range(history_days, history_days + new_days):
+        incremental.append(
+            Alpha_code_1.append_alpha_panel(checkpoint, data_101.iloc[day : day + 1])
+        )
+    incremental_seconds = (time.perf_counter() - start_time) / new_days
+
+    start_time = time.perf_counter()
+    full_results = Alpha_code_1.get_alpha_panel(
+        data_101.iloc[: history_days + new_days]
+    )
+    full_seconds = time.perf_counter() - start_time
+
+    incremental = pd.concat(incremental)
+    assert_same(incremental, full_results.loc[incremental.index], "Alpha_code_1")
+    return {
+        "alphas": "Alpha_code_1",
+        "incremental_alphas": len(checkpoint.roots),
+        "full_recompute_alphas": len(checkpoint.eager_names),
+        "pandas_fallback_nodes": checkpoint.fallback_nodes(),
+        "start_seconds": start_seconds,
+        "full_recompute_seconds_per_day": full_seconds,
+        "incremental_seconds_per_day": incremental_seconds,
+        "speedup": full_seconds / incremental_seconds,
+    }
+
+
+# %%
+# 以 spawn 啟動的子行程不會執行這裡的程式
+if __name__ == "__main__":
+    print(pd.DataFrame([benchmark_alphas191(), benchmark_alpha101()]).to_string())
@@ -0,0 +1,181 @@
+# %%
+# 載入需要的套件
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+
+# 載入 Chapter2/utils/ 資料夾中的 Alpha_code_1.py 和 alphas191.py 模組
+import Chapter2.utils.Alpha_code_1 as Alpha_code_1  # noqa: E402
+import Chapter2.utils.alphas191 as alphas191  # noqa: E402
+
+# %%
+"""
+備註:
+這個檔案用來檢查 Alpha 運算子的向量化版本和原本 rolling().apply() 版本的結果是否一致，
+並比較兩者的執行時間。原本的版本每個視窗都會呼叫一次 Python 函式，
+向量化版本則是以 sliding_window_view 一次計算所有視窗。
+"""
+
+# 產生 500 個交易日 x 100 檔股票的隨機價格資料，並加入少量遺失值
+rng = np.random.default_rng(seed=0)
+panel = pd.DataFrame(
+    100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(500, 100)), axis=0)),
+    index=pd.bdate_range("2020-01-01", periods=500),
+)
+panel[rng.random(panel.shape) < 0.01] = np.nan
+# 加入重複的數值，用來檢查排名遇到相同數值時的處理方式
+panel.iloc[:, :10] = panel.iloc[:, :10].round(0)
+condition = panel.diff() > 0
+# WorldQuant 101 的運算子是針對單一股票計算，使用一條較長的價格序列
+stock = pd.Series(
+    100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=20000))),
+    index=pd.date_range("1950-01-01", periods=20000),
+    name="close",
+)
+stock[rng.random(len(stock)) < 0.01] = np.nan
+
+
+# %%
+# 原本使用 rolling().apply() 的 Alpha191 運算子，作為比對的基準
+def reference_wma(sr, window):
+    weights = np.power(0.9, np.array(range(window - 1, -1, -1)))
+    return sr.rolling(window).apply(lambda x: np.sum(weights * x) / np.sum(weights))
+
+
+def reference_decaylinear(sr, window):
+    weights = np.array(range(1, window + 1))
+    return sr.rolling(window).apply(lambda x: np.sum(weights * x) / np.sum(weights))
+
+
+alphas191_cases = {
+    "Tsrank": (
+        lambda: alphas191.Tsrank(panel, 20),
+        lambda: panel.rolling(20).apply(lambda x: rankdata(x)[-1]),
+    ),
+    "Prod": (
+        lambda: alphas191.Prod(panel / 100, 10),
+        lambda: (panel / 100).rolling(10).apply(lambda x: np.prod(x)),
+    ),
+    "Decaylinear": (
+        lambda: alphas191.Decaylinear(panel, 12),
+        lambda: reference_decaylinear(panel, 12),
+    ),
+    "Wma": (
+        lambda: alphas191.Wma(panel, 12),
+        lambda: reference_wma(panel, 12),
+    ),
+    "Lowday": (
+        lambda: alphas191.Lowday(panel, 20),
+        lambda: panel.rolling(20).apply(lambda x: len(x) - x.values.argmin()),
+    ),
+    "Highday": (
+        lambda: alphas191.Highday(panel, 20),
+        lambda: panel.rolling(20).apply(lambda x: len(x) - x.values.argmax()),
+    ),
+    "Regbeta": (
+        lambda: alphas191.Regbeta(panel, alphas191.Sequence(6)),
+        lambda: panel.rolling(6).apply(
+            lambda y: np.polyfit(alphas191.Sequence(6), y, deg=1)[0]
+        ),
+    ),
+    "Count": (
+        lambda: alphas191.Count(condition, 20),
+        lambda: condition.rolling(20).apply(lambda x: x.sum()),
+    ),
+    "Returns": (
+        lambda: alphas191.Returns(panel),
+        lambda: panel.rolling(2).apply(lambda x: x.iloc[-1] / x.iloc[0]) - 1,
+    ),
+}
+
+
+# %%
+# 原本使用 Python 迴圈的 WorldQuant 101 decay_linear，作為比對的基準
+def reference_decay_linear(df, period=10):
+    df = df.ffill().fillna(value=0)
+    na_lwma = np.zeros_like(df)
+    na_lwma[:period, :] = df.iloc[:period, :]
+    na_series = df.values
+    divisor = period * (period + 1) / 2
+    y = (np.arange(period) + 1) * 1.0 / divisor
+    for row in range(period - 1, df.shape[0]):
+        x = na_series[row - period + 1 : row + 1, :]
+        na_lwma[row, :] = np.dot(x.T, y)
+    return pd.DataFrame(na_lwma, index=df.index, columns=["CLOSE"])
+
+
+worldquant101_cases = {
+    "ts_rank": (
+        lambda: Alpha_code_1.ts_rank(stock, 10),
+        lambda: stock.rolling(10).apply(Alpha_code_1.rolling_rank),
+    ),
+    "product": (
+        lambda: Alpha_code_1.product(stock / 100, 10),
+        lambda: (stock / 100).rolling(10).apply(Alpha_code_1.rolling_prod),
+    ),
+    "ts_argmax": (
+        lambda: Alpha_code_1.ts_argmax(stock, 10),
+        lambda: stock.rolling(10).apply(np.argmax) + 1,
+    ),
+    "ts_argmin": (
+        lambda: Alpha_code_1.ts_argmin(stock, 10),
+        lambda: stock.rolling(10).apply(np.argmin) + 1,
+    ),
+    "decay_linear": (
+        lambda: Alpha_code_1.decay_linear(stock.to_frame(), 10),
+        lambda: reference_decay_linear(stock.to_frame(), 10),
+    ),
+}
+
+
+# %%
+def run_cases(cases):
+    """
+    函式說明:
+    逐一執行每個運算子的向量化版本與原本版本，檢查結果是否在容許誤差內一致，
+    並回傳兩者的執行時間比較表。
+    """
+    results = []
+    for name, (fast_func, reference_func) in cases.items():
+        start_time = time.perf_counter()
+        fast_result = fast_func()
+        fast_seconds = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        reference_result = reference_func()
+        reference_seconds = time.perf_counter() - start_time
+        # 遺失值的位置必須相同，其餘數值在容許誤差內一致
+        np.testing.assert_allclose(
+            np.asarray(fast_result, dtype=float),
+            np.asarray(reference_result, dtype=float),
+            rtol=1e-8,
+            atol=1e-10,
+            err_msg=name,
+        )
+        results.append(
+            {
+                "operator": name,
+                "rolling_apply_seconds": reference_seconds,
+                "vectorized_seconds": fast_seconds,
+                "speedup": reference_seconds / fast_seconds,
+            }
+        )
+    return pd.DataFrame(results).set_index("operator")
+
+
+print(run_cases(alphas191_cases))
+
+# %%
+print(run_cases(worldquant101_cases))
+
+# %%
+# 檢查 decay_linear 不會修改傳入的資料表(原本的版本會就地向前填補遺失值)
+stock_frame = stock.to_frame()
+Alpha_code_1.decay_linear(stock_frame, 10)
+assert stock_frame["close"].isnull().sum() == stock.isnull().sum()
@@ -58,19 +58,23 @@ data["benchmark_close"] = benchmark_data["Close"]
 data = data.ffill().dropna()
 
 # %%
-# 初始化 Alphas191 類別，並傳入台泥的股票資料
-alpha_2330 = alphas191.Alphas191(data)
 # 取得所有 Alpha 方法的列表
 alpha_methods = alphas.Alphas.get_alpha_methods(alphas191.Alphas191)
 alpha_dict = {}  # 儲存成功執行的 Alpha 因子結果
 error_method = []  # 儲存執行失敗的 Alpha 方法名稱
 success_method = []  # 儲存執行成功的 Alpha 方法名稱
 
-# 逐一執行所有 Alpha 方法，並記錄執行成功或失敗的情況
-for method in alpha_methods:
+# 傳入台泥的股票資料，一次計算所有 Alpha 方法。
+# 多個 Alpha 方法共用的中間結果(例如 Delay(close, 1)、Mean(volume, 20))只會計算一次
+alpha_results, alpha_errors = alphas191.Alphas191.evaluate_alphas(data, alpha_methods)
+for method, e in alpha_errors.items():
+    # 如果執行失敗，將失敗的 Alpha 方法名稱加入 error_method 列表，並顯示錯誤訊息
+    error_method.append(method)
+    print(f"Error in method {method}: {e}")
+
+# 逐一整理每個 Alpha 方法的結果，並記錄執行成功或失敗的情況
+for method, df in alpha_results.items():
     try:
-        # 執行每個 Alpha 方法，並將結果存入 DataFrame
-        df = getattr(alpha_2330, method)()
         # 根據產生的欄位數量，為結果設定新欄位名稱
         new_columns = [f"{method}_{i+1}" for i in range(int(df.shape[1]))]
         df.columns = new_columns
@@ -79,7 +83,6 @@ for method in alpha_methods:
         # 將成功的 Alpha 方法名稱加入 success_method 列表
         success_method.append(method)
     except Exception as e:
-        # 如果執行失敗，將失敗的 Alpha 方法名稱加入 error_method 列表，並顯示錯誤訊息
         error_method.append(method)
         print(f"Error in method {method}: {e}")
 
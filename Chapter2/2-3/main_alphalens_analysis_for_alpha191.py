@@ -11,8 +11,8 @@ utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(utils_folder_path)
 
 import Chapter1.utils as chap1_utils  # noqa: E402
-import Chapter2.utils.alphas as alphas  # noqa: E402
 import Chapter2.utils.alphas191 as alphas191  # noqa: E402
+import Chapter2.utils.factor_screening as factor_screening  # noqa: E402
 
 chap1_utils.finlab_login()
 
@@ -74,21 +74,20 @@ for stock in top_N_stocks:
         )
         data = pd.merge(left=data, right=benchmark_data, how="inner", on="datetime")
         data = data.ffill().dropna()
-        alphas_data = data.copy()
-        alphas_inst = alphas191.Alphas191(alphas_data)
-        # 取得所有 Alpha 方法
-        alpha_methods = alphas.Alphas.get_alpha_methods(alphas191.Alphas191)
-        for method in alpha_methods:
+        # 一次計算所有 Alpha 方法，多個方法共用的中間結果只會計算一次
+        alpha_results, alpha_errors = alphas191.Alphas191.evaluate_alphas(data)
+        for method, e in alpha_errors.items():
+            print(f"Error in method {method}: {e}")
+        alpha_frames = [data]
+        for method, df in alpha_results.items():
             try:
-                # 執行每個 Alpha 方法，並將結果儲存到 df
-                df = getattr(alphas_inst, method)()
                 # 根據產生的欄位數量，修改 df 的欄位名稱
                 new_columns = [f"{method}_{i+1}" for i in range(int(df.shape[1]))]
                 df.columns = new_columns
-                alphas_data = pd.concat([alphas_data, df], axis=1)
+                alpha_frames.append(df)
             except Exception as e:
                 print(f"Error in method {method}: {e}")
-        alphas_data_dict[stock] = alphas_data
+        alphas_data_dict[stock] = pd.concat(alpha_frames, axis=1)
         all_stocks_list.append(stock)
     except:  # noqa: E722
         error_stocks_list.append(stock)
@@ -128,6 +127,8 @@ all_alphas = [
     for item in all_alphas_data.columns
     if item
     not in [
+        "datetime",
+        "asset",
         "open",
         "high",
         "low",
@@ -142,9 +143,21 @@ all_alphas = [
 ]
 
 # %%
-# 使用 Alphalens 進行因子分析。
+# 一次篩選所有因子：未來報酬只計算一次，再以矩陣運算計算每個因子的
+# Spearman IC、不同持有期間的 IC(IC 衰減)、分組報酬價差與換手率，
+# 並依 1 日持有期間的 IC IR(絕對值)由大到小排序
+factor_summary = factor_screening.screen_factors(
+    factor_data=all_alphas_data.set_index(["datetime", "asset"])[all_alphas],
+    prices=close_price_data,
+    periods=(1, 5, 10),
+)
+print(factor_summary.head(20))
+
+# %%
+# 只對排名前 top_k 的因子使用 Alphalens 畫完整的報表。
+top_k = 10
 alphas_method_list = []
-for alphas_method in all_alphas:
+for alphas_method in factor_summary.index[:top_k]:
     try:
         alphas_data = all_alphas_data[["datetime", "asset", alphas_method]]
         alphas_data = alphas_data.ffill().dropna()
@@ -159,7 +172,7 @@ for alphas_method in all_alphas:
         print(f"alphas_method: {alphas_method}")
         alphalens.tears.create_returns_tear_sheet(alphalens_factor_data)
         alphas_method_list.append(alphas_method)
-    except:  # noqa: E722
-        pass
+    except Exception as e:
+        print(f"Error in method {alphas_method}: {e}")
 
 # %%
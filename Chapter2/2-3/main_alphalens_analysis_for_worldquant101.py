@@ -5,13 +5,13 @@ import sys
 
 import alphalens
 import pandas as pd
-from tqdm import tqdm
 
 utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(utils_folder_path)
 
 import Chapter1.utils as chap1_utils  # noqa: E402
 import Chapter2.utils.Alpha_code_1 as Alpha_code_1  # noqa: E402
+import Chapter2.utils.factor_screening as factor_screening  # noqa: E402
 
 chap1_utils.finlab_login()
 
@@ -34,34 +34,26 @@ all_stock_data = chap1_utils.get_daily_OHLCV_data(
     end_date=analysis_period_end_date,
 )
 
-all_stocks_list = []
-error_stocks_list = []
-alphas_data_dict = {}
-# 逐一處理每支股票
-for stock in tqdm(top_N_stocks, desc="Processing stocks"):
-    try:
-        # 取得單支股票 OHLCV 資料
-        data = all_stock_data[all_stock_data["asset"] == stock]
-        data = data.rename(
-            columns={
-                "Open": "S_DQ_OPEN",
-                "High": "S_DQ_HIGH",
-                "Low": "S_DQ_LOW",
-                "Close": "S_DQ_CLOSE",
-                "Volume": "S_DQ_VOLUME",
-            }
-        )
-        # 使用 Alpha_code_1 模組中的 get_alpha 函數來生成 Alpha 因子
-        alphas_data_dict[stock] = Alpha_code_1.get_alpha(data)
-        all_stocks_list.append(stock)
-    except:
-        error_stocks_list.append(stock)
-
-# %%
-# 將每支股票的 Alpha 因子結果合併成一個大的 DataFrame
-all_alphas_data = pd.DataFrame()
-for stock, df in alphas_data_dict.items():
-    all_alphas_data = pd.concat([all_alphas_data, df], ignore_index=True)
+# 將長格式資料轉為寬格式：索引為日期，欄位為 (OHLCV 欄位, 股票代碼)，
+# 並重新命名欄位名稱，以符合使用 Alpha_code_1 模組要求的格式
+panel_data = all_stock_data.pivot(
+    index="datetime",
+    columns="asset",
+    values=["Open", "High", "Low", "Close", "Volume"],
+).rename(
+    columns={
+        "Open": "S_DQ_OPEN",
+        "High": "S_DQ_HIGH",
+        "Low": "S_DQ_LOW",
+        "Close": "S_DQ_CLOSE",
+        "Volume": "S_DQ_VOLUME",
+    },
+    level=0,
+)
+# 使用 Alpha_code_1 模組中的 get_alpha_panel 函數一次計算所有股票的 Alpha 因子，
+# 其中的 rank 會在每個交易日對所有股票做橫截面排名。
+# 回傳的資料表索引為 (datetime, asset)，每個 Alpha 因子一個欄位
+all_alphas_data = Alpha_code_1.get_alpha_panel(panel_data)
 
 
 # %%
@@ -76,9 +68,8 @@ keeping_columns = [col for col in keeping_columns if zero_ratios[col] < 0.1]
 keeping_columns = [
     col for col in keeping_columns if pd.api.types.is_float_dtype(all_alphas_data[col])
 ]
-keeping_columns += ["datetime", "asset"]
 all_alphas_data = all_alphas_data[keeping_columns]
-print(f"剩下 {len(keeping_columns) - 2} 個因子")
+print(f"剩下 {len(keeping_columns)} 個因子")
 
 # %%
 # 獲取指定股票代碼列表在給定日期範圍內的每日收盤價資料。
@@ -88,27 +79,26 @@ close_price_data = chap1_utils.get_daily_close_prices_data(
     end_date=analysis_period_end_date,
 )
 # 儲存所有 alpha 因子欄位名稱
-all_alphas = [
-    item
-    for item in all_alphas_data.columns
-    if item
-    not in [
-        "S_DQ_OPEN",
-        "S_DQ_HIGH",
-        "S_DQ_LOW",
-        "S_DQ_CLOSE",
-        "S_DQ_PCTCHANGE",
-        "S_DQ_AMOUNT",
-    ]
-]
+all_alphas = list(all_alphas_data.columns)
+
+# %%
+# 一次篩選所有因子：未來報酬只計算一次，再以矩陣運算計算每個因子的
+# Spearman IC、不同持有期間的 IC(IC 衰減)、分組報酬價差與換手率，
+# 並依 1 日持有期間的 IC IR(絕對值)由大到小排序
+factor_summary = factor_screening.screen_factors(
+    factor_data=all_alphas_data,
+    prices=close_price_data,
+    periods=(1, 5, 10),
+)
+print(factor_summary.head(20))
 
 # %%
-# 使用 Alphalens 進行因子分析。
+# 只對排名前 top_k 的因子使用 Alphalens 畫完整的報表。
+top_k = 10
 alphas_method_list = []
-for alphas_method in all_alphas:
+for alphas_method in factor_summary.index[:top_k]:
     try:
-        alphas_data = all_alphas_data[["datetime", "asset", alphas_method]]
-        alphas_data = alphas_data.set_index(["datetime", "asset"])
+        alphas_data = all_alphas_data[[alphas_method]]
         alphalens_factor_data = alphalens.utils.get_clean_factor_and_forward_returns(
             factor=alphas_data,
             prices=close_price_data,
@@ -117,5 +107,5 @@ for alphas_method in all_alphas:
         print(f"alphas_method: {alphas_method}")
         alphalens.tears.create_returns_tear_sheet(alphalens_factor_data)
         alphas_method_list.append(alphas_method)
-    except:
-        pass
+    except Exception as e:
+        print(f"Error in method {alphas_method}: {e}")
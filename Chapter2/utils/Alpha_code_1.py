@@ -5,8 +5,15 @@ import pandas as pd
 from numpy import abs, log, sign
 from scipy.stats import rankdata
 
+from Chapter2.utils import alpha_incremental, rolling_ops
+from Chapter2.utils.alpha_graph import lazy_operator
+
 
 # region Auxiliary functions
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    running=lambda df, window=10: rolling_ops.RunningSum(window),
+)
 def ts_sum(df, window=10):
     """
     Wrapper function to estimate rolling sum.
@@ -18,6 +25,10 @@ def ts_sum(df, window=10):
     return df.rolling(window).sum()
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    running=lambda df, window=10: rolling_ops.RunningMean(window),
+)
 def sma(df, window=10):
     """
     Wrapper function to estimate SMA.
@@ -28,6 +39,10 @@ def sma(df, window=10):
     return df.rolling(window).mean()
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    running=lambda df, window=10: rolling_ops.RunningStd(window),
+)
 def stddev(df, window=10):
     """
     Wrapper function to estimate rolling standard deviation.
@@ -38,6 +53,10 @@ def stddev(df, window=10):
     return df.rolling(window).std()
 
 
+@lazy_operator(
+    lookback=lambda x, y, window=10: window,
+    running=lambda x, y, window=10: rolling_ops.RunningCorr(window),
+)
 def correlation(x, y, window=10):
     """
     Wrapper function to estimate rolling corelations.
@@ -48,6 +67,10 @@ def correlation(x, y, window=10):
     return x.rolling(window).corr(y)
 
 
+@lazy_operator(
+    lookback=lambda x, y, window=10: window,
+    running=lambda x, y, window=10: rolling_ops.RunningCov(window),
+)
 def covariance(x, y, window=10):
     """
     Wrapper function to estimate rolling covariance.
@@ -67,6 +90,10 @@ def rolling_rank(na):
     return rankdata(na)[-1]
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_rank(df),
+)
 def ts_rank(df, window=10):
     """
     Wrapper function to estimate rolling rank.
@@ -74,7 +101,7 @@ def ts_rank(df, window=10):
     :param window: the rolling window.
     :return: a pandas DataFrame with the time-series rank over the past window days.
     """
-    return df.rolling(window).apply(rolling_rank)
+    return rolling_ops.ts_rank_last(df, window)
 
 
 def rolling_prod(na):
@@ -86,6 +113,10 @@ def rolling_prod(na):
     return np.prod(na)
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_prod(df),
+)
 def product(df, window=10):
     """
     Wrapper function to estimate rolling product.
@@ -93,9 +124,13 @@ def product(df, window=10):
     :param window: the rolling window.
     :return: a pandas DataFrame with the time-series product over the past 'window' days.
     """
-    return df.rolling(window).apply(rolling_prod)
+    return rolling_ops.ts_prod(df, window)
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_min(df),
+)
 def ts_min(df, window=10):
     """
     Wrapper function to estimate rolling min.
@@ -106,6 +141,10 @@ def ts_min(df, window=10):
     return df.rolling(window).min()
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_max(df),
+)
 def ts_max(df, window=10):
     """
     Wrapper function to estimate rolling min.
@@ -116,6 +155,10 @@ def ts_max(df, window=10):
     return df.rolling(window).max()
 
 
+@lazy_operator(
+    lookback=lambda df, period=1: int(period) + 1,
+    step=lambda df, period=1: df[-1] - df[0],
+)
 def delta(df, period=1):
     """
     Wrapper function to estimate difference.
@@ -123,9 +166,13 @@ def delta(df, period=1):
     :param period: the difference grade.
     :return: a pandas DataFrame with today’s value minus the value 'period' days ago.
     """
-    return df.diff(period)
+    # DataFrame.diff only accepts integer periods, Series.diff truncates floats
+    return df.diff(int(period))
 
 
+@lazy_operator(
+    lookback=lambda df, period=1: int(period) + 1, step=lambda df, period=1: df[0]
+)
 def delay(df, period=1):
     """
     Wrapper function to estimate lag.
@@ -133,29 +180,48 @@ def delay(df, period=1):
     :param period: the lag grade.
     :return: a pandas DataFrame with lagged time series
     """
-    return df.shift(period)
+    return df.shift(int(period))
 
 
+# A Series has no cross section and is ranked over its whole history, which
+# cannot be continued one row at a time
+@lazy_operator(
+    lookback=lambda df: 1 if isinstance(df, pd.DataFrame) else None,
+    step=lambda df: rolling_ops.row_rank(df[-1]),
+)
 def rank(df):
     """
     Cross sectional rank
-    :param df: a pandas DataFrame.
-    :return: a pandas DataFrame with rank along columns.
+    :param df: a pandas DataFrame (dates x assets) or a pandas Series of one stock.
+    :return: a pandas DataFrame with rank along columns. A single stock has no
+        cross section, so a Series is ranked over its whole history instead.
     """
-    # return df.rank(axis=1, pct=True)
+    if isinstance(df, pd.DataFrame):
+        return df.rank(axis=1, pct=True)
     return df.rank(pct=True)
 
 
+@lazy_operator(
+    lookback=lambda df, k=1: 1 if isinstance(df, pd.DataFrame) else None,
+    step=lambda df, k=1: df[-1] * k / np.nansum(np.abs(df[-1])),
+)
 def scale(df, k=1):
     """
     Scaling time serie.
-    :param df: a pandas DataFrame.
+    :param df: a pandas DataFrame (dates x assets) or a pandas Series of one stock.
     :param k: scaling factor.
-    :return: a pandas DataFrame rescaled df such that sum(abs(df)) = k
+    :return: a pandas DataFrame rescaled df such that sum(abs(df)) = k on every
+        date. A Series is scaled over its whole history instead.
     """
+    if isinstance(df, pd.DataFrame):
+        return df.mul(k).div(np.abs(df).sum(axis=1), axis=0)
     return df.mul(k).div(np.abs(df).sum())
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_argmax(df) + 1,
+)
 def ts_argmax(df, window=10):
     """
     Wrapper function to estimate which day ts_max(df, window) occurred on
@@ -163,9 +229,13 @@ def ts_argmax(df, window=10):
     :param window: the rolling window.
     :return: well.. that :)
     """
-    return df.rolling(window).apply(np.argmax) + 1
+    return rolling_ops.ts_argmax(df, window) + 1
 
 
+@lazy_operator(
+    lookback=lambda df, window=10: window,
+    step=lambda df, window=10: rolling_ops.last_argmin(df) + 1,
+)
 def ts_argmin(df, window=10):
     """
     Wrapper function to estimate which day ts_min(df, window) occurred on
@@ -173,130 +243,198 @@ def ts_argmin(df, window=10):
     :param window: the rolling window.
     :return: well.. that :)
     """
-    return df.rolling(window).apply(np.argmin) + 1
+    return rolling_ops.ts_argmin(df, window) + 1
 
 
 def decay_linear(df, period=10):
     """
     Linear weighted moving average implementation.
-    :param df: a pandas DataFrame.
+    :param df: a pandas DataFrame or Series.
     :param period: the LWMA period
-    :return: a pandas DataFrame with the LWMA.
+    :return: the LWMA with the same type, index and columns as df.
     """
-    # Clean data
-    if df.isnull().values.any():
-        # df.fillna(method="ffill", inplace=True)
-        df.ffill(inplace=True)
-        # df.fillna(method="bfill", inplace=True)
-        df.fillna(value=0, inplace=True)
-    na_lwma = np.zeros_like(df)
-    na_lwma[:period, :] = df.iloc[:period, :]
-    # na_series = df.as_matrix()
-    na_series = df.values
-
-    divisor = period * (period + 1) / 2
-    y = (np.arange(period) + 1) * 1.0 / divisor
-    # Estimate the actual lwma with the actual close.
-    # The backtest engine should assure to be snooping bias free.
-    for row in range(period - 1, df.shape[0]):
-        x = na_series[row - period + 1 : row + 1, :]
-        na_lwma[row, :] = np.dot(x.T, y)
-    return pd.DataFrame(na_lwma, index=df.index, columns=["CLOSE"])
+    # Clean data without modifying the caller's DataFrame
+    return _lwma(df.ffill().fillna(value=0), period)
+
+
+@lazy_operator(
+    lookback=lambda df, period: period,
+    step=lambda df, period: rolling_ops.last_weighted_mean(
+        df, np.arange(period) + 1.0
+    ).astype(df.dtype),
+)
+def _lwma(df, period):
+    # The first period - 1 rows keep the raw values, the rest is the LWMA
+    # computed on every window at once.
+    lwma = rolling_ops.ts_weighted_mean(df, np.arange(period) + 1.0)
+    lwma.iloc[: period - 1] = df.iloc[: period - 1].to_numpy(dtype=float)
+    # Keep the input dtype like the loop version did (boolean in, boolean out)
+    return lwma.astype(df.dtypes)
 
 
 # endregion
 
 
+# Alphas implemented by the Alphas class, in the column order of get_alpha
+ALPHA_NAMES = [
+    "alpha001",
+    "alpha002",
+    "alpha003",
+    "alpha004",
+    "alpha005",
+    "alpha006",
+    "alpha007",
+    "alpha008",
+    "alpha009",
+    "alpha010",
+    "alpha011",
+    "alpha012",
+    "alpha013",
+    "alpha014",
+    "alpha015",
+    "alpha016",
+    "alpha017",
+    "alpha018",
+    "alpha019",
+    "alpha020",
+    "alpha021",
+    "alpha022",
+    "alpha023",
+    "alpha024",
+    "alpha025",
+    "alpha026",
+    "alpha027",
+    "alpha028",
+    "alpha029",
+    "alpha030",
+    "alpha031",
+    "alpha032",
+    "alpha033",
+    "alpha034",
+    "alpha035",
+    "alpha036",
+    "alpha037",
+    "alpha038",
+    "alpha039",
+    "alpha040",
+    "alpha041",
+    "alpha042",
+    "alpha043",
+    "alpha044",
+    "alpha045",
+    "alpha046",
+    "alpha047",
+    "alpha049",
+    "alpha050",
+    "alpha051",
+    "alpha052",
+    "alpha053",
+    "alpha054",
+    "alpha055",
+    "alpha057",
+    "alpha060",
+    "alpha061",
+    "alpha062",
+    "alpha064",
+    "alpha065",
+    "alpha066",
+    "alpha068",
+    "alpha071",
+    "alpha072",
+    "alpha073",
+    "alpha074",
+    "alpha075",
+    "alpha077",
+    "alpha078",
+    "alpha081",
+    "alpha083",
+    "alpha084",
+    "alpha085",
+    "alpha086",
+    "alpha088",
+    "alpha092",
+    "alpha094",
+    "alpha095",
+    "alpha096",
+    "alpha098",
+    "alpha099",
+    "alpha101",
+]
+
+
 def get_alpha(df):
     stock = Alphas(df)
-    df["alpha001"] = stock.alpha001()
-    df["alpha002"] = stock.alpha002()
-    df["alpha003"] = stock.alpha003()
-    df["alpha004"] = stock.alpha004()
-    df["alpha005"] = stock.alpha005()
-    df["alpha006"] = stock.alpha006()
-    df["alpha007"] = stock.alpha007()
-    df["alpha008"] = stock.alpha008()
-    df["alpha009"] = stock.alpha009()
-    df["alpha010"] = stock.alpha010()
-    df["alpha011"] = stock.alpha011()
-    df["alpha012"] = stock.alpha012()
-    df["alpha013"] = stock.alpha013()
-    df["alpha014"] = stock.alpha014()
-    df["alpha015"] = stock.alpha015()
-    df["alpha016"] = stock.alpha016()
-    df["alpha017"] = stock.alpha017()
-    df["alpha018"] = stock.alpha018()
-    df["alpha019"] = stock.alpha019()
-    df["alpha020"] = stock.alpha020()
-    df["alpha021"] = stock.alpha021()
-    df["alpha022"] = stock.alpha022()
-    df["alpha023"] = stock.alpha023()
-    df["alpha024"] = stock.alpha024()
-    df["alpha025"] = stock.alpha025()
-    df["alpha026"] = stock.alpha026()
-    df["alpha027"] = stock.alpha027()
-    df["alpha028"] = stock.alpha028()
-    df["alpha029"] = stock.alpha029()
-    df["alpha030"] = stock.alpha030()
-    df["alpha031"] = stock.alpha031()
-    df["alpha032"] = stock.alpha032()
-    df["alpha033"] = stock.alpha033()
-    df["alpha034"] = stock.alpha034()
-    df["alpha035"] = stock.alpha035()
-    df["alpha036"] = stock.alpha036()
-    df["alpha037"] = stock.alpha037()
-    df["alpha038"] = stock.alpha038()
-    df["alpha039"] = stock.alpha039()
-    df["alpha040"] = stock.alpha040()
-    df["alpha041"] = stock.alpha041()
-    df["alpha042"] = stock.alpha042()
-    df["alpha043"] = stock.alpha043()
-    df["alpha044"] = stock.alpha044()
-    df["alpha045"] = stock.alpha045()
-    df["alpha046"] = stock.alpha046()
-    df["alpha047"] = stock.alpha047()
-    df["alpha049"] = stock.alpha049()
-    df["alpha050"] = stock.alpha050()
-    df["alpha051"] = stock.alpha051()
-    df["alpha052"] = stock.alpha052()
-    df["alpha053"] = stock.alpha053()
-    df["alpha054"] = stock.alpha054()
-    df["alpha055"] = stock.alpha055()
-    df["alpha057"] = stock.alpha057()
-    df["alpha060"] = stock.alpha060()
-    df["alpha061"] = stock.alpha061()
-    df["alpha062"] = stock.alpha062()
-    df["alpha064"] = stock.alpha064()
-    df["alpha065"] = stock.alpha065()
-    df["alpha066"] = stock.alpha066()
-    df["alpha068"] = stock.alpha068()
-    df["alpha071"] = stock.alpha071()
-    df["alpha072"] = stock.alpha072()
-    df["alpha073"] = stock.alpha073()
-    df["alpha074"] = stock.alpha074()
-    df["alpha075"] = stock.alpha075()
-    df["alpha077"] = stock.alpha077()
-    df["alpha078"] = stock.alpha078()
-    df["alpha081"] = stock.alpha081()
-    df["alpha083"] = stock.alpha083()
-    df["alpha084"] = stock.alpha084()
-    df["alpha085"] = stock.alpha085()
-    df["alpha086"] = stock.alpha086()
-    df["alpha088"] = stock.alpha088()
-    df["alpha092"] = stock.alpha092()
-    df["alpha094"] = stock.alpha094()
-    df["alpha095"] = stock.alpha095()
-    df["alpha096"] = stock.alpha096()
-    df["alpha098"] = stock.alpha098()
-    df["alpha099"] = stock.alpha099()
-    df["alpha101"] = stock.alpha101()
+    for name in ALPHA_NAMES:
+        df[name] = getattr(stock, name)()
     return df
 
 
+def get_alpha_panel(df):
+    """
+    Compute every alpha for the whole universe at once.
+    :param df: a wide pandas DataFrame indexed by date, with MultiIndex columns
+        (S_DQ_OPEN/S_DQ_HIGH/S_DQ_LOW/S_DQ_CLOSE/S_DQ_VOLUME, asset), e.g. the
+        result of long_df.pivot(index="datetime", columns="asset").
+    :return: a pandas DataFrame indexed by (datetime, asset) with one column per
+        alpha. rank and scale are computed across assets on every date.
+    """
+    stock = Alphas(df)
+    alphas = {name: getattr(stock, name)() for name in ALPHA_NAMES}
+    return _long_panel(alphas, stock.close.index, stock.close.columns)
+
+
+def start_alpha_panel_incremental(df):
+    """
+    Compute every alpha for the whole universe like get_alpha_panel, and keep
+    a checkpoint so later dates only compute their new rows.
+    :param df: a wide pandas DataFrame as for get_alpha_panel.
+    :return: (checkpoint, alphas). alphas is the same as get_alpha_panel(df);
+        pass the checkpoint to append_alpha_panel with the following dates.
+    """
+    checkpoint, alphas, errors = alpha_incremental.start_incremental(
+        Alphas, df, ALPHA_NAMES
+    )
+    for error in errors.values():
+        raise error
+    close = df["S_DQ_CLOSE"]
+    return checkpoint, _long_panel(alphas, close.index, close.columns)
+
+
+def append_alpha_panel(checkpoint, df):
+    """
+    Compute every alpha for new dates only, continuing a checkpoint.
+    :param checkpoint: the checkpoint of start_alpha_panel_incremental, updated
+        in place (IncrementalAlphas.save / load keep it between runs).
+    :param df: a wide pandas DataFrame with the dates after the checkpoint and
+        the same columns (fields and assets) as when it was created.
+    :return: a pandas DataFrame indexed by (datetime, asset) for the new dates,
+        equal to the same rows of get_alpha_panel on the whole history.
+    """
+    alphas, errors = checkpoint.append(df)
+    for error in errors.values():
+        raise error
+    close = df["S_DQ_CLOSE"]
+    return _long_panel(alphas, close.index, close.columns)
+
+
+def _long_panel(alphas, dates, assets):
+    # One row per (datetime, asset) and one column per alpha
+    alphas = {
+        name: alpha.reindex(index=dates, columns=assets).to_numpy().ravel()
+        for name, alpha in alphas.items()
+    }
+    index = pd.MultiIndex.from_product([dates, assets], names=["datetime", "asset"])
+    return pd.DataFrame(alphas, index=index)
+
+
 class Alphas(object):
     def __init__(self, df_data):
-        df_data = df_data.ffill().dropna()
+        if isinstance(df_data.columns, pd.MultiIndex):
+            # Panel data (dates x assets per field): keep every date, stocks
+            # that are not listed yet simply stay NaN
+            df_data = df_data.ffill()
+        else:
+            df_data = df_data.ffill().dropna()
         self.open = df_data["S_DQ_OPEN"]
         self.high = df_data["S_DQ_HIGH"]
         self.low = df_data["S_DQ_LOW"]
@@ -334,7 +472,7 @@ class Alphas(object):
 
     # Alpha#5	 (rank((open - (sum(vwap, 10) / 10))) * (-1 * abs(rank((close - vwap)))))
     def alpha005(self):
-        return rank((self.open - (sum(self.vwap, 10) / 10))) * (
+        return rank((self.open - (ts_sum(self.vwap, 10) / 10))) * (
             -1 * abs(rank((self.close - self.vwap)))
         )
 
@@ -452,11 +590,7 @@ class Alphas(object):
     def alpha021(self):
         cond_1 = sma(self.close, 8) + stddev(self.close, 8) < sma(self.close, 2)
         cond_2 = sma(self.volume, 20) / self.volume < 1
-        alpha = pd.DataFrame(np.ones_like(self.close), index=self.close.index)
-        #        alpha = pd.DataFrame(np.ones_like(self.close), index=self.close.index,
-        #                             columns=self.close.columns)
-        alpha[cond_1 | cond_2] = -1
-        return alpha
+        return 1.0 - 2.0 * (cond_1 | cond_2)
 
     # Alpha#22	 (-1 * (delta(correlation(high, volume, 5), 5) * rank(stddev(close, 20))))
     def alpha022(self):
@@ -467,11 +601,7 @@ class Alphas(object):
     # Alpha#23	 (((sum(high, 20) / 20) < high) ? (-1 * delta(high, 2)) : 0)
     def alpha023(self):
         cond = sma(self.high, 20) < self.high
-        alpha = pd.DataFrame(
-            np.zeros_like(self.close), index=self.close.index, columns=["close"]
-        )
-        alpha.loc[cond, "close"] = -1 * delta(self.high, 2).fillna(value=0)
-        return alpha
+        return (-1 * delta(self.high, 2).fillna(value=0)).where(cond, 0.0)
 
     # Alpha#24	 ((((delta((sum(close, 100) / 100), 100) / delay(close, 100)) < 0.05) ||((delta((sum(close, 100) / 100), 100) / delay(close, 100)) == 0.05)) ? (-1 * (close - ts_min(close,100))) : (-1 * delta(close, 3)))
     def alpha024(self):
@@ -543,18 +673,12 @@ class Alphas(object):
             .fillna(value=0)
         )
         p1 = rank(
-            rank(
-                rank(
-                    decay_linear(
-                        (-1 * rank(rank(delta(self.close, 10)))).to_frame(), 10
-                    )
-                )
-            )
+            rank(rank(decay_linear((-1 * rank(rank(delta(self.close, 10)))), 10)))
         )
         p2 = rank((-1 * delta(self.close, 3)))
         p3 = sign(scale(df))
 
-        return p1.CLOSE + p2 + p3
+        return p1 + p2 + p3
 
     # Alpha#32	 (scale(((sum(close, 7) / 7) - close)) + (20 * scale(correlation(vwap, delay(close, 5),230))))
     def alpha032(self):
@@ -624,7 +748,7 @@ class Alphas(object):
             -1
             * rank(
                 delta(self.close, 7)
-                * (1 - rank(decay_linear((self.volume / adv20).to_frame(), 9).CLOSE))
+                * (1 - rank(decay_linear((self.volume / adv20), 9)))
             )
         ) * (1 + rank(sma(self.returns, 250)))
 
@@ -744,7 +868,7 @@ class Alphas(object):
             1
             * (
                 (self.close - self.vwap)
-                / decay_linear(rank(ts_argmax(self.close, 30)).to_frame(), 2).CLOSE
+                / decay_linear(rank(ts_argmax(self.close, 30)), 2)
             )
         )
 
@@ -821,7 +945,7 @@ class Alphas(object):
     # Alpha#66	 ((rank(decay_linear(delta(vwap, 3.51013), 7.23052)) + Ts_Rank(decay_linear(((((low* 0.96633) + (low * (1 - 0.96633))) - vwap) / (open - ((high + low) / 2))), 11.4157), 6.72611)) * -1)
     def alpha066(self):
         return (
-            rank(decay_linear(delta(self.vwap, 4).to_frame(), 7).CLOSE)
+            rank(decay_linear(delta(self.vwap, 4), 7))
             + ts_rank(
                 decay_linear(
                     (
@@ -830,9 +954,9 @@ class Alphas(object):
                             - self.vwap
                         )
                         / (self.open - ((self.high + self.low) / 2))
-                    ).to_frame(),
+                    ),
                     11,
-                ).CLOSE,
+                ),
                 7,
             )
         ) * -1
@@ -858,45 +982,36 @@ class Alphas(object):
         adv180 = sma(self.volume, 180)
         p1 = ts_rank(
             decay_linear(
-                correlation(ts_rank(self.close, 3), ts_rank(adv180, 12), 18).to_frame(),
+                correlation(ts_rank(self.close, 3), ts_rank(adv180, 12), 18),
                 4,
-            ).CLOSE,
+            ),
             16,
         )
         p2 = ts_rank(
             decay_linear(
-                (
-                    rank(((self.low + self.open) - (self.vwap + self.vwap))).pow(2)
-                ).to_frame(),
+                (rank(((self.low + self.open) - (self.vwap + self.vwap))).pow(2)),
                 16,
-            ).CLOSE,
+            ),
             4,
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "max"] = df["p1"]
-        df.loc[df["p2"] >= df["p1"], "max"] = df["p2"]
-        return df["max"]
-        # return max(ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18).to_frame(), 4).CLOSE, 16), ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)).to_frame(), 16).CLOSE, 4))
+        return np.maximum(p1, p2)
+        # return max(ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18), 4), 16), ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)), 16), 4))
 
     # Alpha#72	 (rank(decay_linear(correlation(((high + low) / 2), adv40, 8.93345), 10.1519)) /rank(decay_linear(correlation(Ts_Rank(vwap, 3.72469), Ts_Rank(volume, 18.5188), 6.86671),2.95011)))
     def alpha072(self):
         adv40 = sma(self.volume, 40)
         return rank(
-            decay_linear(
-                correlation(((self.high + self.low) / 2), adv40, 9).to_frame(), 10
-            ).CLOSE
+            decay_linear(correlation(((self.high + self.low) / 2), adv40, 9), 10)
         ) / rank(
             decay_linear(
-                correlation(
-                    ts_rank(self.vwap, 4), ts_rank(self.volume, 19), 7
-                ).to_frame(),
+                correlation(ts_rank(self.vwap, 4), ts_rank(self.volume, 19), 7),
                 3,
-            ).CLOSE
+            )
         )
 
     # Alpha#73	 (max(rank(decay_linear(delta(vwap, 4.72775), 2.91864)),Ts_Rank(decay_linear(((delta(((open * 0.147155) + (low * (1 - 0.147155))), 2.03608) / ((open *0.147155) + (low * (1 - 0.147155)))) * -1), 3.33829), 16.7411)) * -1)
     def alpha073(self):
-        p1 = rank(decay_linear(delta(self.vwap, 5).to_frame(), 3).CLOSE)
+        p1 = rank(decay_linear(delta(self.vwap, 5), 3))
         p2 = ts_rank(
             decay_linear(
                 (
@@ -905,16 +1020,13 @@ class Alphas(object):
                         / ((self.open * 0.147155) + (self.low * (1 - 0.147155)))
                     )
                     * -1
-                ).to_frame(),
+                ),
                 3,
-            ).CLOSE,
+            ),
             17,
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "max"] = df["p1"]
-        df.loc[df["p2"] >= df["p1"], "max"] = df["p2"]
-        return -1 * df["max"]
-        # return (max(rank(decay_linear(delta(self.vwap, 5).to_frame(), 3).CLOSE),ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1).to_frame(), 3).CLOSE, 17)) * -1)
+        return -1 * np.maximum(p1, p2)
+        # return (max(rank(decay_linear(delta(self.vwap, 5), 3)),ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1), 3), 17)) * -1)
 
     # Alpha#74	 ((rank(correlation(close, sum(adv30, 37.4843), 15.1365)) <rank(correlation(rank(((high * 0.0261661) + (vwap * (1 - 0.0261661)))), rank(volume), 11.4791)))* -1)
     def alpha074(self):
@@ -944,22 +1056,13 @@ class Alphas(object):
         adv40 = sma(self.volume, 40)
         p1 = rank(
             decay_linear(
-                (
-                    (((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)
-                ).to_frame(),
+                ((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)),
                 20,
-            ).CLOSE
-        )
-        p2 = rank(
-            decay_linear(
-                correlation(((self.high + self.low) / 2), adv40, 3).to_frame(), 6
-            ).CLOSE
+            )
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "min"] = df["p2"]
-        df.loc[df["p2"] >= df["p1"], "min"] = df["p1"]
-        return df["min"]
-        # return min(rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)).to_frame(), 20).CLOSE),rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3).to_frame(), 6).CLOSE))
+        p2 = rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3), 6))
+        return np.minimum(p1, p2)
+        # return min(rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)), 20)),rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3), 6)))
 
     # Alpha#78	 (rank(correlation(sum(((low * 0.352233) + (vwap * (1 - 0.352233))), 19.7428),sum(adv40, 19.7428), 6.83313))^rank(correlation(rank(vwap), rank(volume), 5.77492)))
     def alpha078(self):
@@ -1047,21 +1150,16 @@ class Alphas(object):
                 (
                     (rank(self.open) + rank(self.low))
                     - (rank(self.high) + rank(self.close))
-                ).to_frame(),
+                ),
                 8,
-            ).CLOSE
+            )
         )
         p2 = ts_rank(
-            decay_linear(
-                correlation(ts_rank(self.close, 8), ts_rank(adv60, 21), 8).to_frame(), 7
-            ).CLOSE,
+            decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60, 21), 8), 7),
             3,
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "min"] = df["p2"]
-        df.loc[df["p2"] >= df["p1"], "min"] = df["p1"]
-        return df["min"]
-        # return min(rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))).to_frame(),8).CLOSE), ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,20.6966), 8).to_frame(), 7).CLOSE, 3))
+        return np.minimum(p1, p2)
+        # return min(rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))),8)), ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,20.6966), 8), 7), 3))
 
     # Alpha#89	 (Ts_Rank(decay_linear(correlation(((low * 0.967285) + (low * (1 - 0.967285))), adv10,6.94279), 5.51607), 3.79744) - Ts_Rank(decay_linear(delta(IndNeutralize(vwap,IndClass.industry), 3.48158), 10.1466), 15.3012))
 
@@ -1074,24 +1172,17 @@ class Alphas(object):
         adv30 = sma(self.volume, 30)
         p1 = ts_rank(
             decay_linear(
-                (
-                    (((self.high + self.low) / 2) + self.close) < (self.low + self.open)
-                ).to_frame(),
+                ((((self.high + self.low) / 2) + self.close) < (self.low + self.open)),
                 15,
-            ).CLOSE,
+            ),
             19,
         )
         p2 = ts_rank(
-            decay_linear(
-                correlation(rank(self.low), rank(adv30), 8).to_frame(), 7
-            ).CLOSE,
+            decay_linear(correlation(rank(self.low), rank(adv30), 8), 7),
             7,
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "min"] = df["p2"]
-        df.loc[df["p2"] >= df["p1"], "min"] = df["p1"]
-        return df["min"]
-        # return  min(ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)).to_frame(), 15).CLOSE,19), ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8).to_frame(), 7).CLOSE,7))
+        return np.minimum(p1, p2)
+        # return  min(ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)), 15),19), ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8), 7),7))
 
     # Alpha#93	 (Ts_Rank(decay_linear(correlation(IndNeutralize(vwap, IndClass.industry), adv81,17.4193), 19.848), 7.54455) / rank(decay_linear(delta(((close * 0.524434) + (vwap * (1 -0.524434))), 2.77377), 16.2664)))
 
@@ -1123,25 +1214,20 @@ class Alphas(object):
     def alpha096(self):
         adv60 = sma(self.volume, 60)
         p1 = ts_rank(
-            decay_linear(
-                correlation(rank(self.vwap), rank(self.volume).to_frame(), 4), 4
-            ).CLOSE,
+            decay_linear(correlation(rank(self.vwap), rank(self.volume), 4), 4),
             8,
         )
         p2 = ts_rank(
             decay_linear(
                 ts_argmax(
                     correlation(ts_rank(self.close, 7), ts_rank(adv60, 4), 4), 13
-                ).to_frame(),
+                ),
                 14,
-            ).CLOSE,
+            ),
             13,
         )
-        df = pd.DataFrame({"p1": p1, "p2": p2})
-        df.loc[df["p1"] >= df["p2"], "max"] = df["p1"]
-        df.loc[df["p2"] >= df["p1"], "max"] = df["p2"]
-        return -1 * df["max"]
-        # return (max(ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume).to_frame(), 4),4).CLOSE, 8), ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13).to_frame(), 14).CLOSE, 13)) * -1)
+        return -1 * np.maximum(p1, p2)
+        # return (max(ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume), 4),4), 8), ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13), 14), 13)) * -1)
 
     # Alpha#97	 ((rank(decay_linear(delta(IndNeutralize(((low * 0.721001) + (vwap * (1 - 0.721001))),IndClass.industry), 3.3705), 20.4523)) - Ts_Rank(decay_linear(Ts_Rank(correlation(Ts_Rank(low,7.87871), Ts_Rank(adv60, 17.255), 4.97547), 18.5925), 15.7152), 6.71659)) * -1)
 
@@ -1149,15 +1235,11 @@ class Alphas(object):
     def alpha098(self):
         adv5 = sma(self.volume, 5)
         adv15 = sma(self.volume, 15)
-        return rank(
-            decay_linear(correlation(self.vwap, sma(adv5, 26), 5).to_frame(), 7).CLOSE
-        ) - rank(
+        return rank(decay_linear(correlation(self.vwap, sma(adv5, 26), 5), 7)) - rank(
             decay_linear(
-                ts_rank(
-                    ts_argmin(correlation(rank(self.open), rank(adv15), 21), 9), 7
-                ).to_frame(),
+                ts_rank(ts_argmin(correlation(rank(self.open), rank(adv15), 21), 9), 7),
                 8,
-            ).CLOSE
+            )
         )
 
     # Alpha#99	 ((rank(correlation(sum(((high + low) / 2), 19.8975), sum(adv60, 19.8975), 8.8136)) <rank(correlation(low, volume, 6.28259))) * -1)
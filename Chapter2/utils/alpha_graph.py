@@ -0,0 +1,500 @@
+# 載入需要的套件
+import functools
+import operator
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from typing_extensions import Annotated
+
+# 表達式求值時，中間結果快取的預設記憶體上限(位元組)
+DEFAULT_CACHE_BYTES = 1 << 30
+
+# 葉節點直接回傳實際資料的屬性(只包含欄位結構，不包含會隨資料長度改變的屬性)
+_LEAF_ATTRIBUTES = ("columns", "dtypes", "ndim")
+
+
+class _NodeRef(object):
+    """
+    類別說明:
+    節點參數中代表另一個節點的參照，求值時會被替換為該節點的計算結果。
+    """
+
+    __slots__ = ("nid",)
+
+    def __init__(self, nid: Annotated[int, "節點編號"]):
+        self.nid = nid
+
+    def __eq__(self, other):
+        return isinstance(other, _NodeRef) and other.nid == self.nid
+
+    def __hash__(self):
+        return hash(("_NodeRef", self.nid))
+
+
+def _to_refs(obj):
+    # 將參數中的 Expr 換成 _NodeRef，讓節點只記錄編號而不持有 Expr 物件
+    if isinstance(obj, Expr):
+        return _NodeRef(obj._nid)
+    if isinstance(obj, tuple):
+        return tuple(_to_refs(item) for item in obj)
+    if isinstance(obj, list):
+        return [_to_refs(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _to_refs(value) for key, value in obj.items()}
+    return obj
+
+
+def _freeze(obj):
+    # 將參數轉為可雜湊的鍵值，相同結構與數值的參數會得到相同的鍵值
+    if isinstance(obj, _NodeRef):
+        return obj
+    if isinstance(obj, (tuple, list)):
+        return (type(obj).__name__, tuple(_freeze(item) for item in obj))
+    if isinstance(obj, dict):
+        return ("dict", tuple((_freeze(k), _freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, slice):
+        return ("slice", _freeze(obj.start), _freeze(obj.stop), _freeze(obj.step))
+    if isinstance(obj, np.ndarray):
+        return ("ndarray", obj.dtype.str, obj.shape, obj.tobytes())
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, np.generic)):
+        # 以型別區分 1、1.0 與 True，避免不同型別的常數共用同一個節點
+        return (type(obj).__name__, obj)
+    if callable(obj):
+        return obj
+    # 其他無法比較內容的物件(例如資料表)，以物件本身的 id 區分
+    return ("id", id(obj))
+
+
+def _children(obj, found: set) -> set:
+    # 找出參數中參照到的所有節點編號
+    if isinstance(obj, _NodeRef):
+        found.add(obj.nid)
+    elif isinstance(obj, (tuple, list)):
+        for item in obj:
+            _children(item, found)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _children(value, found)
+    return found
+
+
+def _nbytes(value) -> int:
+    # 估計快取中一個計算結果佔用的記憶體
+    # (以欄位型別估計，memory_usage 會逐欄建立 Series，寬表時很慢)
+    if isinstance(value, pd.DataFrame):
+        return len(value) * sum(dtype.itemsize for dtype in value.dtypes)
+    if isinstance(value, pd.Series):
+        return len(value) * value.dtype.itemsize
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return 0
+
+
+def _call_method(obj, name, *args, **kwargs):
+    return getattr(obj, name)(*args, **kwargs)
+
+
+def _get_indexed(obj, indexer, key):
+    return getattr(obj, indexer)[key]
+
+
+def _set_item(obj, key, value):
+    # 在複本上設值，不修改快取中的結果
+    obj = obj.copy()
+    obj[key] = value
+    return obj
+
+
+def _set_indexed(obj, indexer, key, value):
+    obj = obj.copy()
+    getattr(obj, indexer)[key] = value
+    return obj
+
+
+class ExprGraph(object):
+    """
+    類別說明:
+    延遲計算的表達式圖。運算子作用在 Expr 上時不會立即計算，而是在圖中建立節點；
+    運算子與參數(包含子節點)都相同的節點只會建立一次，
+    因此多個 Alpha 因子中重複出現的中間結果(例如 Delay(close, 1)、Mean(volume, 20))
+    在求值時只會計算一次。
+    """
+
+    def __init__(self):
+        self._ids = {}  # 節點鍵值 -> 節點編號
+        self._nodes = []  # 節點編號 -> (運算子, 參數, 關鍵字參數)
+        self._leaves = {}  # 節點編號 -> 原始資料
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def leaf(self, value) -> "Expr":
+        """
+        函式說明:
+        以實際資料建立葉節點，求值時直接回傳該資料。
+        """
+        key = ("leaf", id(value))
+        nid = self._ids.get(key)
+        if nid is None:
+            nid = self._add_node(key, (None, (), {}))
+            self._leaves[nid] = value
+        return Expr(self, nid)
+
+    def apply(self, op: Callable, *args, **kwargs) -> "Expr":
+        """
+        函式說明:
+        建立(或取得已存在的)節點，代表 op(*args, **kwargs) 的計算結果。
+        """
+        args = _to_refs(args)
+        kwargs = _to_refs(kwargs)
+        key = (op, _freeze(args), _freeze(kwargs))
+        nid = self._ids.get(key)
+        if nid is None:
+            nid = self._add_node(key, (op, args, kwargs))
+        return Expr(self, nid)
+
+    def _add_node(self, key, node) -> int:
+        nid = len(self._nodes)
+        self._ids[key] = nid
+        self._nodes.append(node)
+        return nid
+
+    def children(self, nid: Annotated[int, "節點編號"]) -> set:
+        _, args, kwargs = self._nodes[nid]
+        return _children(kwargs, _children(args, set()))
+
+    def evaluate(
+        self,
+        roots: Annotated[Dict[str, "Expr"], "要計算的表達式，鍵為名稱"],
+        max_cache_bytes: Annotated[int, "中間結果快取的記憶體上限(位元組)"] = (
+            DEFAULT_CACHE_BYTES
+        ),
+    ) -> Annotated[
+        Tuple[Dict[str, object], Dict[str, Exception]],
+        "(計算結果, 計算失敗的錯誤)",
+    ]:
+        """
+        函式說明:
+        計算多個表達式，所有表達式共用同一份中間結果快取。
+        每個節點記錄還有多少上層節點尚未使用它，使用完畢就立即釋放；
+        快取超過記憶體上限時，先釋放最久未使用的結果，之後若再需要會重新計算。
+        """
+        evaluator = _Evaluator(self, [expr._nid for expr in roots.values()])
+        evaluator.max_cache_bytes = max_cache_bytes
+        results, errors = {}, {}
+        returned = set()
+        for name, expr in roots.items():
+            try:
+                value = evaluator.value(expr._nid)
+            except Exception as e:
+                errors[name] = e
+                continue
+            finally:
+                evaluator.release(expr._nid)
+            # 不同名稱的表達式可能是同一個節點，回傳複本避免彼此共用同一個物件
+            if expr._nid in returned and hasattr(value, "copy"):
+                value = value.copy()
+            returned.add(expr._nid)
+            results[name] = value
+        return results, errors
+
+
+class _Evaluator(object):
+    """
+    類別說明:
+    ExprGraph.evaluate 使用的求值器，負責中間結果的快取、引用計數與記憶體上限。
+    """
+
+    def __init__(self, graph: ExprGraph, root_ids: List[int]):
+        self.graph = graph
+        self.max_cache_bytes = DEFAULT_CACHE_BYTES
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.computed = set()
+        # 計算每個節點被多少個上層節點(以及要回傳的表達式)使用
+        self.uses = {}
+        stack = list(root_ids)
+        visited = set()
+        for nid in root_ids:
+            self.uses[nid] = self.uses.get(nid, 0) + 1
+        while stack:
+            nid = stack.pop()
+            if nid in visited:
+                continue
+            visited.add(nid)
+            for child in graph.children(nid):
+                self.uses[child] = self.uses.get(child, 0) + 1
+                stack.append(child)
+
+    def value(self, nid: int):
+        if nid in self.graph._leaves:
+            return self.graph._leaves[nid]
+        if nid in self.cache:
+            self.cache.move_to_end(nid)
+            return self.cache[nid][0]
+        op, args, kwargs = self.graph._nodes[nid]
+        value = op(*self.resolve(args), **self.resolve(kwargs))
+        # 節點第一次計算完成時，才把子節點的使用次數減一
+        if nid not in self.computed:
+            self.computed.add(nid)
+            for child in self.graph.children(nid):
+                self.release(child)
+        if self.uses.get(nid, 0) > 0:
+            self.store(nid, value)
+        return value
+
+    def resolve(self, obj):
+        if isinstance(obj, _NodeRef):
+            return self.value(obj.nid)
+        if isinstance(obj, tuple):
+            return tuple(self.resolve(item) for item in obj)
+        if isinstance(obj, list):
+            return [self.resolve(item) for item in obj]
+        if isinstance(obj, dict):
+            return {key: self.resolve(value) for key, value in obj.items()}
+        return obj
+
+    def store(self, nid: int, value):
+        nbytes = _nbytes(value)
+        self.cache[nid] = (value, nbytes)
+        self.cache_bytes += nbytes
+        while self.cache_bytes > self.max_cache_bytes and len(self.cache) > 1:
+            _, (_, evicted_bytes) = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted_bytes
+
+    def release(self, nid: int):
+        self.uses[nid] = self.uses.get(nid, 0) - 1
+        if self.uses[nid] <= 0 and nid in self.cache:
+            _, nbytes = self.cache.pop(nid)
+            self.cache_bytes -= nbytes
+
+
+def _binary(op: Callable, reflected: bool = False):
+    if reflected:
+        return lambda self, other: self._graph.apply(op, other, self)
+    return lambda self, other: self._graph.apply(op, self, other)
+
+
+class Expr(object):
+    """
+    類別說明:
+    ExprGraph 中的一個節點。支援算術、比較與邏輯運算、numpy ufunc、
+    方法呼叫(例如 .copy()、.shift())以及 x[cond] = value、x.loc[...] = value 形式的設值，
+    這些操作都只會在圖中建立新節點；設值會讓這個 Expr 改為指向設值後的新節點。
+    需要實際數值才能進行的操作(例如 if 判斷、len、轉為 numpy 陣列)會拋出 TypeError。
+    """
+
+    # 讓 pandas 與 numpy 在遇到 Expr 時交由 Expr 的運算子處理
+    __array_priority__ = 1000
+    __pandas_priority__ = 5000
+
+    def __init__(self, graph: ExprGraph, nid: int):
+        self._graph = graph
+        self._nid = nid
+
+    __add__ = _binary(operator.add)
+    __radd__ = _binary(operator.add, reflected=True)
+    __sub__ = _binary(operator.sub)
+    __rsub__ = _binary(operator.sub, reflected=True)
+    __mul__ = _binary(operator.mul)
+    __rmul__ = _binary(operator.mul, reflected=True)
+    __truediv__ = _binary(operator.truediv)
+    __rtruediv__ = _binary(operator.truediv, reflected=True)
+    __floordiv__ = _binary(operator.floordiv)
+    __rfloordiv__ = _binary(operator.floordiv, reflected=True)
+    __mod__ = _binary(operator.mod)
+    __rmod__ = _binary(operator.mod, reflected=True)
+    __pow__ = _binary(operator.pow)
+    __rpow__ = _binary(operator.pow, reflected=True)
+    __and__ = _binary(operator.and_)
+    __rand__ = _binary(operator.and_, reflected=True)
+    __or__ = _binary(operator.or_)
+    __ror__ = _binary(operator.or_, reflected=True)
+    __xor__ = _binary(operator.xor)
+    __rxor__ = _binary(operator.xor, reflected=True)
+    __lt__ = _binary(operator.lt)
+    __le__ = _binary(operator.le)
+    __gt__ = _binary(operator.gt)
+    __ge__ = _binary(operator.ge)
+    __eq__ = _binary(operator.eq)
+    __ne__ = _binary(operator.ne)
+    __hash__ = None
+
+    def __neg__(self):
+        return self._graph.apply(operator.neg, self)
+
+    def __pos__(self):
+        return self._graph.apply(operator.pos, self)
+
+    def __abs__(self):
+        return self._graph.apply(operator.abs, self)
+
+    def __invert__(self):
+        return self._graph.apply(operator.invert, self)
+
+    def __getitem__(self, key):
+        return self._graph.apply(operator.getitem, self, key)
+
+    def __setitem__(self, key, value):
+        self._nid = self._graph.apply(_set_item, self, key, value)._nid
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in _LEAF_ATTRIBUTES and self._nid in self._graph._leaves:
+            # 葉節點的欄位結構是已知的常數，直接回傳，讓因子類別可以依欄位型態選擇計算方式
+            return getattr(self._graph._leaves[self._nid], name)
+        return _Attribute(self, name)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != "__call__":
+            return NotImplemented
+        return self._graph.apply(ufunc, *inputs, **kwargs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        return self._graph.apply(func, *args, **kwargs)
+
+    def _no_value(self, *args, **kwargs):
+        raise TypeError("Expr 是延遲計算的表達式，尚未有實際數值")
+
+    __bool__ = __len__ = __iter__ = __contains__ = __array__ = _no_value
+
+
+class _Attribute(object):
+    """
+    類別說明:
+    Expr 的屬性，呼叫時建立方法呼叫的節點；.loc、.iloc 等索引器則支援取值與設值。
+    """
+
+    def __init__(self, expr: Expr, name: str):
+        self._expr = expr
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        graph = self._expr._graph
+        if kwargs.get("inplace"):
+            # inplace=True 改為計算新的結果，並讓原本的 Expr 指向新節點
+            kwargs = dict(kwargs, inplace=False)
+            result = graph.apply(_call_method, self._expr, self._name, *args, **kwargs)
+            self._expr._nid = result._nid
+            return None
+        return graph.apply(_call_method, self._expr, self._name, *args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._expr._graph.apply(_get_indexed, self._expr, self._name, key)
+
+    def __setitem__(self, key, value):
+        graph = self._expr._graph
+        self._expr._nid = graph.apply(
+            _set_indexed, self._expr, self._name, key, value
+        )._nid
+
+
+def _find_graph(obj) -> Optional[ExprGraph]:
+    if isinstance(obj, Expr):
+        return obj._graph
+    if isinstance(obj, (tuple, list)):
+        for item in obj:
+            graph = _find_graph(item)
+            if graph is not None:
+                return graph
+    return None
+
+
+def lazy_operator(
+    func: Optional[Callable] = None,
+    *,
+    lookback: Annotated[
+        Union[int, Callable, None],
+        "計算最後一筆結果需要輸入資料最近幾筆(整數，或以運算子參數計算的函式)",
+    ] = None,
+    ewm_alpha: Annotated[
+        Optional[Callable],
+        "運算子等同 ewm(alpha, adjust=False).mean() 時，以運算子參數計算 alpha 的函式",
+    ] = None,
+    step: Annotated[
+        Optional[Callable],
+        "以 numpy 陣列計算最新一筆結果的函式，資料參數改為最近 lookback 筆(形狀為 (lookback, 欄位數))",
+    ] = None,
+    running: Annotated[
+        Optional[Callable],
+        "運算子以累計值逐筆延續時(例如滾動總和)，以運算子參數建立 rolling_ops.RunningWindow 的函式",
+    ] = None,
+) -> Callable:
+    """
+    函式說明:
+    運算子的裝飾器。參數中含有 Expr 時，改為在表達式圖中建立節點；
+    否則直接計算，因此原本傳入資料表的用法不受影響。
+    lookback、ewm_alpha、step 與 running 記錄在運算子上，供增量計算(alpha_incremental)判斷
+    新增一筆資料時需要保留多少歷史資料、需要延續的指數平均狀態與累計值，
+    以及不經過 pandas、直接以 numpy 陣列計算新的一列的方式。
+    lookback 為函式時，傳入的是運算子的實際參數(資料表與數值)。
+    """
+    if func is None:
+        return functools.partial(
+            lazy_operator,
+            lookback=lookback,
+            ewm_alpha=ewm_alpha,
+            step=step,
+            running=running,
+        )
+    func.lookback = lookback
+    func.ewm_alpha = ewm_alpha
+    func.step = step
+    func.running = running
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        graph = _find_graph(args) or _find_graph(list(kwargs.values()))
+        if graph is None:
+            return func(*args, **kwargs)
+        return graph.apply(func, *args, **kwargs)
+
+    return wrapper
+
+
+def evaluate_alphas(
+    alphas_cls: Annotated[type, "Alpha 因子類別，例如 Alphas191"],
+    df_data: Annotated[pd.DataFrame, "建立 Alpha 因子類別所需的股票資料"],
+    alpha_names: Annotated[List[str], "要計算的 Alpha 方法名稱"],
+    max_cache_bytes: Annotated[int, "中間結果快取的記憶體上限(位元組)"] = (
+        DEFAULT_CACHE_BYTES
+    ),
+) -> Annotated[
+    Tuple[Dict[str, object], Dict[str, Exception]],
+    "(各 Alpha 因子的計算結果, 計算失敗的 Alpha 因子與錯誤)",
+]:
+    """
+    函式說明:
+    以表達式圖一次計算多個 Alpha 因子。先以延遲計算的資料建立類別，
+    呼叫每個 Alpha 方法取得表達式，再一起求值，相同的子表達式只計算一次。
+    無法以表達式建立(例如需要實際數值做判斷)或求值失敗的 Alpha 方法，
+    會改用一般的方式直接計算，仍然失敗時才記錄為錯誤。
+    """
+    graph = ExprGraph()
+    lazy_alphas = alphas_cls(graph.leaf(df_data))
+    roots, eager_names = {}, []
+    for name in alpha_names:
+        try:
+            expr = getattr(lazy_alphas, name)()
+        except Exception:
+            eager_names.append(name)
+            continue
+        if isinstance(expr, Expr):
+            roots[name] = expr
+        else:
+            eager_names.append(name)
+    results, errors = graph.evaluate(roots, max_cache_bytes=max_cache_bytes)
+    eager_names += list(errors)
+    errors = {}
+    eager_alphas = alphas_cls(df_data) if eager_names else None
+    for name in eager_names:
+        try:
+            results[name] = getattr(eager_alphas, name)()
+        except Exception as e:
+            errors[name] = e
+    # 依照傳入的順序回傳
+    results = {name: results[name] for name in alpha_names if name in results}
+    return results, errors
@@ -0,0 +1,805 @@
+# 載入需要的套件
+import operator
+import pickle
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from typing_extensions import Annotated
+
+from Chapter2.utils.alpha_graph import (
+    Expr,
+    ExprGraph,
+    _call_method,
+    _NodeRef,
+    _set_indexed,
+    _set_item,
+)
+
+# 檢查點格式的版本，格式改變時遞增，避免讀到不相容的舊檢查點
+CHECKPOINT_VERSION = 2
+
+# 建立檢查點時，以完整計算結果的最後幾列驗證每個節點的 numpy 逐列運算
+VERIFY_ROWS = 16
+
+# 只用到同一列資料的運算(算術、比較與邏輯運算)
+_ROW_OPERATORS = {
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.truediv,
+    operator.floordiv,
+    operator.mod,
+    operator.pow,
+    operator.and_,
+    operator.or_,
+    operator.xor,
+    operator.lt,
+    operator.le,
+    operator.gt,
+    operator.ge,
+    operator.eq,
+    operator.ne,
+    operator.neg,
+    operator.pos,
+    operator.abs,
+    operator.invert,
+}
+
+
+def _fillna(x, value):
+    return np.where(np.isnan(x), value, x) if x.dtype.kind == "f" else x
+
+
+def _replace(x, to_replace, value=None, inplace=False):
+    # 只支援以純量取代純量；以字典指定時，取代為 None 視為遺失值(與 pandas 相同)
+    if isinstance(to_replace, dict):
+        pairs = [(k, np.nan if v is None else v) for k, v in to_replace.items()]
+    else:
+        pairs = [(k, value) for k in np.atleast_1d(to_replace)]
+    result = x
+    for target, new in pairs:
+        if target is None or np.isnan(target) or new is None or np.ndim(new) != 0:
+            raise TypeError("不支援的 replace 參數")
+        result = np.where(x == target, new, result)
+    return result
+
+
+def _arithmetic(op):
+    # 資料表與時間序列以 axis=0 運算時，時間序列只有一個欄位，numpy 的廣播即可對齊
+    return lambda x, other, axis="columns": op(x, other)
+
+
+# 資料表方法對應的 numpy 逐列運算，輸入為最近 lookback 筆資料
+_METHOD_STEPS = {
+    "abs": np.abs,
+    "add": _arithmetic(operator.add),
+    "sub": _arithmetic(operator.sub),
+    "mul": _arithmetic(operator.mul),
+    "div": _arithmetic(operator.truediv),
+    "truediv": _arithmetic(operator.truediv),
+    "pow": _arithmetic(operator.pow),
+    "astype": lambda x, dtype: x.astype(dtype),
+    "clip": lambda x, lower=None, upper=None: np.clip(x, lower, upper),
+    "copy": lambda x, deep=True: x,
+    "fillna": _fillna,
+    "mask": lambda x, cond, other=np.nan: np.where(cond, other, x),
+    "where": lambda x, cond, other=np.nan: np.where(cond, x, other),
+    "replace": _replace,
+    "shift": lambda x, periods=1: x[0],
+    "diff": lambda x, periods=1: x[-1] - x[0],
+}
+
+# 只用到同一列資料的資料表方法
+_ROW_METHODS = set(_METHOD_STEPS) - {"shift", "diff"}
+
+
+def node_lookback(op, args: tuple, kwargs: dict) -> Optional[int]:
+    """
+    函式說明:
+    回傳計算節點最後一筆結果時，需要子節點最近幾筆資料；args 與 kwargs 是實際的參數值。
+    指數平均(ewm_alpha)、向前填補(ffill)與報酬率(pct_change)節點以狀態延續，
+    只需要子節點最新一筆資料；
+    無法判斷(例如整段資料的標準差)的節點回傳 None，這類因子改為完整重新計算。
+    """
+    lookback = getattr(op, "lookback", None)
+    if callable(lookback):
+        lookback = lookback(*args, **kwargs)
+    if lookback is not None:
+        return int(lookback)
+    if getattr(op, "ewm_alpha", None) is not None:
+        return 1
+    if op in _ROW_OPERATORS or isinstance(op, np.ufunc):
+        return 1
+    if op is operator.getitem:
+        # 只支援以欄位名稱取出欄位，以布林序列篩選列會改變資料長度
+        key = args[1]
+        keys = key if isinstance(key, (list, tuple)) else [key]
+        return 1 if all(isinstance(k, str) for k in keys) else None
+    if op is _set_item:
+        return 1
+    if op is _set_indexed:
+        # 只支援整張表設值，例如 part.loc[:, :] = np.nan
+        key = args[2] if isinstance(args[2], tuple) else (args[2],)
+        return 1 if all(k == slice(None) for k in key) else None
+    if op is _call_method:
+        name = args[1]
+        if name == "fillna" and set(kwargs) - {"value"}:
+            return None
+        if name in _ROW_METHODS:
+            return 1
+        if name in ("shift", "diff") and not kwargs:
+            periods = args[2] if len(args) > 2 else 1
+            if isinstance(periods, int) and periods >= 0:
+                return periods + 1
+        if name in ("ffill", "pct_change") and len(args) == 2 and not kwargs:
+            return 1
+    return None
+
+
+def _ewm_alpha(op, args: tuple, kwargs: dict) -> float:
+    # 和 pandas 相同，alpha 先換算成 com 再換回來，確保浮點數結果一致
+    alpha = op.ewm_alpha(*args, **kwargs)
+    com = 1 / alpha - 1
+    return 1.0 / (1.0 + com)
+
+
+def _ewm_init(
+    cur: np.ndarray, output: np.ndarray, alpha: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    # 由完整計算的輸入與輸出，還原 ewm(adjust=False, ignore_na=False) 的遞迴狀態
+    cur = cur.astype(float)
+    weighted = output[-1].astype(float)
+    # 最後一筆觀測值之後，每遇到一筆遺失值，舊值的權重就再乘上一次 (1 - alpha)
+    trailing = np.cumprod(np.isnan(cur[::-1]), axis=0).sum(axis=0)
+    old_wt = np.ones(cur.shape[1])
+    for i in range(int(trailing.max(initial=0))):
+        old_wt = np.where(
+            np.isnan(weighted) | (trailing <= i), old_wt, old_wt * (1.0 - alpha)
+        )
+    return weighted, old_wt
+
+
+def _ewm_step(
+    state: Tuple[np.ndarray, np.ndarray], cur: np.ndarray, alpha: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    # 與 pandas ewm(adjust=False) 相同的遞迴式，逐筆延續指數平均
+    weighted, old_wt = state
+    cur = cur.astype(float)
+    observed = ~np.isnan(cur)
+    started = ~np.isnan(weighted)
+    old_wt = np.where(started, old_wt * (1.0 - alpha), old_wt)
+    mixed = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+    weighted = np.where(started & observed & (weighted != cur), mixed, weighted)
+    weighted = np.where(~started & observed, cur, weighted)
+    old_wt = np.where(started & observed, 1.0, old_wt)
+    return weighted, old_wt
+
+
+# 節點結果的欄位結構：columns 為 None 表示 Series；dtypes 只在各欄位型別不同時記錄
+_Layout = namedtuple("_Layout", ["columns", "name", "dtype", "dtypes"])
+
+
+def _layout(value) -> _Layout:
+    if isinstance(value, pd.Series):
+        dtype = value.dtype if isinstance(value.dtype, np.dtype) else np.dtype(object)
+        dtypes = None if dtype.kind in "biuf" else value.dtype
+        return _Layout(None, value.name, dtype, dtypes)
+    dtypes = value.dtypes
+    first = dtypes.iloc[0] if len(dtypes) else np.dtype(float)
+    if isinstance(first, np.dtype) and first.kind in "biuf" and (dtypes == first).all():
+        return _Layout(value.columns, None, first, None)
+    return _Layout(value.columns, None, np.dtype(object), dtypes)
+
+
+def _values(value, layout: _Layout) -> np.ndarray:
+    # 以 (列數, 欄位數) 的陣列表示節點結果，Series 視為一個欄位
+    values = value.to_numpy(dtype=layout.dtype)
+    return values.reshape(len(values), _width(layout))
+
+
+def _to_pandas(values: np.ndarray, layout: _Layout, index):
+    if layout.columns is None:
+        value = pd.Series(values[:, 0], index=index, name=layout.name)
+    else:
+        value = pd.DataFrame(values, index=index, columns=layout.columns)
+    return value if layout.dtypes is None else value.astype(layout.dtypes)
+
+
+def _width(layout: _Layout) -> int:
+    return 1 if layout.columns is None else len(layout.columns)
+
+
+def _align_plan(
+    out: _Layout, child: _Layout, fill=np.nan, broadcast: bool = False
+) -> Optional[Tuple[np.ndarray, object]]:
+    """
+    函式說明:
+    回傳子節點欄位對齊到節點結果欄位的方式：(欄位位置, 缺少的欄位補上的值)，
+    位置 -1 表示缺少的欄位，和 pandas 運算時依欄位名稱對齊相同；
+    欄位相同或不需要對齊時回傳 None。broadcast 表示時間序列以 axis=0 套用到每個欄位。
+    """
+    if out.columns is None or child.columns is None:
+        if out.columns is not None and not broadcast:
+            raise TypeError("資料表與時間序列的運算無法逐列計算")
+        return None
+    if child.columns.equals(out.columns):
+        return None
+    positions = child.columns.get_indexer(out.columns)
+    if (positions < 0).any() and np.isnan(fill) and child.dtype.kind not in "bf":
+        raise TypeError("非浮點數的欄位無法以遺失值補齊")
+    return positions, fill
+
+
+def _aligned(values: np.ndarray, plan: Optional[Tuple[np.ndarray, object]]):
+    if plan is None:
+        return values
+    positions, fill = plan
+    aligned = values[:, positions]
+    missing = positions < 0
+    if missing.any():
+        # 布林資料缺少的欄位以 NaN 補上時，先轉成浮點數(1.0/0.0)
+        if aligned.dtype.kind != "f" and np.isnan(fill):
+            aligned = aligned.astype(float)
+        aligned[:, missing] = fill
+    return aligned
+
+
+def _method_step(obj, name, *args, **kwargs):
+    return _METHOD_STEPS[name](obj, *args, **kwargs)
+
+
+def _set_item_step(obj, key, value):
+    return np.where(key, value, obj)
+
+
+def _set_indexed_step(obj, indexer, key, value):
+    return np.full(np.shape(obj), value)
+
+
+def _node_step(op, args: tuple):
+    # 節點以 numpy 陣列計算新的一列的函式，沒有對應的函式時回傳 None
+    if getattr(op, "step", None) is not None:
+        return op.step
+    if op in _ROW_OPERATORS or isinstance(op, np.ufunc):
+        return op
+    if op is _call_method and args[1] in _METHOD_STEPS:
+        return _method_step
+    if op is _set_item and isinstance(args[1], _NodeRef):
+        return _set_item_step
+    if op is _set_indexed:
+        return _set_indexed_step
+    return None
+
+
+def _node_kind(op, args: tuple) -> str:
+    # 依節點的運算方式分類，決定新增一筆資料時的計算方式
+    if op is None:
+        return "leaf"
+    if getattr(op, "ewm_alpha", None) is not None:
+        return "ewm"
+    if getattr(op, "running", None) is not None:
+        return "running"
+    if op is _call_method and args[1] in ("ffill", "pct_change"):
+        return args[1]
+    if op is operator.getitem:
+        return "getitem"
+    return "step" if _node_step(op, args) is not None else "pandas"
+
+
+def _resolve(obj, values):
+    # 將參數中的節點參照換成對應的資料
+    if isinstance(obj, _NodeRef):
+        return values[obj.nid]
+    if isinstance(obj, tuple):
+        return tuple(_resolve(item, values) for item in obj)
+    if isinstance(obj, list):
+        return [_resolve(item, values) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _resolve(v, values) for key, v in obj.items()}
+    return obj
+
+
+def _same_rows(computed: np.ndarray, expected: np.ndarray) -> bool:
+    if computed.shape != expected.shape:
+        return False
+    if expected.dtype.kind not in "biuf":
+        return False
+    return np.allclose(
+        computed.astype(float),
+        expected.astype(float),
+        rtol=1e-7,
+        atol=1e-9,
+        equal_nan=True,
+    )
+
+
+class _RowBuffer(object):
+    """
+    類別說明:
+    保存節點最近 rows 筆結果的環狀緩衝區。每一筆同時寫入前後兩半，
+    因此最近 n 筆永遠是連續的切片，取出視窗時不需要複製或重新排列資料。
+    """
+
+    def __init__(self, values: np.ndarray, rows: int):
+        tail = values[-rows:]
+        self.rows = rows
+        self.data = np.zeros((2 * rows, values.shape[1]), dtype=values.dtype)
+        if values.dtype.kind == "f":
+            self.data[:] = np.nan
+        self.data[rows - len(tail) : rows] = tail
+        self.data[2 * rows - len(tail) :] = tail
+        self.pos = 0
+
+    def push(self, row: np.ndarray):
+        self.data[self.pos] = row
+        self.data[self.pos + self.rows] = row
+        self.pos = (self.pos + 1) % self.rows
+
+    def last(self, n: int) -> np.ndarray:
+        end = self.pos + self.rows
+        return self.data[end - n : end]
+
+
+def _build_graph(alphas_cls: type, df_data, alpha_names: List[str]):
+    # 建立表達式圖；相同的類別、欄位結構與因子名稱每次都會得到相同的節點編號
+    graph = ExprGraph()
+    lazy_alphas = alphas_cls(graph.leaf(df_data))
+    roots, eager_names = {}, []
+    for name in alpha_names:
+        try:
+            expr = getattr(lazy_alphas, name)()
+        except Exception:
+            eager_names.append(name)
+            continue
+        if isinstance(expr, Expr):
+            roots[name] = expr._nid
+        else:
+            eager_names.append(name)
+    return graph, roots, eager_names
+
+
+class IncrementalAlphas(object):
+    """
+    類別說明:
+    增量計算 Alpha 因子的檢查點。以完整資料計算一次後，
+    每個中間結果只以 numpy 環狀緩衝區保留之後計算需要的最近幾筆資料(滾動視窗、排名視窗)，
+    滾動總和、平均、標準差、共變異數與相關係數保留和 pandas 相同的累計值(rolling_ops.RunningWindow)，
+    指數平均(Sma)、向前填補等運算則保留遞迴狀態；
+    之後每新增一天的資料，每個節點只以 numpy 陣列運算計算新的一列，結果與以完整資料重新計算相同。
+    每個節點的 numpy 運算在建立檢查點時以完整計算的結果驗證，
+    沒有 numpy 運算或驗證不一致的節點，改以 pandas 計算最近幾筆資料；
+    累計值不一致或無法增量計算的因子(例如使用整段資料的統計量)會保留完整的原始資料並重新計算。
+    """
+
+    def __init__(
+        self,
+        alphas_cls: Annotated[type, "Alpha 因子類別，例如 Alphas191"],
+        df_data: Annotated[pd.DataFrame, "建立 Alpha 因子類別所需的股票資料"],
+        alpha_names: Annotated[List[str], "要計算的 Alpha 方法名稱"],
+    ):
+        self.alphas_cls = alphas_cls
+        self.alpha_names = list(alpha_names)
+        # 讀取檢查點時，以相同欄位結構的空資料表重新建立表達式圖
+        self.template = df_data.iloc[:0]
+        graph, roots, eager_names = _build_graph(alphas_cls, df_data, alpha_names)
+        self._graph = graph
+
+        results, failed = self._initialize(df_data, roots)
+        eager_names += [name for name, nid in roots.items() if nid in failed]
+        self.roots = {name: nid for name, nid in roots.items() if nid not in failed}
+        self.eager_names = [name for name in self.alpha_names if name in eager_names]
+        self._prune()
+        self.rows = len(df_data)
+        self.last_index = df_data.index[-1]
+        # 需要完整重新計算的因子存在時，保留完整的原始資料
+        self.history = df_data if self.eager_names else None
+        self.initial_results = results
+        self._compile()
+
+    def _initialize(self, df_data, roots):
+        # 以完整資料計算一次，建立每個節點的緩衝區、對齊方式與遞迴狀態
+        graph = self._graph
+        active = set()
+        stack = list(roots.values())
+        while stack:
+            nid = stack.pop()
+            if nid not in active:
+                active.add(nid)
+                stack.extend(graph.children(nid))
+        uses = {nid: 0 for nid in active}
+        for nid in active:
+            for child in graph.children(nid):
+                uses[child] += 1
+        for nid in roots.values():
+            uses[nid] += 1
+
+        # 子節點需要保留的筆數，取所有上層節點需要的最大值
+        tail_rows = {nid: 1 for nid in active}
+        self.lookbacks, self.layouts, self.kinds = {}, {}, {}
+        self.aligns, self.positions = {}, {}
+        self.ewm_alphas, self.ewm_states, self.pad_states = {}, {}, {}
+        self.runnings, self.buffers = {}, {}
+        values, arrays, failed = {}, {}, set()
+        for nid in sorted(active):
+            op, args, kwargs = graph._nodes[nid]
+            children = graph.children(nid)
+            value = None
+            if op is None:
+                value = graph._leaves[nid]
+                self.lookbacks[nid] = 1
+                self.kinds[nid] = "leaf"
+            elif not children & failed:
+                try:
+                    value = self._init_node(nid, df_data, values, arrays)
+                except Exception:
+                    value = None
+            if value is None:
+                failed.add(nid)
+            else:
+                if nid not in self.layouts:
+                    self.layouts[nid] = _layout(value)
+                values[nid] = value
+                arrays[nid] = _values(value, self.layouts[nid])
+                for child in children:
+                    tail_rows[child] = max(tail_rows[child], self.lookbacks[nid])
+            # 上層節點都計算完畢後，只保留最近幾筆資料並釋放完整結果
+            for child in children:
+                uses[child] -= 1
+                if uses[child] == 0 and child in values:
+                    self.buffers[child] = _RowBuffer(arrays[child], tail_rows[child])
+                    values.pop(child)
+                    arrays.pop(child)
+        results = {
+            name: values[nid] for name, nid in roots.items() if nid not in failed
+        }
+        for nid in list(values):
+            self.buffers[nid] = _RowBuffer(arrays[nid], tail_rows[nid])
+        return results, failed
+
+    def _init_node(self, nid, df_data, values, arrays):
+        graph = self._graph
+        op, args, kwargs = graph._nodes[nid]
+        real_args, real_kwargs = _resolve(args, values), _resolve(kwargs, values)
+        value = op(*real_args, **real_kwargs)
+        # 結果必須是和原始資料等長的時間序列，才能逐列延續
+        if not isinstance(value, (pd.Series, pd.DataFrame)) or len(value) != len(
+            df_data
+        ):
+            raise TypeError("結果不是逐日的時間序列")
+        lookback = node_lookback(op, real_args, real_kwargs)
+        if lookback is None:
+            raise TypeError("無法逐列延續的運算")
+        layout = _layout(value)
+        self.lookbacks[nid], self.layouts[nid] = lookback, layout
+        output = _values(value, layout)
+
+        kind = _node_kind(op, args)
+        if kind == "ewm":
+            alpha = _ewm_alpha(op, real_args, real_kwargs)
+            self.ewm_alphas[nid] = alpha
+            self.ewm_states[nid] = _ewm_init(arrays[args[0].nid], output, alpha)
+        elif kind in ("ffill", "pct_change"):
+            # 保留向前填補後的最後一列，新的一列遇到遺失值時以它補上
+            filled = real_args[0].ffill()
+            # 布林與整數資料沒有遺失值，向前填補不會改變資料
+            if layout.dtype.kind not in "biuf":
+                raise TypeError("只支援數值資料的向前填補")
+            self.pad_states[nid] = _values(filled, layout)[-1].astype(float)
+        elif kind == "getitem":
+            # 以欄位位置取代欄位名稱：對欄位位置的資料表做相同的選取
+            child = self.layouts[args[0].nid]
+            if child.columns is None:
+                raise TypeError("只支援從資料表選取欄位")
+            probe = pd.DataFrame([np.arange(len(child.columns))], columns=child.columns)
+            self.positions[nid] = np.asarray(probe[args[1]]).reshape(-1)
+            selected = arrays[args[0].nid][-VERIFY_ROWS:, self.positions[nid]]
+            if not _same_rows(selected.astype(layout.dtype), output[-VERIFY_ROWS:]):
+                kind = "pandas"
+        elif kind == "running":
+            # 累計值從第一筆資料開始延續，最近幾筆資料無法重現，結果不一致時改為完整重新計算
+            if any(isinstance(v, _NodeRef) for v in kwargs.values()):
+                raise TypeError("累計值的資料參數必須以位置傳入")
+            refs = [arg.nid for arg in args if isinstance(arg, _NodeRef)]
+            self.aligns[nid] = {
+                child: _align_plan(layout, self.layouts[child]) for child in refs
+            }
+            running = op.running(*real_args, **real_kwargs)
+            tail = running.start(
+                *[_aligned(arrays[child], self.aligns[nid][child]) for child in refs],
+                tail=VERIFY_ROWS,
+            )
+            expected = output[-VERIFY_ROWS:]
+            if not _same_rows(
+                tail.reshape(expected.shape).astype(expected.dtype), expected
+            ):
+                raise ValueError("累計值的結果與完整計算不一致")
+            self.runnings[nid] = running
+            # 每新增一筆資料，需要移出視窗的舊資料
+            self.lookbacks[nid] = lookback + 1
+        elif kind == "step":
+            try:
+                # 以布林資料表設值時，缺少的欄位不設值；以 axis=0 運算時時間序列套用到每個欄位
+                key = args[1].nid if op is _set_item else None
+                broadcast = op is _call_method and kwargs.get("axis") in (0, "index")
+                self.aligns[nid] = {
+                    child: _align_plan(
+                        layout,
+                        self.layouts[child],
+                        fill=False if child == key else np.nan,
+                        broadcast=broadcast,
+                    )
+                    for child in graph.children(nid)
+                }
+                if not self._verify(nid, arrays, output):
+                    kind = "pandas"
+            except Exception:
+                kind = "pandas"
+        self.kinds[nid] = kind
+        return value
+
+    def _verify(self, nid, arrays, output) -> bool:
+        # 以完整計算的最後幾列，比對 numpy 逐列運算的結果
+        lookback, layout = self.lookbacks[nid], self.layouts[nid]
+        op, args, kwargs = self._graph._nodes[nid]
+        step = _node_step(op, args)
+        aligns = self.aligns[nid]
+        n = len(output)
+        for t in range(max(lookback - 1, n - VERIFY_ROWS), n):
+            windows = {
+                child: _aligned(arrays[child][t - lookback + 1 : t + 1], plan)
+                for child, plan in aligns.items()
+            }
+            with np.errstate(all="ignore"):
+                row = step(*_resolve(args, windows), **_resolve(kwargs, windows))
+            row = np.asarray(row).reshape(_width(layout)).astype(layout.dtype)
+            if not _same_rows(row[None], output[t : t + 1]):
+                return False
+        return True
+
+    def _prune(self):
+        # 只保留仍在使用的因子所需要的節點
+        active = set()
+        stack = list(self.roots.values())
+        while stack:
+            nid = stack.pop()
+            if nid not in active:
+                active.add(nid)
+                stack.extend(self._graph.children(nid))
+        self.order = sorted(active)
+        for name in (
+            "lookbacks",
+            "layouts",
+            "kinds",
+            "aligns",
+            "positions",
+            "ewm_alphas",
+            "ewm_states",
+            "pad_states",
+            "runnings",
+            "buffers",
+        ):
+            state = getattr(self, name)
+            setattr(self, name, {nid: v for nid, v in state.items() if nid in active})
+
+    def _compile(self):
+        # 為每個節點建立新增一筆資料時的計算函式(函式不存檔，讀取檢查點時重新建立)
+        self._steps = [(nid, self._row_function(nid)) for nid in self.order]
+
+    def _row_function(self, nid):
+        op, args, kwargs = self._graph._nodes[nid]
+        kind, layout = self.kinds[nid], self.layouts[nid]
+        lookback, buffers = self.lookbacks[nid], self.buffers
+        width, dtype = _width(layout), layout.dtype
+        fallback = self._pandas_function(nid)
+
+        if kind == "leaf":
+            return None
+        if kind == "getitem":
+            child, positions = buffers[args[0].nid], self.positions[nid]
+            return lambda position: child.last(1)[0, positions].astype(dtype)
+        if kind == "ewm":
+            child = buffers[args[0].nid]
+            alpha = self.ewm_alphas[nid]
+
+            def ewm_row(position):
+                state = _ewm_step(self.ewm_states[nid], child.last(1)[0], alpha)
+                self.ewm_states[nid] = state
+                return state[0]
+
+            return ewm_row
+        if kind in ("ffill", "pct_change"):
+            child = buffers[args[0].nid]
+
+            def pad_row(position):
+                cur = child.last(1)[0].astype(float)
+                previous = self.pad_states[nid]
+                filled = np.where(np.isnan(cur), previous, cur)
+                self.pad_states[nid] = filled
+                return filled if kind == "ffill" else filled / previous - 1
+
+            return pad_row
+        if kind == "running":
+            running, plans = self.runnings[nid], self.aligns[nid]
+            refs = [arg.nid for arg in args if isinstance(arg, _NodeRef)]
+
+            def running_row(position):
+                windows = [_aligned(buffers[c].last(lookback), plans[c]) for c in refs]
+                return running.update(*windows).reshape(width).astype(dtype)
+
+            return running_row
+        if kind == "pandas":
+            return fallback
+
+        step = _node_step(op, args)
+        aligns = [
+            (child, buffers[child], pos) for child, pos in self.aligns[nid].items()
+        ]
+
+        def step_row(position):
+            # 資料不足一個完整視窗時(最前面幾筆)，以 pandas 計算，保留運算子對開頭資料的處理
+            if position < lookback - 1:
+                return fallback(position)
+            windows = {
+                child: _aligned(buffer.last(lookback), plan)
+                for child, buffer, plan in aligns
+            }
+            row = step(*_resolve(args, windows), **_resolve(kwargs, windows))
+            return np.asarray(row).reshape(width).astype(dtype)
+
+        return step_row
+
+    def _pandas_function(self, nid):
+        # 以 pandas 計算最近 lookback 筆資料，取最後一列作為新的一列
+        op, args, kwargs = self._graph._nodes[nid]
+        lookback, layout = self.lookbacks[nid], self.layouts[nid]
+        children = self._graph.children(nid)
+
+        def pandas_row(position):
+            rows = min(lookback, position + 1)
+            index = pd.RangeIndex(rows)
+            frames = {
+                child: _to_pandas(
+                    self.buffers[child].last(rows), self.layouts[child], index
+                )
+                for child in children
+            }
+            value = op(*_resolve(args, frames), **_resolve(kwargs, frames))
+            return _values(value, layout)[-1]
+
+        return pandas_row
+
+    def append(
+        self,
+        new_data: Annotated[
+            pd.DataFrame, "新增的股票資料(一列或多列)，欄位與建立時相同"
+        ],
+    ) -> Annotated[
+        Tuple[Dict[str, object], Dict[str, Exception]],
+        "(各 Alpha 因子新增列的結果, 計算失敗的 Alpha 因子與錯誤)",
+    ]:
+        """
+        函式說明:
+        新增資料並只計算新增列的 Alpha 因子，同時更新檢查點。
+        多列資料會依序逐列延續，結果與以完整資料重新計算後取最後幾列相同。
+        新資料的欄位(例如股票清單)與建立檢查點時不同時拋出 ValueError，
+        此時需要以完整資料重新建立檢查點。
+        """
+        if not new_data.columns.equals(self.template.columns):
+            raise ValueError("新資料的欄位與檢查點不同，需要重新建立檢查點")
+        leaf_ids = [nid for nid in self.order if self.kinds[nid] == "leaf"]
+        leaf_rows = _values(new_data, self.layouts[leaf_ids[0]]) if leaf_ids else None
+        parts = {name: [] for name in self.roots}
+        with np.errstate(all="ignore"):
+            for i in range(len(new_data)):
+                position = self.rows
+                for nid, row_function in self._steps:
+                    if row_function is None:
+                        row = leaf_rows[i]
+                    else:
+                        row = row_function(position)
+                    self.buffers[nid].push(row)
+                for name, nid in self.roots.items():
+                    parts[name].append(self.buffers[nid].last(1)[0].copy())
+                self.rows += 1
+        if len(new_data):
+            self.last_index = new_data.index[-1]
+
+        results = {}
+        for name, nid in self.roots.items():
+            layout = self.layouts[nid]
+            rows = np.empty((0, _width(layout)), dtype=layout.dtype)
+            results[name] = _to_pandas(
+                np.vstack(parts[name]) if parts[name] else rows, layout, new_data.index
+            )
+
+        errors = {}
+        if self.eager_names:
+            self.history = pd.concat([self.history, new_data])
+            eager_alphas = self.alphas_cls(self.history)
+            for name in self.eager_names:
+                try:
+                    value = getattr(eager_alphas, name)()
+                    results[name] = value.iloc[len(value) - len(new_data) :]
+                except Exception as e:
+                    errors[name] = e
+        # 依照建立時的順序回傳
+        results = {name: results[name] for name in self.alpha_names if name in results}
+        return results, errors
+
+    def fallback_nodes(self) -> Annotated[int, "新增資料時仍以 pandas 計算的節點數量"]:
+        """
+        函式說明:
+        回傳沒有 numpy 逐列運算(或驗證不一致)、新增資料時改以 pandas 計算的節點數量。
+        """
+        return sum(kind == "pandas" for kind in self.kinds.values())
+
+    def save(self, path: Annotated[str, "檢查點檔案路徑"]):
+        """
+        函式說明:
+        將檢查點存成檔案。表達式圖與計算函式不會存檔，讀取時依因子類別重新建立，
+        節點編號相同，因此只需要保存各節點的緩衝區、對齊方式與遞迴狀態。
+        """
+        state = dict(self.__dict__)
+        state.pop("_graph")
+        state.pop("_steps")
+        state.pop("initial_results")
+        state["version"] = CHECKPOINT_VERSION
+        state["node_count"] = len(self._graph)
+        with open(path, "wb") as f:
+            pickle.dump(state, f)
+
+    @classmethod
+    def load(cls, path: Annotated[str, "檢查點檔案路徑"]) -> "IncrementalAlphas":
+        """
+        函式說明:
+        讀取 save 存下的檢查點，並以因子類別重新建立表達式圖。
+        若檢查點版本不同，或因子定義已改變(節點數量不同)，拋出 ValueError，
+        此時需要以完整資料重新建立檢查點。
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.pop("version", None) != CHECKPOINT_VERSION:
+            raise ValueError(f"檢查點版本不符，需要版本 {CHECKPOINT_VERSION}")
+        node_count = state.pop("node_count")
+        # 表達式圖只用來取得節點結構，葉節點只需要欄位結構相同的空資料表
+        graph, _, _ = _build_graph(
+            state["alphas_cls"], state["template"], state["alpha_names"]
+        )
+        if len(graph) != node_count:
+            raise ValueError("Alpha 因子的定義已改變，需要重新建立檢查點")
+        self = cls.__new__(cls)
+        self.__dict__.update(state)
+        self._graph = graph
+        self.initial_results = {}
+        self._compile()
+        return self
+
+
+def start_incremental(
+    alphas_cls: Annotated[type, "Alpha 因子類別，例如 Alphas191"],
+    df_data: Annotated[pd.DataFrame, "建立 Alpha 因子類別所需的股票資料"],
+    alpha_names: Annotated[List[str], "要計算的 Alpha 方法名稱"],
+) -> Annotated[
+    Tuple[IncrementalAlphas, Dict[str, object], Dict[str, Exception]],
+    "(增量計算的檢查點, 各 Alpha 因子的完整計算結果, 計算失敗的 Alpha 因子與錯誤)",
+]:
+    """
+    函式說明:
+    以完整資料計算一次所有 Alpha 因子並建立增量計算的檢查點。
+    之後每天只需呼叫檢查點的 append 傳入新的資料。
+    """
+    checkpoint = IncrementalAlphas(alphas_cls, df_data, alpha_names)
+    results = checkpoint.initial_results
+    checkpoint.initial_results = {}
+    errors = {}
+    if checkpoint.eager_names:
+        eager_alphas = alphas_cls(df_data)
+        for name in checkpoint.eager_names:
+            try:
+                results[name] = getattr(eager_alphas, name)()
+            except Exception as e:
+                errors[name] = e
+    results = {name: results[name] for name in alpha_names if name in results}
+    return checkpoint, results, errors
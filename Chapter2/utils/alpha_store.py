@@ -0,0 +1,245 @@
+# 載入需要的套件
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from typing_extensions import Annotated
+
+# 因子資料庫格式的版本，格式改變時遞增，避免以新程式讀寫不相容的舊資料
+STORE_VERSION = 1
+
+# 每個因子家族資料夾中記錄欄位與版本的檔案
+MANIFEST_FILE = "_manifest.json"
+
+
+def to_long(
+    frames: Annotated[
+        Dict[str, pd.DataFrame], "因子名稱 -> 因子值(索引是日期，欄位是股票代碼)"
+    ],
+) -> Annotated[pd.DataFrame, "索引為 (date, asset)、每個因子一個欄位的資料表"]:
+    """
+    函式說明:
+    將每個因子的寬表(日期 x 股票)轉為長表，索引為 (date, asset)，每個因子一個欄位，
+    也就是 Alphalens 使用的格式。欄位是多層索引時以最後一層作為股票代碼，
+    同一檔股票有多個欄位時，取第一個非遺失值。
+    """
+    columns = {}
+    for name, frame in frames.items():
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame()
+        assets = [str(c[-1]) if isinstance(c, tuple) else str(c) for c in frame.columns]
+        frame = frame.set_axis(assets, axis=1)
+        if frame.columns.has_duplicates:
+            frame = frame.T.groupby(level=0, sort=False).first().T
+        frame = frame.set_axis(pd.to_datetime(frame.index), axis=0)
+        frame.index.name = "date"
+        frame.columns.name = "asset"
+        columns[name] = frame.stack(future_stack=True).astype(np.float64)
+    if not columns:
+        return pd.DataFrame(
+            index=pd.MultiIndex.from_arrays(
+                [pd.DatetimeIndex([]), pd.Index([], dtype=object)],
+                names=["date", "asset"],
+            )
+        )
+    return pd.concat(columns, axis=1).sort_index()
+
+
+class AlphaStore(object):
+    """
+    類別說明:
+    以 Parquet 保存 Alpha 因子的資料庫，取代每個因子一個 csv 檔的存法。
+    資料依因子家族(例如 Alphas191)與年份分區存放於 {root}/{家族}/year={年份}/，
+    每列是一個 (date, asset)，每個因子一個欄位；
+    讀取時只讀需要的因子欄位，並將股票代碼與日期範圍的條件下推到檔案讀取。
+    每個家族的 _manifest.json 記錄格式版本、因子欄位與資料型別。
+    """
+
+    def __init__(self, root: Annotated[str, "資料庫根目錄"] = "alpha_store"):
+        self.root = root
+
+    def families(self) -> Annotated[List[str], "已存放的因子家族名稱"]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, MANIFEST_FILE))
+        )
+
+    def manifest(
+        self, family: Annotated[str, "因子家族名稱"]
+    ) -> Annotated[Optional[dict], "格式版本、因子欄位等描述資料，不存在時為 None"]:
+        path = os.path.join(self.root, family, MANIFEST_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != STORE_VERSION:
+            raise ValueError(
+                f"{family} 的格式版本為 {manifest.get('version')}，"
+                f"目前程式只支援版本 {STORE_VERSION}"
+            )
+        return manifest
+
+    def _schema(self, manifest: dict) -> pa.Schema:
+        dtype = pa.from_numpy_dtype(np.dtype(manifest["dtype"]))
+        return pa.schema(
+            [("date", pa.timestamp("ns")), ("asset", pa.string())]
+            + [(name, dtype) for name in manifest["alphas"]]
+        )
+
+    def _write_manifest(self, family: str, manifest: dict):
+        path = os.path.join(self.root, family, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def write(
+        self,
+        family: Annotated[str, "因子家族名稱，例如 Alphas191"],
+        alpha_data: Annotated[
+            pd.DataFrame,
+            "索引為 (date, asset)、每個因子一個欄位的資料表(to_long 的格式)",
+        ],
+        dtype: Annotated[str, "因子值的資料型別(只在建立家族時使用)"] = "float64",
+    ):
+        """
+        函式說明:
+        將因子資料寫入資料庫。新的 (date, asset) 直接新增一個檔案到對應年份的分區；
+        與既有資料重疊時，會把該年份的資料合併後重寫(新資料優先，新資料遺失的值保留原值)，
+        因此重新計算或補上新的因子欄位都不會產生重複的列。
+        """
+        manifest = self.manifest(family) or {
+            "version": STORE_VERSION,
+            "family": family,
+            "dtype": dtype,
+            "alphas": [],
+        }
+        alpha_data = alpha_data.reset_index()
+        alpha_data["date"] = pd.to_datetime(alpha_data["date"]).astype("datetime64[ns]")
+        alpha_data["asset"] = alpha_data["asset"].astype(str)
+        alphas = [c for c in alpha_data.columns if c not in ("date", "asset")]
+        manifest["alphas"] += [
+            name for name in alphas if name not in manifest["alphas"]
+        ]
+        schema = self._schema(manifest)
+
+        for year, part in alpha_data.groupby(alpha_data["date"].dt.year):
+            folder = os.path.join(self.root, family, f"year={year}")
+            old_files = (
+                [os.path.join(folder, f) for f in os.listdir(folder)]
+                if os.path.isdir(folder)
+                else []
+            )
+            part = part.set_index(["date", "asset"])
+            if old_files:
+                existing = (
+                    ds.dataset(old_files, schema=schema, format="parquet")
+                    .to_table(columns=["date", "asset"])
+                    .to_pandas()
+                )
+                keys = pd.MultiIndex.from_frame(existing)
+                if keys.isin(part.index).any():
+                    # 與既有資料重疊：合併整個年份的資料後重寫
+                    existing = (
+                        ds.dataset(old_files, schema=schema, format="parquet")
+                        .to_table()
+                        .to_pandas()
+                        .set_index(["date", "asset"])
+                    )
+                    part = part.combine_first(existing)
+                else:
+                    old_files = []
+            table = pa.Table.from_pandas(
+                part.reset_index()
+                .reindex(columns=schema.names)
+                .sort_values(["date", "asset"]),
+                schema=schema,
+                preserve_index=False,
+            )
+            os.makedirs(folder, exist_ok=True)
+            # 先寫新檔案再刪除舊檔案，寫入失敗時不會遺失原本的資料
+            ds.write_dataset(
+                table,
+                folder,
+                format="parquet",
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            for file in old_files:
+                os.remove(file)
+
+        manifest["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._write_manifest(family, manifest)
+
+    def query(
+        self,
+        family: Annotated[str, "因子家族名稱"],
+        alphas: Annotated[Optional[List[str]], "要讀取的因子，None 表示全部"] = None,
+        assets: Annotated[
+            Optional[List[str]], "要讀取的股票代碼，None 表示全部"
+        ] = None,
+        start: Annotated[Optional[str], "開始日期(包含)"] = None,
+        end: Annotated[Optional[str], "結束日期(包含)"] = None,
+    ) -> Annotated[
+        ds.Scanner, "尚未讀取資料的掃描器，呼叫 to_table() 或 to_batches() 才會讀取"
+    ]:
+        """
+        函式說明:
+        建立延遲讀取的查詢。只會讀取指定的因子欄位，
+        年份分區、日期與股票代碼的條件會下推到檔案讀取，不符合的檔案與資料列不會被讀入。
+        """
+        manifest = self.manifest(family)
+        if manifest is None:
+            raise KeyError(f"資料庫中沒有 {family} 的因子資料")
+        alphas = manifest["alphas"] if alphas is None else list(alphas)
+        missing = [name for name in alphas if name not in manifest["alphas"]]
+        if missing:
+            raise KeyError(f"{family} 中沒有這些因子: {missing}")
+
+        schema = self._schema(manifest).append(pa.field("year", pa.int32()))
+        dataset = ds.dataset(
+            os.path.join(self.root, family),
+            schema=schema,
+            format="parquet",
+            partitioning="hive",
+            exclude_invalid_files=True,
+            ignore_prefixes=[".", "_"],
+        )
+        conditions = []
+        if start is not None:
+            start = pd.Timestamp(start)
+            conditions += [ds.field("year") >= start.year, ds.field("date") >= start]
+        if end is not None:
+            end = pd.Timestamp(end)
+            conditions += [ds.field("year") <= end.year, ds.field("date") <= end]
+        if assets is not None:
+            conditions.append(ds.field("asset").isin([str(a) for a in assets]))
+        condition = None
+        for c in conditions:
+            condition = c if condition is None else condition & c
+        return dataset.scanner(columns=["date", "asset"] + alphas, filter=condition)
+
+    def read(
+        self,
+        family: Annotated[str, "因子家族名稱"],
+        alphas: Annotated[Optional[List[str]], "要讀取的因子，None 表示全部"] = None,
+        assets: Annotated[
+            Optional[List[str]], "要讀取的股票代碼，None 表示全部"
+        ] = None,
+        start: Annotated[Optional[str], "開始日期(包含)"] = None,
+        end: Annotated[Optional[str], "結束日期(包含)"] = None,
+    ) -> Annotated[pd.DataFrame, "索引為 (date, asset)、每個因子一個欄位的資料表"]:
+        """
+        函式說明:
+        執行 query 並轉為 Alphalens 使用的長表格式。
+        """
+        table = self.query(family, alphas, assets, start, end).to_table()
+        return table.to_pandas().set_index(["date", "asset"]).sort_index()
@@ -6,7 +6,52 @@ import time
 import traceback
 from multiprocessing import Pool
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from Chapter2.utils import alpha_graph, alpha_incremental, alpha_store, shared_panel
+
+# 子进程中的因子计算对象及其使用的共享内存(generate_alphas_shared 使用)
+_shared_stock = None
+_shared_memory = None
+
+
+def _init_shared_worker(cls, meta):
+    # 子进程启动时连接共享内存中的股票数据，每个子进程只实例化一次因子计算对象
+    global _shared_stock, _shared_memory
+    _shared_memory, stock_data = shared_panel.attach_panel(meta)
+    _shared_stock = cls(stock_data)
+
+
+# 股票日数据 csv 的中文列名与英文列名的对应关系
+STOCK_CSV_COLUMNS = {
+    "日期": "date",
+    "开盘": "open",
+    "收盘": "close",
+    "最高": "high",
+    "最低": "low",
+    "成交量": "volume",
+    "成交额": "amount",
+    "涨跌幅": "pctChg",
+    "换手率": "turnover",
+}
+
+# get_stocks_data 返回的列(不含 asset、date)
+STOCK_PANEL_FIELDS = [
+    "open",
+    "close",
+    "high",
+    "low",
+    "volume",
+    "amount",
+    "vwap",
+    "pctChg",
+    "turnover",
+    "benchmark_open",
+    "benchmark_close",
+]
 
 
 class Alphas(object):
@@ -14,19 +59,161 @@ class Alphas(object):
         pass
 
     @classmethod
-    def calc_alpha(cls, path, func, data):
+    def calc_alpha(cls, alpha_name, func, data):
+        # 计算单个因子，返回 (计算结果, 错误信息)，由主进程统一写入因子库
         try:
             t1 = time.time()
             res = func(data)
-            res.to_csv(path)
             t2 = time.time()
-            print(f"Factory {os.path.splitext(os.path.basename(path))[0]} time {t2-t1}")
+            print(f"Factory {alpha_name} time {t2-t1}")
+            return res, None
         except Exception as e:
-            print(f"generate {path} error!!!")
-            # traceback.print_exc()
+            print(f"generate {alpha_name} error!!! {e}")
+            traceback.print_exc()
+            return None, traceback.format_exc()
+
+    @classmethod
+    def save_alphas(cls, frames, year, store_path="alpha_store"):
+        # 把因子结果写入因子库 {store_path}/{类名}/year={年份}/，每个因子一列
+        # 计算时用到的前后一年数据只用于预热，只保存 year 当年的结果
+        alpha_data = alpha_store.to_long(frames)
+        dates = alpha_data.index.get_level_values("date")
+        alpha_data = alpha_data[dates.year == int(year)]
+        alpha_store.AlphaStore(store_path).write(cls.__name__, alpha_data)
+        return alpha_data
+
+    @classmethod
+    def calc_alpha_shared(cls, alpha_name):
+        # 在子进程中计算单个因子，以数组返回结果而不写文件
+        # 返回 (因子名, 数值, 索引, 列名, 错误信息)
+        try:
+            t1 = time.time()
+            res = getattr(cls, alpha_name)(_shared_stock)
+            if isinstance(res, pd.Series):
+                res = res.to_frame()
+            t2 = time.time()
+            print(f"Factory {alpha_name} time {t2-t1}")
+            return alpha_name, res.to_numpy(), res.index, res.columns, None
+        except Exception:
+            return alpha_name, None, None, None, traceback.format_exc()
+
+    @classmethod
+    def convert_stocks_csv_to_parquet(
+        cls, data_path="data_bfq", index_path="index", dataset_path="data_parquet"
+    ):
+        # 一次性把 data_bfq/ 下的股票 csv 和 index/ 下的指数 csv 转成 parquet
+        # 股票数据写成按年份分区的数据集 {dataset_path}/stocks/year=YYYY/，
+        # 指数数据写成 {dataset_path}/index/{代码}.parquet
+        list_all = []
+        for file in sorted(os.listdir(data_path)):
+            if not file.endswith(".csv"):
+                continue
+            df = pd.read_csv(f"{data_path}/{file}", dtype={"日期": str})
+            df = df.rename(columns=STOCK_CSV_COLUMNS)[list(STOCK_CSV_COLUMNS.values())]
+            df["asset"] = os.path.splitext(file)[0]
+            list_all.append(df)
+        df_all = pd.concat(list_all, ignore_index=True)
+        df_all["year"] = df_all["date"].str[:4].astype(int)
+        df_all = df_all.sort_values(["year", "asset", "date"], ignore_index=True)
+        ds.write_dataset(
+            pa.Table.from_pandas(df_all, preserve_index=False),
+            f"{dataset_path}/stocks",
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([("year", pa.int32())]), flavor="hive"
+            ),
+            existing_data_behavior="delete_matching",
+        )
+
+        os.makedirs(f"{dataset_path}/index", exist_ok=True)
+        for file in sorted(os.listdir(index_path)):
+            if not file.endswith(".csv"):
+                continue
+            df = pd.read_csv(f"{index_path}/{file}", dtype={"date": str})
+            df.to_parquet(
+                f"{dataset_path}/index/{os.path.splitext(file)[0]}.parquet",
+                index=False,
+            )
+
+    @classmethod
+    def get_stocks_data_parquet(
+        cls, year, list_assets, benchmark, dataset_path="data_parquet", dtype=np.float64
+    ):
+        # 从 convert_stocks_csv_to_parquet 生成的数据集读取股票日数据
+        # 按年份分区、日期和股票代码的过滤条件下推到 parquet 读取，只读需要的行
+        # 指数数据只读一次，按日期对齐后广播到每只股票，直接组装成透视后的面板
+        yer = int(year)
+        start_time = f"{yer-1}-01-01"
+        end_time = f"{yer+1}-01-01"
+
+        # 股票代码在数据集中以字符串保存，结果的列名还原为传入的代码
+        assets = {str(c): c for c in list_assets}
+        stock_fields = [c for c in STOCK_CSV_COLUMNS.values() if c != "date"]
+        table = ds.dataset(
+            f"{dataset_path}/stocks", format="parquet", partitioning="hive"
+        ).to_table(
+            columns=["date", "asset"] + stock_fields,
+            filter=(ds.field("year") >= yer - 1)
+            & (ds.field("year") <= yer + 1)
+            & (ds.field("date") >= start_time)
+            & (ds.field("date") <= end_time)
+            & ds.field("asset").isin(list(assets)),
+        )
+        df = table.to_pandas()
+
+        # 日期和股票代码转为面板的行号、列号
+        dates, date_idx = np.unique(df["date"].to_numpy(), return_inverse=True)
+        codes, asset_idx = np.unique(df["asset"].to_numpy(), return_inverse=True)
+        asset_labels = pd.Index([assets[c] for c in codes], name="asset")
+        order = asset_labels.argsort()
+        asset_idx = np.argsort(order)[asset_idx]
+        asset_labels = asset_labels[order]
+
+        shape = (len(dates), len(asset_labels))
+        present = np.zeros(shape, dtype=bool)
+        present[date_idx, asset_idx] = True
+
+        values = {field: df[field].to_numpy(dtype=np.float64) for field in stock_fields}
+        # 计算平均成交价
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values["vwap"] = values["amount"] / values["volume"] / 100
+        values["turnover"] = values["turnover"] / 100
+
+        bm_data = pd.read_parquet(
+            f"{dataset_path}/index/{benchmark}.parquet",
+            columns=["date", "open", "close"],
+            filters=[("date", ">=", start_time), ("date", "<=", end_time)],
+        ).set_index("date")
+        bm_data = bm_data.reindex(dates)
+
+        panel = np.empty((shape[0], len(STOCK_PANEL_FIELDS) * shape[1]), dtype=dtype)
+        for i, field in enumerate(STOCK_PANEL_FIELDS):
+            block = panel[:, i * shape[1] : (i + 1) * shape[1]]
+            if field.startswith("benchmark_"):
+                bm = bm_data[field[len("benchmark_") :]].to_numpy(dtype=np.float64)
+                block[:] = np.where(present, bm[:, None], np.nan)
+            else:
+                block[:] = np.nan
+                block[date_idx, asset_idx] = values[field]
+
+        columns = pd.MultiIndex.from_product(
+            [STOCK_PANEL_FIELDS, asset_labels], names=[None, "asset"]
+        )
+        return pd.DataFrame(
+            panel, index=pd.Index(dates, name="date"), columns=columns, copy=False
+        )
 
     @classmethod
-    def get_stocks_data(cls, year, list_assets, benchmark):
+    def get_stocks_data(
+        cls, year, list_assets, benchmark, dataset_path=None, dtype=np.float64
+    ):
+        # 指定 dataset_path 时从 parquet 数据集读取，否则逐个读取 csv 文件
+        # dtype 只用于 parquet 数据集，可选 np.float32 减少一半内存
+        if dataset_path is not None:
+            return cls.get_stocks_data_parquet(
+                year, list_assets, benchmark, dataset_path=dataset_path, dtype=dtype
+            )
+
         # list_assets,df_asserts = get_zz500_stocks(f'{year}-01-01')
         yer = int(year)
         start_time = f"{yer-1}-01-01"
@@ -67,19 +254,7 @@ class Alphas(object):
         df_all = pd.concat(list_all)
 
         # 修改列名
-        df_all = df_all.rename(
-            columns={
-                "日期": "date",
-                "开盘": "open",
-                "收盘": "close",
-                "最高": "high",
-                "最低": "low",
-                "成交量": "volume",
-                "成交额": "amount",
-                "涨跌幅": "pctChg",
-                "换手率": "turnover",
-            }
-        )
+        df_all = df_all.rename(columns=STOCK_CSV_COLUMNS)
         # 计算平均成交价
         df_all["vwap"] = df_all.amount / df_all.volume / 100
         df_all["turnover"] = df_all["turnover"] / 100
@@ -126,12 +301,77 @@ class Alphas(object):
             )
         )
 
+    @classmethod
+    def evaluate_alphas(
+        cls,
+        stock_data,
+        alpha_names=None,
+        max_cache_bytes=alpha_graph.DEFAULT_CACHE_BYTES,
+    ):
+        # 以表达式图一次计算多个因子，相同的中间结果(如 Delay(close, 1))只计算一次
+        # 返回 (因子名 -> 计算结果, 因子名 -> 错误)
+        if alpha_names is None:
+            alpha_names = cls.get_alpha_methods(cls)
+        return alpha_graph.evaluate_alphas(
+            cls, stock_data, alpha_names, max_cache_bytes=max_cache_bytes
+        )
+
+    @classmethod
+    def start_incremental(cls, stock_data, alpha_names=None):
+        # 以完整数据计算一次因子，并建立增量计算的检查点
+        # 之后每天调用 checkpoint.append(新一天的数据) 只计算新的一行
+        # 返回 (检查点, 因子名 -> 计算结果, 因子名 -> 错误)
+        if alpha_names is None:
+            alpha_names = cls.get_alpha_methods(cls)
+        return alpha_incremental.start_incremental(cls, stock_data, alpha_names)
+
+    @classmethod
+    def update_alphas_incremental(cls, stock_data, checkpoint_path):
+        # 读取检查点，只计算检查点之后新增日期的因子，再保存更新后的检查点
+        # 检查点不存在、因子定义已改变或历史数据的行数不同时，以完整数据重新建立检查点
+        # 假设已计算的历史数据不会再修改
+        # 返回 (因子名 -> 计算结果, 因子名 -> 错误)，沿用检查点时只包含新增日期
+        checkpoint = None
+        if os.path.exists(checkpoint_path):
+            try:
+                checkpoint = alpha_incremental.IncrementalAlphas.load(checkpoint_path)
+            except ValueError as e:
+                print(f"rebuild alpha checkpoint: {e}")
+        if (
+            checkpoint is not None
+            and checkpoint.alphas_cls is cls
+            and (stock_data.index <= checkpoint.last_index).sum() == checkpoint.rows
+        ):
+            try:
+                frames, errors = checkpoint.append(
+                    stock_data[stock_data.index > checkpoint.last_index]
+                )
+            except ValueError as e:
+                print(f"rebuild alpha checkpoint: {e}")
+                checkpoint = None
+        else:
+            checkpoint = None
+        if checkpoint is None:
+            checkpoint, frames, errors = cls.start_incremental(stock_data)
+        checkpoint.save(checkpoint_path)
+        return frames, errors
+
     @classmethod
     def generate_alpha_single(
-        cls, alpha_name, year, list_assets, benchmark, need_save=False
+        cls,
+        alpha_name,
+        year,
+        list_assets,
+        benchmark,
+        need_save=False,
+        dataset_path=None,
+        dtype=np.float64,
+        store_path="alpha_store",
     ):
         # 获取计算因子所需股票数据
-        stock_data = cls.get_stocks_data(year, list_assets, benchmark)
+        stock_data = cls.get_stocks_data(
+            year, list_assets, benchmark, dataset_path=dataset_path, dtype=dtype
+        )
 
         # 实例化因子计算的对象
         stock = cls(stock_data)
@@ -144,45 +384,97 @@ class Alphas(object):
         alpha_data = factor(stock)
 
         if need_save:
-            path = f"alphas/{cls.__name__}/{year}"
-            if not os.path.isdir(path):
-                os.makedirs(path)
-            alpha_data.to_csv(f"{path}/{alpha_name}.csv")
+            cls.save_alphas({alpha_name: alpha_data}, year, store_path=store_path)
 
         return alpha_data
 
     @classmethod
-    def generate_alphas(cls, year, list_assets, benchmark):
+    def generate_alphas_shared(cls, stock_data, processes=None):
+        # 股票数据只复制到共享内存一次，子进程直接读取，不必为每个任务序列化整份数据
+        # 返回 (因子名 -> 计算结果, 因子名 -> 错误信息)
+        shm, meta = shared_panel.publish_panel(stock_data)
+        methods = cls.get_alpha_methods(cls)
+        frames = {}
+        errors = {}
+        try:
+            with Pool(
+                processes or os.cpu_count(),
+                initializer=_init_shared_worker,
+                initargs=(cls, meta),
+            ) as pool:
+                for name, values, index, columns, error in pool.imap_unordered(
+                    cls.calc_alpha_shared, methods
+                ):
+                    if error is not None:
+                        print(f"generate {name} error!!!\n{error}")
+                        errors[name] = error
+                        continue
+                    frames[name] = pd.DataFrame(values, index=index, columns=columns)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        # 按因子顺序返回
+        frames = {name: frames[name] for name in methods if name in frames}
+        return frames, errors
+
+    @classmethod
+    def generate_alphas(
+        cls,
+        year,
+        list_assets,
+        benchmark,
+        use_shared_memory=False,
+        dataset_path=None,
+        dtype=np.float64,
+        store_path="alpha_store",
+        checkpoint_path=None,
+    ):
         t1 = time.time()
         # 获取计算因子所需股票数据
-        stock_data = cls.get_stocks_data(year, list_assets, benchmark)
+        stock_data = cls.get_stocks_data(
+            year, list_assets, benchmark, dataset_path=dataset_path, dtype=dtype
+        )
 
-        # 实例化因子计算的对象
-        stock = cls(stock_data)
+        if checkpoint_path is not None:
+            # 增量模式：只计算检查点之后新增日期的因子，因子库中已有的日期不必重写
+            frames, errors = cls.update_alphas_incremental(stock_data, checkpoint_path)
+        elif use_shared_memory:
+            # 共享内存模式：子进程直接读取共享内存中的股票数据
+            frames, errors = cls.generate_alphas_shared(stock_data)
+        else:
+            # 实例化因子计算的对象
+            stock = cls(stock_data)
 
-        # 因子计算结果的保存路径
-        path = f"alphas/{cls.__name__}/{year}"
+            # 创建线程池
+            count = os.cpu_count()
+            pool = Pool(count)
 
-        # 创建保存路径
-        if not os.path.isdir(path):
-            os.makedirs(path)
+            # 获取所有因子计算的方法
+            methods = cls.get_alpha_methods(cls)
 
-        # 创建线程池
-        count = os.cpu_count()
-        pool = Pool(count)
+            # 在线程池中计算所有alpha
+            tasks = {}
+            for m in methods:
+                factor = getattr(cls, m)
+                try:
+                    tasks[m] = pool.apply_async(cls.calc_alpha, (m, factor, stock))
+                except Exception as e:
+                    traceback.print_exc()
 
-        # 获取所有因子计算的方法
-        methods = cls.get_alpha_methods(cls)
+            pool.close()
+            pool.join()
 
-        # 在线程池中计算所有alpha
-        for m in methods:
-            factor = getattr(cls, m)
-            try:
-                pool.apply_async(cls.calc_alpha, (f"{path}/{m}.csv", factor, stock))
-            except Exception as e:
-                traceback.print_exc()
+            frames, errors = {}, {}
+            for m, task in tasks.items():
+                res, error = task.get()
+                if error is None:
+                    frames[m] = res
+                else:
+                    errors[m] = error
 
-        pool.close()
-        pool.join()
+        # 所有因子合并后写入因子库，每个因子一列
+        cls.save_alphas(frames, year, store_path=store_path)
         t2 = time.time()
-        print(f"Total time {t2-t1}")
+        print(f"Total time {t2-t1}, {len(errors)} alphas failed")
+        return errors
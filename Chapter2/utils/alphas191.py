@@ -5,38 +5,49 @@ import sys
 
 import numpy as np
 from numpy import log
-from scipy.stats import rankdata
 
 current_dir = os.path.dirname(os.path.abspath("__file__"))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 
+from Chapter2.utils import rolling_ops
+from Chapter2.utils.alpha_graph import lazy_operator
 from Chapter2.utils.alphas import Alphas
 
 # from datas import *
 
 
+@lazy_operator(lookback=1, step=lambda sr: np.log(sr))
 def Log(sr):
     # 自然对数函数
     return np.log(sr)
 
 
+@lazy_operator(lookback=1, step=lambda sr: rolling_ops.row_rank(sr[-1], method="min"))
 def Rank(sr):
     # 列-升序排序并转化成百分比
     return sr.rank(axis=1, method="min", pct=True)
 
 
+@lazy_operator(
+    lookback=lambda sr, period: period + 1, step=lambda sr, period: sr[-1] - sr[0]
+)
 def Delta(sr, period):
     # period日差分
     return sr.diff(period)
 
 
+@lazy_operator(lookback=lambda sr, period: period + 1, step=lambda sr, period: sr[0])
 def Delay(sr, period):
     # period阶滞后项
     return sr.shift(period)
 
 
+@lazy_operator(
+    lookback=lambda x, y, window: window,
+    running=lambda x, y, window: rolling_ops.RunningCorr(window, fill_value=0.0),
+)
 def Corr(x, y, window):
     # window日滚动相关系数
     # 当一个变量值为常量，另一个变量值可变化时，此时无法计算相关度，使用0 进行填充
@@ -46,72 +57,109 @@ def Corr(x, y, window):
     return r
 
 
+@lazy_operator(
+    lookback=lambda x, y, window: window,
+    running=lambda x, y, window: rolling_ops.RunningCov(window),
+)
 def Cov(x, y, window):
     # window日滚动协方差
     return x.rolling(window).cov(y)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    running=lambda sr, window: rolling_ops.RunningSum(window),
+)
 def Sum(sr, window):
     # window日滚动求和
     return sr.rolling(window).sum()
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: rolling_ops.last_prod(sr),
+)
 def Prod(sr, window):
     # window日滚动求乘积
-    return sr.rolling(window).apply(lambda x: np.prod(x))
+    return rolling_ops.ts_prod(sr, window)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    running=lambda sr, window: rolling_ops.RunningMean(window),
+)
 def Mean(sr, window):
     # window日滚动求均值
     return sr.rolling(window).mean()
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    running=lambda sr, window: rolling_ops.RunningStd(window),
+)
 def Std(sr, window):
     # window日滚动求标准差
     return sr.rolling(window).std()
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: rolling_ops.last_rank(sr),
+)
 def Tsrank(sr, window):
     # window日序列末尾值的顺位
-    return sr.rolling(window).apply(lambda x: rankdata(x)[-1])
+    return rolling_ops.ts_rank_last(sr, window)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window, step=lambda sr, window: rolling_ops.last_max(sr)
+)
 def Tsmax(sr, window):
     # window日滚动求最大值
     return sr.rolling(window).max()
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window, step=lambda sr, window: rolling_ops.last_min(sr)
+)
 def Tsmin(sr, window):
     # window日滚动求最小值
     return sr.rolling(window).min()
 
 
+@lazy_operator(lookback=1, step=lambda sr: np.sign(sr))
 def Sign(sr):
     # 符号函数
     return np.sign(sr)
 
 
+@lazy_operator(lookback=1, step=lambda sr1, sr2: np.maximum(sr1, sr2))
 def Max(sr1, sr2):
     return np.maximum(sr1, sr2)
 
 
+@lazy_operator(lookback=1, step=lambda sr1, sr2: np.minimum(sr1, sr2))
 def Min(sr1, sr2):
     return np.minimum(sr1, sr2)
 
 
+@lazy_operator(lookback=1, step=lambda sr: np.fmax.reduce(sr[-1]))
 def Rowmax(sr):
     return sr.max(axis=1)
 
 
+@lazy_operator(lookback=1, step=lambda sr: np.fmin.reduce(sr[-1]))
 def Rowmin(sr):
     return sr.min(axis=1)
 
 
+@lazy_operator(ewm_alpha=lambda sr, n, m: m / n)
 def Sma(sr, n, m):
     # sma均值
     return sr.ewm(alpha=m / n, adjust=False).mean()
 
 
+@lazy_operator(lookback=1, step=lambda sr: np.abs(sr))
 def Abs(sr):
     # 求绝对值
     return sr.abs()
@@ -122,44 +170,83 @@ def Sequence(n):
     return np.arange(1, n + 1)
 
 
+@lazy_operator(
+    lookback=lambda sr, x: len(x), step=lambda sr, x: rolling_ops.last_regbeta(sr, x)
+)
 def Regbeta(sr, x):
-    window = len(x)
-    return sr.rolling(window).apply(lambda y: np.polyfit(x, y, deg=1)[0])
+    # window日滚动对 x 回归的斜率
+    return rolling_ops.ts_regbeta(sr, x)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: rolling_ops.last_weighted_mean(
+        sr, np.arange(1, window + 1)
+    ),
+)
 def Decaylinear(sr, window):
     weights = np.array(range(1, window + 1))
-    sum_weights = np.sum(weights)
-    return sr.rolling(window).apply(lambda x: np.sum(weights * x) / sum_weights)
+    return rolling_ops.ts_weighted_mean(sr, weights)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: window - rolling_ops.last_argmin(sr),
+)
 def Lowday(sr, window):
-    return sr.rolling(window).apply(lambda x: len(x) - x.values.argmin())
+    return window - rolling_ops.ts_argmin(sr, window)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: window - rolling_ops.last_argmax(sr),
+)
 def Highday(sr, window):
-    return sr.rolling(window).apply(lambda x: len(x) - x.values.argmax())
+    return window - rolling_ops.ts_argmax(sr, window)
 
 
+@lazy_operator(
+    lookback=lambda sr, window: window,
+    step=lambda sr, window: rolling_ops.last_weighted_mean(
+        sr, np.power(0.9, np.arange(window - 1, -1, -1))
+    ),
+)
 def Wma(sr, window):
     weights = np.array(range(window - 1, -1, -1))
     weights = np.power(0.9, weights)
-    sum_weights = np.sum(weights)
-
-    return sr.rolling(window).apply(lambda x: np.sum(weights * x) / sum_weights)
+    return rolling_ops.ts_weighted_mean(sr, weights)
 
 
+@lazy_operator(
+    lookback=lambda cond, window: window,
+    step=lambda cond, window: rolling_ops.last_sum(cond),
+)
 def Count(cond, window):
-    return cond.rolling(window).apply(lambda x: x.sum())
+    return rolling_ops.rolling_apply(cond, window, lambda x: x.sum(axis=-1))
+
+
+def _sumif_values(sr, cond):
+    # 不满足条件的值记为 0，供 Sumif 的增量计算使用
+    # 对齐后缺少的条件为 NaN，与 sr[~cond] = 0 相同保留原值
+    return np.where(cond == 0, 0, sr)
 
 
+@lazy_operator(
+    lookback=lambda sr, window, cond: window,
+    running=lambda sr, window, cond: rolling_ops.RunningSum(
+        window, transform=_sumif_values
+    ),
+)
 def Sumif(sr, window, cond):
+    # 在复本上修改，不改动传入的数据
+    sr = sr.copy()
     sr[~cond] = 0
     return sr.rolling(window).sum()
 
 
+@lazy_operator(lookback=2, step=lambda df: df[-1] / df[0] - 1)
 def Returns(df):
-    return df.rolling(2).apply(lambda x: x.iloc[-1] / x.iloc[0]) - 1
+    return df / df.shift(1) - 1
 
 
 class Alphas191(Alphas):
@@ -0,0 +1,180 @@
+# 載入需要的套件
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from typing_extensions import Annotated
+
+
+def compute_forward_returns(
+    prices: Annotated[pd.DataFrame, "收盤價資料表，索引是日期，欄位是股票代碼"],
+    periods: Annotated[Sequence[int], "持有期間(交易日數)"] = (1, 5, 10),
+) -> Annotated[Dict[int, pd.DataFrame], "持有期間 -> 未來報酬(日期 x 股票)"]:
+    """
+    函式說明:
+    一次計算所有持有期間的未來報酬，第 t 天的值是 t 到 t+period 的報酬，
+    與 Alphalens 的 compute_forward_returns 相同。所有因子共用這份結果。
+    """
+    return {
+        period: prices.pct_change(period, fill_method=None).shift(-period)
+        for period in periods
+    }
+
+
+def _rank_rows(values: np.ndarray) -> np.ndarray:
+    # 每列(每個交易日)的橫截面排名，相同數值取平均排名，遺失值維持 NaN
+    return pd.DataFrame(values).rank(axis=1).to_numpy()
+
+
+def _row_corr(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # 每列(每個交易日)兩組數值的相關係數，只使用兩者都不是遺失值的股票
+    mask = ~(np.isnan(a) | np.isnan(b))
+    count = mask.sum(axis=1)
+    a = np.where(mask, a, 0.0)
+    b = np.where(mask, b, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        a = np.where(mask, a - a.sum(axis=1, keepdims=True) / count[:, None], 0.0)
+        b = np.where(mask, b - b.sum(axis=1, keepdims=True) / count[:, None], 0.0)
+        corr = (a * b).sum(axis=1) / np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+    corr[count < 2] = np.nan
+    return corr
+
+
+def _centered_ranks(ranks: np.ndarray) -> np.ndarray:
+    # 排名減去每日平均排名 (n+1)/2(相同數值取平均排名時平均值不變)，遺失值設為 0
+    count = (~np.isnan(ranks)).sum(axis=1, keepdims=True)
+    return np.nan_to_num(ranks - (count + 1) / 2)
+
+
+def _rank_ic(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # 兩組遺失值位置相同的排名(已減去平均)逐日的相關係數，即 Spearman 相關係數
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (a * b).sum(axis=1) / np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+
+
+def _masked_ranks(
+    base_ranks: np.ndarray, values: np.ndarray, mask: np.ndarray, base_mask: np.ndarray
+) -> np.ndarray:
+    # 只使用 mask 以外的股票重新排名。大部分交易日的遺失值位置和 base_mask 相同，
+    # 直接使用事先算好的排名，只重新排名遺失值位置不同的交易日
+    ranks = base_ranks.copy()
+    # 整天都是遺失值(例如因子的暖機期間)不需要排名
+    empty = mask.all(axis=1)
+    ranks[empty] = np.nan
+    changed = (mask != base_mask).any(axis=1) & ~empty
+    if changed.any():
+        ranks[changed] = _rank_rows(np.where(mask[changed], np.nan, values[changed]))
+    return ranks
+
+
+def _quantile_labels(ranks: np.ndarray, quantiles: int) -> np.ndarray:
+    # 依每日排名把股票平均分成 quantiles 組(1 為因子值最小的一組)，遺失值為 0
+    count = (~np.isnan(ranks)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        labels = np.floor((ranks - 1) * quantiles / count) + 1
+    return np.nan_to_num(labels, nan=0).astype(int)
+
+
+def _nanmean(values: np.ndarray) -> float:
+    # 忽略遺失值的平均，全部是遺失值時回傳 NaN(不產生警告)
+    values = values[~np.isnan(values)]
+    return values.mean() if len(values) else np.nan
+
+
+def _summarize_ic(ic: np.ndarray) -> Dict[str, float]:
+    ic = ic[~np.isnan(ic)]
+    if len(ic) < 2:
+        return dict.fromkeys(
+            ["ic_mean", "ic_std", "ic_ir", "ic_t", "ic_positive_ratio"], np.nan
+        )
+    mean, std = ic.mean(), ic.std(ddof=1)
+    return {
+        "ic_mean": mean,
+        "ic_std": std,
+        "ic_ir": mean / std if std > 0 else np.nan,
+        "ic_t": mean / std * np.sqrt(len(ic)) if std > 0 else np.nan,
+        "ic_positive_ratio": (ic > 0).mean(),
+    }
+
+
+def screen_factors(
+    factor_data: Annotated[
+        pd.DataFrame, "因子資料，索引為 (日期, 股票代碼)，每個因子一個欄位"
+    ],
+    prices: Annotated[pd.DataFrame, "收盤價資料表，索引是日期，欄位是股票代碼"],
+    periods: Annotated[Sequence[int], "持有期間(交易日數)，第一個期間用於排序"] = (
+        1,
+        5,
+        10,
+    ),
+    quantiles: Annotated[int, "分組數量"] = 5,
+    sort_by: Annotated[
+        Optional[str], "排序依據的欄位(取絕對值)，預設為第一個期間的 IC IR"
+    ] = None,
+) -> Annotated[pd.DataFrame, "每個因子一列的篩選結果，依 sort_by 的絕對值由大到小排序"]:
+    """
+    函式說明:
+    一次篩選大量因子，取代每個因子各畫一份 Alphalens 報表。
+    未來報酬只計算一次，每個因子以矩陣運算逐日計算：
+    1. Spearman IC(因子排名與未來報酬排名的相關係數)，以及不同持有期間的 IC(IC 衰減)
+    2. 最高分組與最低分組未來報酬的差(分組報酬價差)
+    3. 最高分組的換手率與因子排名的自我相關(因子穩定度)
+    與 Alphalens 相同，只使用因子值與所有期間未來報酬都不是遺失值的資料；
+    分組以每日排名平均分組(相同數值分在同一組)，和 Alphalens 的 qcut 可能略有差異。
+    篩選後再對排名前面的因子畫完整的 Alphalens 報表即可。
+    """
+    periods = list(periods)
+    factor_names = list(factor_data.columns)
+    wide = factor_data.unstack(level=-1)
+    dates = wide.index.intersection(prices.index)
+    assets = wide.columns.levels[-1].intersection(prices.columns)
+
+    forward_returns = {
+        period: returns.reindex(index=dates, columns=assets).to_numpy(dtype=float)
+        for period, returns in compute_forward_returns(prices, periods).items()
+    }
+    # 任一期間的未來報酬是遺失值的資料都不使用
+    invalid_returns = np.logical_or.reduce(
+        [np.isnan(returns) for returns in forward_returns.values()]
+    )
+    # 未來報酬的排名只算一次，各因子只重新排名因子遺失值位置不同的交易日
+    return_ranks = {
+        period: _rank_rows(np.where(invalid_returns, np.nan, returns))
+        for period, returns in forward_returns.items()
+    }
+
+    rows = []
+    for name in factor_names:
+        values = wide[name].reindex(index=dates, columns=assets).to_numpy(dtype=float)
+        values[invalid_returns] = np.nan
+        mask = np.isnan(values)
+        ranks = _rank_rows(values)
+        centered = _centered_ranks(ranks)
+        row = {"factor": name, "coverage": (~mask).mean()}
+        for period, returns in forward_returns.items():
+            masked = _masked_ranks(return_ranks[period], returns, mask, invalid_returns)
+            ic = _rank_ic(centered, _centered_ranks(masked))
+            for key, value in _summarize_ic(ic).items():
+                row[f"{key}_{period}D"] = value
+
+        labels = _quantile_labels(ranks, quantiles)
+        top, bottom = labels == quantiles, labels == 1
+        for period, returns in forward_returns.items():
+            returns = np.where(mask, 0.0, returns)
+            with np.errstate(invalid="ignore"):
+                spread = (returns * top).sum(axis=1) / top.sum(axis=1) - (
+                    returns * bottom
+                ).sum(axis=1) / bottom.sum(axis=1)
+            row[f"quantile_spread_{period}D"] = _nanmean(spread)
+
+        # 最高分組中，今天新進入(昨天不在最高分組)的股票比例
+        with np.errstate(invalid="ignore"):
+            turnover = 1 - (top[1:] & top[:-1]).sum(axis=1) / top[1:].sum(axis=1)
+        row["top_quantile_turnover"] = _nanmean(turnover)
+        row["rank_autocorrelation"] = _nanmean(_row_corr(ranks[1:], ranks[:-1]))
+        rows.append(row)
+
+    summary = pd.DataFrame(rows).set_index("factor")
+    sort_by = sort_by or f"ic_ir_{periods[0]}D"
+    order = summary[sort_by].abs().sort_values(ascending=False, na_position="last")
+    return summary.loc[order.index]
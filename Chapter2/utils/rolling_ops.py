@@ -0,0 +1,529 @@
+# 載入需要的套件
+from typing import Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from typing_extensions import Annotated
+
+# 每次最多處理的視窗數量(時間長度)，用來限制比較運算產生的暫存陣列大小
+WINDOW_CHUNK_ROWS = 512
+
+
+def _rank_last_kernel(windows):
+    last = windows[..., -1:]
+    return (windows < last).sum(axis=-1) + ((windows == last).sum(axis=-1) + 1) / 2
+
+
+def _prod_kernel(windows):
+    return np.prod(windows, axis=-1)
+
+
+def _argmax_kernel(windows):
+    return np.argmax(windows, axis=-1)
+
+
+def _argmin_kernel(windows):
+    return np.argmin(windows, axis=-1)
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def _dot_kernel(weights):
+    # 與原本 decay_linear 逐列 np.dot(x.T, y) 相同使用 BLAS 矩陣乘法，結果與其逐位元相同
+    return lambda windows: windows @ weights
+
+
+def _slope_weights(x):
+    x = np.asarray(x, dtype=float)
+    x_centered = x - x.mean()
+    return x_centered / (x_centered**2).sum()
+
+
+def rolling_apply(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料，索引是日期"],
+    window: Annotated[int, "滾動視窗長度"],
+    kernel: Annotated[
+        Callable[[np.ndarray], np.ndarray],
+        "視窗運算函式，輸入形狀為 (視窗數, 欄位數, window)，沿最後一軸計算",
+    ],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "與輸入相同型態與索引的運算結果"]:
+    """
+    函式說明:
+    以 sliding_window_view 建立所有滾動視窗的唯讀檢視(不複製資料)，
+    再以向量化的 kernel 一次計算所有視窗，取代 rolling().apply() 每個視窗呼叫一次 Python 函式。
+    和 rolling(window).apply() 相同，前 window-1 筆以及視窗內含有遺失值的結果都是 NaN。
+    """
+    values = sr.to_numpy(dtype=float)
+    # 統一為逐列(row-major)排列：BLAS 矩陣乘法的累加順序和記憶體排列有關，
+    # 固定排列後結果不受 pandas 內部的資料排列影響，也和 window_dot 逐列計算的結果相同
+    values_2d = np.ascontiguousarray(values.reshape(len(values), -1))
+    result = np.full(values_2d.shape, np.nan)
+    if len(values_2d) >= window:
+        windows = sliding_window_view(values_2d, window, axis=0)
+        # 以累積遺失值數量計算每個視窗內是否有遺失值
+        nan_count = np.concatenate(
+            [np.zeros((1, values_2d.shape[1])), np.cumsum(np.isnan(values_2d), axis=0)]
+        )
+        has_nan = (nan_count[window:] - nan_count[:-window]) > 0
+        # 含有遺失值的視窗稍後會被設為 NaN，這裡先忽略其運算產生的警告
+        with np.errstate(invalid="ignore"):
+            for start in range(0, len(windows), WINDOW_CHUNK_ROWS):
+                stop = start + WINDOW_CHUNK_ROWS
+                result[window - 1 + start : window - 1 + stop] = kernel(
+                    windows[start:stop]
+                )
+        result[window - 1 :][has_nan] = np.nan
+    if isinstance(sr, pd.Series):
+        return pd.Series(result[:, 0], index=sr.index, name=sr.name)
+    return pd.DataFrame(result, index=sr.index, columns=sr.columns)
+
+
+def ts_rank_last(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料"],
+    window: Annotated[int, "滾動視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗中最後一個值的排名"]:
+    """
+    函式說明:
+    計算每個視窗中最後一個值在視窗內的排名(1~window)，相同數值取平均排名，
+    結果與 rolling(window).apply(lambda x: rankdata(x)[-1]) 相同。
+    """
+    return rolling_apply(sr, window, _rank_last_kernel)
+
+
+def ts_prod(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料"],
+    window: Annotated[int, "滾動視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗內數值的乘積"]:
+    """
+    函式說明:
+    計算每個視窗內數值的乘積，結果與 rolling(window).apply(np.prod) 相同。
+    """
+    return rolling_apply(sr, window, _prod_kernel)
+
+
+def ts_weighted_mean(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料"],
+    weights: Annotated[np.ndarray, "權重，由最舊到最新排列，長度即為視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗內的加權平均"]:
+    """
+    函式說明:
+    以權重(weights)計算每個視窗的加權平均，權重會先正規化為總和 1，
+    可用於線性衰減加權(decay linear)與指數衰減加權(WMA)。
+    """
+    weights = _normalized(weights)
+    return rolling_apply(sr, len(weights), _dot_kernel(weights))
+
+
+def ts_argmax(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料"],
+    window: Annotated[int, "滾動視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗內最大值的位置(0 起算)"]:
+    """
+    函式說明:
+    計算每個視窗內最大值的位置(由最舊的值 0 起算，相同數值取最早出現者)，
+    結果與 rolling(window).apply(np.argmax) 相同。
+    """
+    return rolling_apply(sr, window, _argmax_kernel)
+
+
+def ts_argmin(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料"],
+    window: Annotated[int, "滾動視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗內最小值的位置(0 起算)"]:
+    """
+    函式說明:
+    計算每個視窗內最小值的位置(由最舊的值 0 起算，相同數值取最早出現者)，
+    結果與 rolling(window).apply(np.argmin) 相同。
+    """
+    return rolling_apply(sr, window, _argmin_kernel)
+
+
+def ts_regbeta(
+    sr: Annotated[Union[pd.Series, pd.DataFrame], "時間序列資料(迴歸的 y)"],
+    x: Annotated[np.ndarray, "迴歸的自變數，長度即為視窗長度"],
+) -> Annotated[Union[pd.Series, pd.DataFrame], "視窗內 y 對 x 線性迴歸的斜率"]:
+    """
+    函式說明:
+    計算每個視窗內 y 對固定自變數 x 的最小平方法斜率，
+    結果與 rolling(window).apply(lambda y: np.polyfit(x, y, deg=1)[0]) 相同。
+    """
+    slope_weights = _slope_weights(x)
+    return rolling_apply(sr, len(x), _dot_kernel(slope_weights))
+
+
+# 以下函式只計算最新一個視窗的結果，供增量計算(alpha_incremental)逐日更新使用。
+# 輸入為最近 window 筆資料，形狀為 (window, 欄位數)，由舊到新排列，
+# 回傳最新一筆的結果，形狀為 (欄位數,)；和對應的滾動運算相同，視窗內有遺失值時結果為 NaN。
+
+
+def window_apply(
+    window: Annotated[np.ndarray, "最近 window 筆資料，形狀為 (window, 欄位數)"],
+    kernel: Annotated[
+        Callable[[np.ndarray], np.ndarray], "與 rolling_apply 相同的視窗運算函式"
+    ],
+) -> Annotated[np.ndarray, "最新一個視窗的運算結果"]:
+    """
+    函式說明:
+    以 rolling_apply 使用的 kernel 計算單一視窗，結果與 rolling_apply 的最後一列相同。
+    """
+    values = np.asarray(window, dtype=float)
+    with np.errstate(invalid="ignore"):
+        result = np.asarray(kernel(values.T[None]), dtype=float)[0]
+    result[np.isnan(values).any(axis=0)] = np.nan
+    return result
+
+
+def last_rank(window: np.ndarray) -> np.ndarray:
+    # 與 ts_rank_last 相同
+    return window_apply(window, _rank_last_kernel)
+
+
+def last_prod(window: np.ndarray) -> np.ndarray:
+    # 與 ts_prod 相同
+    return window_apply(window, _prod_kernel)
+
+
+def last_argmax(window: np.ndarray) -> np.ndarray:
+    # 與 ts_argmax 相同
+    return window_apply(window, _argmax_kernel)
+
+
+def last_argmin(window: np.ndarray) -> np.ndarray:
+    # 與 ts_argmin 相同
+    return window_apply(window, _argmin_kernel)
+
+
+def window_dot(
+    window: Annotated[np.ndarray, "最近 window 筆資料，形狀為 (window, 欄位數)"],
+    weights: Annotated[np.ndarray, "長度為 window 的權重"],
+) -> Annotated[np.ndarray, "最新一個視窗的加權總和"]:
+    """
+    函式說明:
+    以 np.dot(window.T, weights) 計算單一視窗的加權總和，和 rolling_apply 的 _dot_kernel
+    使用相同的 BLAS 運算，結果與整段計算的最後一列逐位元相同。
+    (以 window_apply 建立的 (1, 欄位數, window) 陣列做矩陣乘法時，BLAS 的累加順序不同，
+    結果會有約 1e-18 的差異)
+    """
+    values = np.ascontiguousarray(window, dtype=float)
+    with np.errstate(invalid="ignore"):
+        result = np.dot(values.T, weights)
+    result[np.isnan(values).any(axis=0)] = np.nan
+    return result
+
+
+def last_weighted_mean(window: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # 與 ts_weighted_mean 相同
+    return window_dot(window, _normalized(weights))
+
+
+def last_regbeta(window: np.ndarray, x: np.ndarray) -> np.ndarray:
+    # 與 ts_regbeta 相同
+    return window_dot(window, _slope_weights(x))
+
+
+def last_sum(window: np.ndarray) -> np.ndarray:
+    # 視窗內的總和，例如條件成立的天數(與 rolling_apply 以 sum 計算的結果相同)
+    return np.asarray(window, dtype=float).sum(axis=0)
+
+
+def last_max(window: np.ndarray) -> np.ndarray:
+    # 與 rolling(window).max() 相同
+    return np.asarray(window, dtype=float).max(axis=0)
+
+
+def last_min(window: np.ndarray) -> np.ndarray:
+    # 與 rolling(window).min() 相同
+    return np.asarray(window, dtype=float).min(axis=0)
+
+
+def row_rank(
+    values: Annotated[np.ndarray, "同一天各欄位的數值，形狀為 (欄位數,)"],
+    method: Annotated[str, "相同數值的排名方式：min 或 average"] = "average",
+) -> Annotated[np.ndarray, "百分比排名，遺失值的排名為 NaN"]:
+    """
+    函式說明:
+    計算同一天各欄位的百分比排名，結果與 DataFrame.rank(axis=1, method=method, pct=True)
+    的一列相同；排名除以當天非遺失值的數量。
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    ordered = np.sort(values[valid])
+    below = np.searchsorted(ordered, values, side="left").astype(float)
+    if method == "min":
+        ranks = below + 1
+    elif method == "average":
+        ranks = (below + 1 + np.searchsorted(ordered, values, side="right")) / 2
+    else:
+        raise ValueError(f"不支援的排名方式: {method}")
+    return np.where(valid, ranks / valid.sum(), np.nan)
+
+
+# 以下類別以逐筆加入、移出視窗的累計值(running sums)延續 pandas 的滾動總和、平均、變異數、
+# 共變異數與相關係數，供增量計算使用。pandas 以 Kahan 補償累加與 Welford 演算法
+# 從第一筆資料開始逐筆更新累計值，結果的浮點數誤差和整段歷史資料有關，
+# 只用最近一個視窗重新計算會有極小的差異，經過橫截面排名後可能放大成不同的順序；
+# 這裡以相同的更新順序與公式逐欄向量化計算，結果與 pandas 完全相同。
+
+
+def _prep(values):
+    # 與 pandas 的滾動運算相同：轉成浮點數，無限大視為遺失值
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isinf(values), np.nan, values)
+
+
+class _RunningSum(object):
+    """
+    類別說明:
+    與 pandas roll_sum、roll_mean 相同的 Kahan 補償累加狀態，每個欄位各自累加。
+    遺失值不更新狀態，因此以 np.copyto(where=ok) 只更新非遺失值的欄位。
+    """
+
+    def __init__(self, first: np.ndarray):
+        self.nobs, self.neg_ct, self.same = (np.zeros(first.shape) for _ in range(3))
+        self.sum_x, self.comp_add, self.comp_remove = (
+            np.zeros(first.shape) for _ in range(3)
+        )
+        self.prev = first.copy()
+
+    def add(self, val: np.ndarray):
+        ok = val == val
+        y = val - self.comp_add
+        t = self.sum_x + y
+        np.copyto(self.comp_add, t - self.sum_x - y, where=ok)
+        np.copyto(self.sum_x, t, where=ok)
+        self.nobs += ok
+        self.neg_ct += ok & np.signbit(val)
+        # 記錄連續相同數值的筆數，全部相同時直接回傳該數值，避免浮點數誤差
+        np.copyto(self.same, np.where(val == self.prev, self.same + 1, 1), where=ok)
+        np.copyto(self.prev, val, where=ok)
+
+    def remove(self, val: np.ndarray):
+        ok = val == val
+        y = -val - self.comp_remove
+        t = self.sum_x + y
+        np.copyto(self.comp_remove, t - self.sum_x - y, where=ok)
+        np.copyto(self.sum_x, t, where=ok)
+        self.nobs -= ok
+        self.neg_ct -= ok & np.signbit(val)
+
+    def total(self, minp: int) -> np.ndarray:
+        result = np.where(self.same >= self.nobs, self.prev * self.nobs, self.sum_x)
+        if minp == 0:
+            return np.where(self.nobs == 0, 0.0, result)
+        return np.where(self.nobs >= minp, result, np.nan)
+
+    def mean(self, minp: int) -> np.ndarray:
+        result = self.sum_x / self.nobs
+        result[(self.neg_ct == 0) & (result < 0)] = 0.0
+        result[(self.neg_ct == self.nobs) & (result > 0)] = 0.0
+        np.copyto(result, self.prev, where=self.same >= self.nobs)
+        result[(self.nobs < minp) | (self.nobs == 0)] = np.nan
+        return result
+
+
+class _RunningVar(object):
+    """
+    類別說明:
+    與 pandas roll_var 相同的 Welford 演算法狀態(Kahan 補償)，每個欄位各自累加。
+    """
+
+    def __init__(self, first: np.ndarray):
+        self.nobs, self.mean_x, self.ssqdm_x = (np.zeros(first.shape) for _ in range(3))
+        self.comp_add, self.comp_remove, self.same = (
+            np.zeros(first.shape) for _ in range(3)
+        )
+        self.prev = first.copy()
+
+    def add(self, val: np.ndarray):
+        ok = val == val
+        self.nobs += ok
+        np.copyto(self.same, np.where(val == self.prev, self.same + 1, 1), where=ok)
+        np.copyto(self.prev, val, where=ok)
+        prev_mean = self.mean_x - self.comp_add
+        y = val - self.comp_add
+        t = y - self.mean_x
+        np.copyto(self.comp_add, t + self.mean_x - y, where=ok)
+        # 加入非遺失值後 nobs 至少為 1
+        mean_x = self.mean_x + t / np.maximum(self.nobs, 1)
+        np.copyto(
+            self.ssqdm_x, self.ssqdm_x + (val - prev_mean) * (val - mean_x), where=ok
+        )
+        np.copyto(self.mean_x, mean_x, where=ok)
+
+    def remove(self, val: np.ndarray):
+        ok = val == val
+        self.nobs -= ok
+        remain = ok & (self.nobs > 0)
+        emptied = ok & (self.nobs == 0)
+        prev_mean = self.mean_x - self.comp_remove
+        y = val - self.comp_remove
+        t = y - self.mean_x
+        np.copyto(self.comp_remove, t + self.mean_x - y, where=remain)
+        mean_x = self.mean_x - t / np.maximum(self.nobs, 1)
+        ssqdm_x = self.ssqdm_x - (val - prev_mean) * (val - mean_x)
+        np.copyto(self.ssqdm_x, ssqdm_x, where=remain)
+        np.copyto(self.mean_x, mean_x, where=remain)
+        self.mean_x[emptied] = 0.0
+        self.ssqdm_x[emptied] = 0.0
+
+    def var(self, minp: int, ddof: int = 1) -> np.ndarray:
+        result = self.ssqdm_x / (self.nobs - ddof)
+        result[self.same >= self.nobs] = 0.0
+        result[(self.nobs < max(minp, 1)) | (self.nobs <= ddof)] = np.nan
+        return result
+
+
+class RunningWindow(object):
+    """
+    類別說明:
+    滾動運算的逐筆狀態。start 以完整資料從第一筆開始累加，回傳滾動結果；
+    之後每新增一筆資料呼叫 update，傳入最近 window+1 筆資料(最舊的一筆是移出視窗的值)，
+    回傳最新一筆的結果。子類別實作 _inputs、_add、_remove 與 _result。
+    """
+
+    def __init__(self, window: Annotated[int, "滾動視窗長度"]):
+        self.window = int(window)
+        self.rows = 0
+
+    def _inputs(self, *values):
+        return [_prep(value) for value in values]
+
+    def _push(self, new, old):
+        if self.rows == 0:
+            self._setup(new)
+        if old is not None:
+            self._remove(old)
+        self._add(new)
+        self.rows += 1
+
+    def start(
+        self,
+        *values: np.ndarray,
+        tail: Annotated[Optional[int], "只回傳最後幾筆的結果，None 表示全部"] = None,
+    ) -> Annotated[np.ndarray, "滾動結果"]:
+        inputs = self._inputs(*values)
+        n = len(inputs[0])
+        first_result = 0 if tail is None else max(n - tail, 0)
+        rows = []
+        with np.errstate(all="ignore"):
+            for t in range(n):
+                old = t - self.window
+                self._push(
+                    [value[t] for value in inputs],
+                    [value[old] for value in inputs] if old >= 0 else None,
+                )
+                if t >= first_result:
+                    rows.append(self._result())
+        return np.array(rows).reshape(len(rows), -1)
+
+    def update(self, *windows: np.ndarray) -> Annotated[np.ndarray, "最新一筆的結果"]:
+        inputs = self._inputs(*windows)
+        old = [value[0] for value in inputs] if self.rows >= self.window else None
+        with np.errstate(all="ignore"):
+            self._push([value[-1] for value in inputs], old)
+            return self._result()
+
+
+class RunningSum(RunningWindow):
+    # 與 rolling(window).sum() 相同；transform 先將輸入轉換成要加總的數值
+    def __init__(self, window, transform=None):
+        super().__init__(window)
+        self.transform = transform
+
+    def _inputs(self, *values):
+        if self.transform is not None:
+            values = (self.transform(*values),)
+        return super()._inputs(*values)
+
+    def _setup(self, new):
+        self.state = _RunningSum(new[0])
+
+    def _add(self, new):
+        self.state.add(new[0])
+
+    def _remove(self, old):
+        self.state.remove(old[0])
+
+    def _result(self):
+        return self.state.total(self.window)
+
+
+class RunningMean(RunningSum):
+    # 與 rolling(window).mean() 相同
+    def _result(self):
+        return self.state.mean(self.window)
+
+
+class RunningStd(RunningWindow):
+    # 與 rolling(window).std() 相同
+    def _setup(self, new):
+        self.state = _RunningVar(new[0])
+
+    def _add(self, new):
+        self.state.add(new[0])
+
+    def _remove(self, old):
+        self.state.remove(old[0])
+
+    def _result(self):
+        var = self.state.var(self.window)
+        return np.where(var < 0, 0.0, np.sqrt(var))
+
+
+class RunningCov(RunningWindow):
+    # 與 x.rolling(window).cov(y) 相同，任一邊是遺失值時兩邊都視為遺失值
+    def _inputs(self, x, y):
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        with np.errstate(all="ignore"):
+            x, y = _prep(x + 0 * y), _prep(y + 0 * x)
+            return [x * y, x, y, (~np.isnan(x + y)).astype(float)]
+
+    def _setup(self, new):
+        self.states = [_RunningSum(value) for value in new]
+
+    def _add(self, new):
+        for state, value in zip(self.states, new):
+            state.add(value)
+
+    def _remove(self, old):
+        for state, value in zip(self.states, old):
+            state.remove(value)
+
+    def _result(self):
+        mean_x_y, mean_x, mean_y = (
+            state.mean(self.window) for state in self.states[:3]
+        )
+        count_x_y = self.states[3].total(0)
+        return (mean_x_y - mean_x * mean_y) * (count_x_y / (count_x_y - 1))
+
+
+class RunningCorr(RunningCov):
+    # 與 x.rolling(window).corr(y) 相同；fill_value 不為 None 時，視窗填滿後的遺失值以它取代
+    def __init__(self, window, fill_value=None):
+        super().__init__(window)
+        self.fill_value = fill_value
+
+    def _setup(self, new):
+        super()._setup(new)
+        self.variances = [_RunningVar(new[1]), _RunningVar(new[2])]
+
+    def _add(self, new):
+        super()._add(new)
+        for state, value in zip(self.variances, new[1:3]):
+            state.add(value)
+
+    def _remove(self, old):
+        super()._remove(old)
+        for state, value in zip(self.variances, old[1:3]):
+            state.remove(value)
+
+    def _result(self):
+        x_var, y_var = (state.var(self.window) for state in self.variances)
+        result = super()._result() / (x_var * y_var) ** 0.5
+        if self.fill_value is not None and self.rows >= self.window:
+            result = np.where(np.isnan(result), self.fill_value, result)
+        return result
@@ -0,0 +1,56 @@
+# 載入需要的套件
+from multiprocessing import shared_memory
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from typing_extensions import Annotated
+
+
+def publish_panel(
+    df: Annotated[pd.DataFrame, "要分享給子行程的面板資料(數值欄位)"],
+) -> Annotated[
+    Tuple[shared_memory.SharedMemory, dict],
+    "(共享記憶體物件, 子行程重建資料表所需的描述資料)",
+]:
+    """
+    函式說明:
+    將面板資料的數值複製到共享記憶體一次(轉為 float64)，
+    子行程只需要接收很小的描述資料(共享記憶體名稱、形狀、索引與欄位)，
+    不必為每個任務序列化整份資料。
+    使用完畢後由建立者呼叫 shm.close() 與 shm.unlink() 釋放。
+    """
+    values = df.to_numpy(dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    # 以欄為主(Fortran order)存放，和 pandas 內部的資料排列方式相同
+    shared_values = np.ndarray(
+        values.shape, dtype=values.dtype, buffer=shm.buf, order="F"
+    )
+    shared_values[:] = values
+    meta = {
+        "name": shm.name,
+        "shape": values.shape,
+        "dtype": values.dtype.str,
+        "index": df.index,
+        "columns": df.columns,
+    }
+    return shm, meta
+
+
+def attach_panel(
+    meta: Annotated[dict, "publish_panel 回傳的描述資料"],
+) -> Annotated[
+    Tuple[shared_memory.SharedMemory, pd.DataFrame],
+    "(共享記憶體物件, 直接使用共享記憶體的唯讀資料表)",
+]:
+    """
+    函式說明:
+    在子行程中連接 publish_panel 建立的共享記憶體，重建資料表但不複製數值。
+    數值設為唯讀，避免任何一個子行程修改到其他子行程看到的資料；
+    回傳的共享記憶體物件必須保留到不再使用資料表為止。
+    """
+    shm = shared_memory.SharedMemory(name=meta["name"])
+    values = np.ndarray(meta["shape"], dtype=meta["dtype"], buffer=shm.buf, order="F")
+    values.flags.writeable = False
+    df = pd.DataFrame(values, index=meta["index"], columns=meta["columns"], copy=False)
+    return shm, df
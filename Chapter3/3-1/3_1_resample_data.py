@@ -1,5 +1,14 @@
 #import套件
+import os
+import sys
+
 import pandas as pd
+
+# 將 Chapter3 的 utils 加入路徑
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+import Chapter3.utils as chap3_utils  # noqa: E402
+
 #讀取分K檔案
 x = pd.read_csv('TXF.csv')
 print(x)
@@ -28,32 +37,16 @@ df30.to_csv('TXF_30_Test.csv')
 # df30.to_csv('D:\mastertalk\code\TXF_30.csv')
 
 
-morning_data = x.between_time('08:45', '13:45')
-afternoon_data = x.between_time('15:00', '05:00')
-
-# 早上8:45 ~ 13:45的資料做resample，並使用offset
-morning_resampled = morning_data.resample(
-    '30min', closed='right', label='right', offset='15min').agg({
-    'Open': 'first',
-    'High': 'max',
-    'Low': 'min',
-    'Close': 'last',
-    'Volume': 'sum'
-}).dropna()
-print(morning_resampled)
-
-# 下午15:00 ~ 隔日凌晨3:00的資料做resample，不使用offset
-afternoon_resampled = afternoon_data.resample(
-    '30min', closed='right', label='right').agg({
-    'Open': 'first',
-    'High': 'max',
-    'Low': 'min',
-    'Close': 'last',
-    'Volume': 'sum'
-}).dropna()
-print(afternoon_resampled)
-
-# 合併早上和下午的resample結果
-df30 = pd.concat([morning_resampled, afternoon_resampled]).sort_index()
+# 依台指期交易時段轉換成30分K：
+# 日盤 8:45 ~ 13:45 從 8:45 起算(相當於 offset='15min')，
+# 夜盤 15:00 ~ 隔日 5:00 從 15:00 起算，跨過午夜也不會被切開，
+# separate_open_bar=True 時 8:45、15:00 當下的 K 線自成一根，
+# 結果與日盤、夜盤分別 between_time + resample 後再合併排序相同；
+# 不設定時這兩根會併入開盤後的第一根 30 分K
+df30 = chap3_utils.resample_futures_bars(x, '30min', separate_open_bar=True)
+print(df30)
 df30.to_csv('TXF_30.csv')
 
+# 其他週期(例如 1 小時、4 小時)使用相同的交易時段規則，
+# settlement_close=True 時結算日的日盤在 13:30 收盤
+# df60 = chap3_utils.resample_futures_bars(x, '1h', settlement_close=True)
@@ -0,0 +1,3 @@
+from .optimizer import param_grid, run_optimization
+
+__all__ = ['param_grid', 'run_optimization']
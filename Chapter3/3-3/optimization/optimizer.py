@@ -0,0 +1,162 @@
+import csv
+import inspect
+import itertools
+import os
+import sys
+from multiprocessing import Pool
+
+import backtrader as bt
+import empyrical as ep
+import pandas as pd
+
+# 每個子行程各自保存的回測環境 (Cerebro 與預先載入的資料)，在 _init_worker 中建立一次
+_worker = {}
+
+# Cerebro.run 在呼叫 runstrategies 之前設定的私有屬性 (backtrader 1.9.78.123)
+_CEREBRO_RUN_ATTRS = ('_event_stop', '_dorunonce', '_dopreload', '_exactbars',
+                      'runwriters', 'writers_csv')
+
+
+def param_grid(**grid):
+    """將每個參數的候選值展開成所有排列組合，回傳 [{參數名稱: 值}, ...]。"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def _param_key(params, names):
+    # 以字串比對參數組合，和 csv 檔中讀回的值一致
+    return tuple(str(params[name]) for name in names)
+
+
+def _load_finished(output_path, names):
+    """
+    讀取結果檔中已完成的參數組合。
+    程式中斷時最後一列可能只寫了一半，先將它截掉，之後的結果接在後面繼續寫入。
+    """
+    if not os.path.isfile(output_path):
+        return set()
+    with open(output_path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+    with open(output_path, newline='', encoding='utf-8') as f:
+        return {_param_key(row, names) for row in csv.DictReader(f)}
+
+
+def _prepare_runstrategies(cerebro, data):
+    """
+    不經過 Cerebro.run，讓 cerebro 可以重複呼叫 runstrategies(predata=True) 執行每組參數。
+
+    對應 backtrader 1.9.78.123 的 Cerebro.run 在多核心最佳化 (optdatas=True) 時的準備步驟：
+    設定 run 中建立的私有屬性 (_CEREBRO_RUN_ATTRS：不停止、runonce 依參數、preload、
+    不限制記憶體、沒有 writer)，再將資料 preload 一次。
+    這些屬性不是公開的 API，若其他版本的 Cerebro.run 不再設定其中任何一個，
+    或 runstrategies 沒有 predata 參數，assert 會直接失敗，而不是默默得到錯誤的回測結果。
+    """
+    run_names = bt.Cerebro.run.__code__.co_names
+    missing = [name for name in _CEREBRO_RUN_ATTRS if name not in run_names]
+    has_predata = 'predata' in inspect.signature(bt.Cerebro.runstrategies).parameters
+    assert not missing and has_predata, (
+        f'_prepare_runstrategies 對應 backtrader 1.9.78.123，與目前的 {bt.__version__} 不相容：'
+        f'Cerebro.run 沒有設定 {missing}，或 runstrategies 沒有 predata 參數')
+
+    cerebro._event_stop = False
+    cerebro._dorunonce = cerebro.p.runonce
+    cerebro._dopreload = True
+    cerebro._exactbars = 0
+    cerebro.runwriters = []
+    cerebro.writers_csv = False
+    data.reset()
+    data.extend(size=cerebro.p.lookahead)
+    data._start()
+    data.preload()
+
+
+def _init_worker(df, feed_kwargs, strategy, cash, commission_kwargs, quiet):
+    """
+    子行程初始化：建立 Cerebro、設定資金與手續費，並將資料預先載入一次。
+    之後這個子行程中的每組參數都重複使用同一份已載入的資料，只重新建立策略與指標。
+    """
+    if quiet:
+        # 策略的 log 會輸出每一筆交易，最佳化時關閉以免大量輸出拖慢速度
+        sys.stdout = open(os.devnull, 'w')
+
+    cerebro = bt.Cerebro(stdstats=False)
+    data = bt.feeds.PandasData(dataname=df, **feed_kwargs)
+    cerebro.adddata(data)
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(**commission_kwargs)
+    # 與 PyFolio 分析器相同的日報酬，只計算績效指標不需要持倉與交易明細
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, _name='returns', timeframe=bt.TimeFrame.Days)
+
+    _prepare_runstrategies(cerebro, data)
+
+    _worker['cerebro'] = cerebro
+    _worker['strategy'] = strategy
+
+
+def _run_params(params):
+    """在子行程中執行一組參數的回測，並直接計算績效指標，只回傳一列結果。"""
+    cerebro = _worker['cerebro']
+    strat = cerebro.runstrategies([(_worker['strategy'], (), params)], predata=True)[0]
+    returns = pd.Series(strat.analyzers.returns.get_analysis(), dtype=float)
+    returns.index = pd.to_datetime(returns.index).tz_localize('UTC')
+    return {
+        **params,
+        'cum_return': ep.cum_returns_final(returns),
+        'sharpe_ratio': ep.sharpe_ratio(returns),
+        'max_drawdown': ep.max_drawdown(returns),
+    }
+
+
+def run_optimization(strategy, df, params_list, output_path='optimization_results.csv',
+                     feed_kwargs=None, cash=100000.0, commission_kwargs=None,
+                     processes=None, quiet=True):
+    """
+    平行執行 backtrader 參數最佳化，取代 cerebro.optstrategy + cerebro.run(maxcpus=1)。
+
+    - 參數組合分配給多個子行程，每個子行程只載入一次資料
+    - 績效指標 (累積報酬、夏普比率、最大回撤) 在子行程中計算，不回傳整個分析器物件
+    - 每完成一組參數就寫入一列到 output_path (csv)，程式中斷不會遺失已完成的結果
+    - 再次執行時會略過結果檔中已完成的參數組合，從中斷處繼續
+
+    參數:
+        strategy: backtrader 策略類別
+        df: 回測資料 (pandas DataFrame)
+        params_list: 參數組合的 list，可用 param_grid 產生
+        feed_kwargs: 傳給 bt.feeds.PandasData 的參數 (欄位位置等)
+        commission_kwargs: 傳給 broker.setcommission 的參數
+        processes: 子行程數量，預設為 CPU 核心數
+
+    回傳所有參數組合 (包含之前已完成的) 的結果 DataFrame。
+    """
+    if not params_list:
+        return pd.DataFrame()
+    names = list(params_list[0])
+    columns = names + ['cum_return', 'sharpe_ratio', 'max_drawdown']
+
+    finished = _load_finished(output_path, names)
+    pending = [params for params in params_list if _param_key(params, names) not in finished]
+    print(f'參數組合共 {len(params_list)} 組，已完成 {len(params_list) - len(pending)} 組，'
+          f'本次執行 {len(pending)} 組')
+
+    if pending:
+        write_header = not os.path.isfile(output_path) or os.path.getsize(output_path) == 0
+        with open(output_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            if write_header:
+                writer.writeheader()
+                f.flush()
+            initargs = (df, feed_kwargs or {}, strategy, cash, commission_kwargs or {}, quiet)
+            with Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+                for i, row in enumerate(pool.imap_unordered(_run_params, pending), 1):
+                    writer.writerow(row)
+                    f.flush()
+                    if i % 50 == 0 or i == len(pending):
+                        print(f'已完成 {i}/{len(pending)} 組')
+
+    results = pd.read_csv(output_path)
+    # 只回傳這次參數範圍內的結果 (結果檔中可能還有其他參數範圍的結果)
+    keys = {_param_key(params, names) for params in params_list}
+    in_grid = [_param_key(row, names) in keys for row in results.astype(str).to_dict('records')]
+    return results[in_grid].reset_index(drop=True)
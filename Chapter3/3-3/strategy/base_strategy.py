@@ -4,6 +4,8 @@ import backtrader as bt
 from datetime import datetime, timedelta
 import calendar
 
+from .indicator_cache import cached_indicator
+
 class BaseStrategy(bt.Strategy):
     """
     基礎策略類別，包含共享的參數、指標和通用方法。
@@ -52,25 +54,27 @@ class BaseStrategy(bt.Strategy):
         self.datavolume = self.datas[0].volume
 
         # --- 計算共享指標 ---
-        self.ma_short = bt.indicators.SMA(self.dataclose, period=self.params.ma_short)
-        self.ma_medium = bt.indicators.SMA(self.dataclose, period=self.params.ma_medium)
-        self.ma_long = bt.indicators.SMA(self.dataclose, period=self.params.ma_long)
-        self.vol_ma_short = bt.indicators.SMA(self.datavolume, period=self.params.vol_ma_short)
-        self.stddev = bt.indicators.StandardDeviation(self.dataclose, period=self.params.stddev_period)
-        self.stddev_mosc = bt.indicators.MomentumOscillator(self.stddev, period=self.params.stddev_period)
-        self.mosc = bt.indicators.MomentumOscillator(self.dataclose, period=self.params.mosc_period)
-        self.atr = bt.indicators.ATR(self.datas[0], period=self.params.atr_short_period)
+        # 指標以 numpy 預先計算並依 (feed, 指標, 週期) 快取，參數最佳化時相同週期的指標只計算一次
+        data = self.datas[0]
+        self.ma_short = cached_indicator(data, 'sma', 'close', period=self.params.ma_short)
+        self.ma_medium = cached_indicator(data, 'sma', 'close', period=self.params.ma_medium)
+        self.ma_long = cached_indicator(data, 'sma', 'close', period=self.params.ma_long)
+        self.vol_ma_short = cached_indicator(data, 'sma', 'volume', period=self.params.vol_ma_short)
+        self.stddev = cached_indicator(data, 'stddev', 'close', period=self.params.stddev_period)
+        self.stddev_mosc = cached_indicator(data, 'momosc', self.stddev, period=self.params.stddev_period)
+        self.mosc = cached_indicator(data, 'momosc', 'close', period=self.params.mosc_period)
+        self.atr = cached_indicator(data, 'atr', period=self.params.atr_short_period)
         self.atr_ratio = self.atr / self.dataclose * 100
 
         # --- 可能特定策略需要的指標 (也可以放在子類別的 __init__) ---
-        self.rsi = bt.indicators.RSI(self.dataclose, period=self.params.rsi_period)
-        self.bbands = bt.indicators.BollingerBands(self.dataclose,
-                                                   period=self.params.bbands_period,
-                                                   devfactor=self.params.bbands_devfactor)
-        self.prev_high_short = bt.indicators.Highest(self.datahigh, period=self.params.prev_high_short)
-        self.prev_high_long = bt.indicators.Highest(self.datahigh, period=self.params.prev_high_long)
-        self.prev_low_short = bt.indicators.Lowest(self.datalow, period=self.params.prev_low_short)
-        self.prev_low_long = bt.indicators.Lowest(self.datalow, period=self.params.prev_low_long)
+        self.rsi = cached_indicator(data, 'rsi', 'close', period=self.params.rsi_period)
+        self.bbands = cached_indicator(data, 'bbands', 'close',
+                                       period=self.params.bbands_period,
+                                       devfactor=self.params.bbands_devfactor)
+        self.prev_high_short = cached_indicator(data, 'highest', 'high', period=self.params.prev_high_short)
+        self.prev_high_long = cached_indicator(data, 'highest', 'high', period=self.params.prev_high_long)
+        self.prev_low_short = cached_indicator(data, 'lowest', 'low', period=self.params.prev_low_short)
+        self.prev_low_long = cached_indicator(data, 'lowest', 'low', period=self.params.prev_low_long)
 
         # --- 訂單和交易狀態 ---
         self.order = None
@@ -0,0 +1,200 @@
+import array
+import math
+import weakref
+
+import backtrader as bt
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# 指標快取：id(feed) -> (feed 的弱參照, 資料長度, {指標鍵: (各條線的數值, 最小週期)})
+# 同一個 feed 在參數最佳化時會被每組參數重複使用，相同的 (feed, 指標, 週期) 只計算一次
+_cache = {}
+
+
+def _rolling(x, period, func):
+    """以滑動視窗計算，前 period - 1 根為 NaN"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        out[period - 1:] = func(sliding_window_view(x, period), axis=1)
+    return out
+
+
+def _shift(x, period):
+    """x(-period)：往後移動 period 根，前 period 根為 NaN"""
+    out = np.full(len(x), np.nan)
+    out[period:] = x[:len(x) - period]
+    return out
+
+
+def _fsum(x, period):
+    """
+    每個視窗以 math.fsum 加總，前 period - 1 根為 NaN。
+    與 backtrader 的 Average 相同逐視窗精確加總 (np.sum 的累加誤差會讓最後一位數不同)
+    """
+    out = np.full(len(x), np.nan)
+    values = x.tolist()
+    out[period - 1:] = [math.fsum(values[i - period:i]) for i in range(period, len(values) + 1)]
+    return out
+
+
+def _sma(x, minperiod, period):
+    return _fsum(x, period) / period, minperiod + period - 1
+
+
+def _smma(x, minperiod, period):
+    """平滑移動平均：以前 period 根的平均為起始值，之後 prev * (1 - 1/period) + x / period"""
+    out = np.full(len(x), np.nan)
+    start = minperiod + period - 1
+    if len(x) >= start:
+        alpha = 1.0 / period
+        alpha1 = 1.0 - alpha
+        seed = math.fsum(x[minperiod - 1:start].tolist()) / period
+        out[start - 1] = seed
+        # 一階遞迴濾波：y[i] = alpha * x[i] + alpha1 * y[i - 1]
+        out[start:] = lfilter([alpha], [1.0, -alpha1], x[start:], zi=[alpha1 * seed])[0]
+    return out, start
+
+
+def _stddev(x, minperiod, period, mean=None):
+    """與 bt.indicators.StandardDeviation (safepow=True) 相同：sqrt(|mean(x^2) - mean(x)^2|)"""
+    if mean is None:
+        mean, _ = _sma(x, minperiod, period)
+    # 次方都使用 np.float_power，與 backtrader 的 pow() 相同
+    # (np.power 的 2 次方與 0.5 次方會改用 x * x 與 sqrt，最後一位數可能不同)
+    meansq, minperiod = _sma(np.float_power(x, 2), minperiod, period)
+    return np.float_power(np.abs(meansq - np.float_power(mean, 2)), 0.5), minperiod
+
+
+def _compute(fields, name, x, minperiod, params):
+    """計算指標，回傳 (各條線的數值, 最小週期)"""
+    period = params['period']
+    if name == 'sma':
+        values, minperiod = _sma(x, minperiod, period)
+        return (values,), minperiod
+    if name == 'stddev':
+        values, minperiod = _stddev(x, minperiod, period)
+        return (values,), minperiod
+    if name == 'momosc':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (100.0 * (x / _shift(x, period)),), minperiod + period
+    if name == 'highest':
+        return (_rolling(x, period, np.max),), minperiod + period - 1
+    if name == 'lowest':
+        return (_rolling(x, period, np.min),), minperiod + period - 1
+    if name == 'rsi':
+        prev = _shift(x, 1)
+        maup, _ = _smma(np.maximum(x - prev, 0.0), minperiod + 1, period)
+        madown, minperiod = _smma(np.maximum(prev - x, 0.0), minperiod + 1, period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (100.0 - 100.0 / (1.0 + maup / madown),), minperiod
+    if name == 'atr':
+        close_prev = _shift(fields('close'), 1)
+        tr = np.maximum(fields('high'), close_prev) - np.minimum(fields('low'), close_prev)
+        values, minperiod = _smma(tr, 2, period)
+        return (values,), minperiod
+    if name == 'bbands':
+        mid, _ = _sma(x, minperiod, period)
+        stddev, minperiod = _stddev(x, minperiod, period, mean=mid)
+        stddev = params['devfactor'] * stddev
+        return (mid, mid + stddev, mid - stddev), minperiod
+    raise ValueError(f'不支援的指標: {name}')
+
+
+# 無法預先計算時 (資料未 preload，例如即時交易) 改用 backtrader 原本的指標
+_BT_INDICATORS = {
+    'sma': lambda data, src, p: bt.indicators.SMA(src, period=p['period']),
+    'stddev': lambda data, src, p: bt.indicators.StandardDeviation(src, period=p['period']),
+    'momosc': lambda data, src, p: bt.indicators.MomentumOscillator(src, period=p['period']),
+    'highest': lambda data, src, p: bt.indicators.Highest(src, period=p['period']),
+    'lowest': lambda data, src, p: bt.indicators.Lowest(src, period=p['period']),
+    'rsi': lambda data, src, p: bt.indicators.RSI(src, period=p['period']),
+    'atr': lambda data, src, p: bt.indicators.ATR(data, period=p['period']),
+    'bbands': lambda data, src, p: bt.indicators.BollingerBands(src, period=p['period'],
+                                                                devfactor=p['devfactor']),
+}
+
+
+class _PrecomputedIndicator(bt.Indicator):
+    """
+    直接輸出預先計算好的數值的指標。
+    runonce 模式一次複製整段數值，next 模式逐根讀取，與原本的指標有相同的最小週期。
+    """
+    params = (('values', None), ('minperiod', 1), ('cache_key', None))
+
+    def __init__(self):
+        self.addminperiod(self.p.minperiod)
+
+    def next(self):
+        i = len(self) - 1
+        for line, values in enumerate(self.p.values):
+            self.lines[line][0] = values[i]
+
+    def once(self, start, end):
+        for line, values in enumerate(self.p.values):
+            self.lines[line].array[start:end] = array.array('d', values[start:end])
+
+
+class CachedIndicator(_PrecomputedIndicator):
+    """預先計算好的單一條線指標"""
+    lines = ('value',)
+
+
+class CachedBands(_PrecomputedIndicator):
+    """預先計算好的布林通道 (mid, top, bot 三條線)"""
+    lines = ('mid', 'top', 'bot')
+
+
+def _feed_store(data):
+    """取得 feed 的快取；資料重新載入後長度不同，或 id 被其他物件重複使用時重新建立"""
+    buflen = data.buflen()
+    entry = _cache.get(id(data))
+    if entry is None or entry[0]() is not data or entry[1] != buflen:
+        # 順便清除已被回收的 feed
+        for key in [key for key, value in _cache.items() if value[0]() is None]:
+            del _cache[key]
+        entry = (weakref.ref(data), buflen, {})
+        _cache[id(data)] = entry
+    return entry[2]
+
+
+def cached_indicator(data, name, source=None, **params):
+    """
+    取得 data 上以 numpy 向量化預先計算的指標，快取鍵為 (feed, 指標, 參數)。
+    參數最佳化時不同的參數組合共用相同週期的指標，例如只改變停損停利時均線不會重新計算。
+
+    參數:
+        data: 資料來源 (feed)
+        name: 指標名稱，sma、stddev、momosc、highest、lowest、rsi、atr、bbands
+        source: 計算指標的欄位名稱 (例如 'close')，或另一個 cached_indicator 回傳的指標
+        params: 指標參數，例如 period、devfactor (bbands)
+
+    資料沒有預先載入 (preload=False) 時無法預先計算，改用 backtrader 原本的指標。
+    """
+    if data.buflen() == 0:
+        src = getattr(data, source) if isinstance(source, str) else source
+        return _BT_INDICATORS[name](data, src, params)
+
+    store = _feed_store(data)
+    buflen = data.buflen()
+
+    def fields(field):
+        key = ('field', field)
+        if key not in store:
+            store[key] = ((np.array(getattr(data, field).array[:buflen], dtype=np.float64),), 1)
+        return store[key][0][0]
+
+    if source is None:
+        source_key, x, minperiod = None, None, 1
+    elif isinstance(source, str):
+        source_key, x, minperiod = ('field', source), fields(source), 1
+    else:
+        source_key = source.p.cache_key
+        (x, *_), minperiod = store[source_key]
+
+    key = (name, source_key, tuple(sorted(params.items())))
+    if key not in store:
+        store[key] = _compute(fields, name, x, minperiod, params)
+    values, minperiod = store[key]
+    indicator_cls = CachedBands if name == 'bbands' else CachedIndicator
+    return indicator_cls(data, values=values, minperiod=minperiod, cache_key=key)
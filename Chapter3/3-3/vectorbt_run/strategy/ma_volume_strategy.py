@@ -168,10 +168,17 @@ class MAVolumeStrategy:
         stddev_short_range: list = None,
         stddev_long_range: list = None,
         vol_ma_short_range: list = None,
-        vol_ma_short_threshold_range: list = None
+        vol_ma_short_threshold_range: list = None,
+        broadcast: bool = True,
+        chunk_size: int = 500
     ) -> pd.DataFrame:
         """
         參數優化
+        
+        參數:
+            broadcast: 是否以廣播方式一次回測整批參數 (見 optimize_broadcast)，
+                       False 時逐一建立策略並回測每組參數
+            chunk_size: 廣播模式每批回測的參數組合數量，數值越大越快但越耗記憶體
         """
         # 默認參數範圍
         if ma_short_range is None:
@@ -206,6 +213,18 @@ class MAVolumeStrategy:
             # 'vol_ma_short_threshold': vol_ma_short_threshold_range
         }
         
+        if broadcast:
+            df_results = self.optimize_broadcast(df, param_grid, chunk_size=chunk_size)
+        else:
+            df_results = self._optimize_loop(df, param_grid)
+        
+        df_results = df_results.sort_values(by='total_return', ascending=False)
+        df_results.reset_index(drop=True, inplace=True)
+        df_results.to_csv('optimization_results.csv', index=False)
+        return df_results
+    
+    def _optimize_loop(self, df: pd.DataFrame, param_grid: dict) -> pd.DataFrame:
+        """逐一建立策略並回測每組參數"""
         # 使用 sklearn 的 ParameterGrid
         grid = ParameterGrid(param_grid)
         
@@ -243,11 +262,107 @@ class MAVolumeStrategy:
                 'win_rate': portfolio.trades.win_rate()
             })
         
-        df_results = pd.DataFrame(results)
-        df_results = df_results.sort_values(by='total_return', ascending=False)
-        df_results.reset_index(drop=True, inplace=True)
-        df_results.to_csv('optimization_results.csv', index=False)
-        return df_results
+        return pd.DataFrame(results)
+    
+    def optimize_broadcast(
+        self, 
+        df: pd.DataFrame, 
+        param_grid: dict, 
+        chunk_size: int = 500, 
+        initial_capital: float = 100000.0
+    ) -> pd.DataFrame:
+        """
+        以廣播方式執行參數優化，結果與逐一回測相同
+        
+        每個不同的指標窗口只計算一次，再依參數組合從中取出對應的欄位，
+        組成每欄一組參數的 2 維進場信號矩陣，以一次 Portfolio.from_signals 回測整批參數。
+        參數組合依 chunk_size 分批回測，限制信號矩陣與回測結果佔用的記憶體。
+        
+        參數:
+            df: 包含 'open', 'high', 'low', 'close', 'volume' 列的 DataFrame
+            param_grid: 參數名稱 -> 候選值的 dict (與 optimize 相同)
+            chunk_size: 每批回測的參數組合數量
+            initial_capital: 初始資金
+            
+        返回:
+            每組參數一列的績效結果 DataFrame
+        """
+        combos = pd.DataFrame(list(ParameterGrid(param_grid)))
+        close = df['close'].to_numpy()
+        time_mask = ((df.index.time >= self.trading_start) & 
+                     (df.index.time < self.trading_end))
+        exits = pd.Series(~time_mask, index=df.index)
+        
+        # 每個不同的窗口只計算一次指標，結果為 (時間 x 窗口) 的矩陣
+        ma_windows = sorted(set(combos['ma_short']) | set(combos['ma_medium']) | set(combos['ma_long']))
+        ma = np.column_stack([vbt.MA.run(df['close'], w).ma.to_numpy() for w in ma_windows])
+        above = close[:, None] > ma
+        below = close[:, None] < ma
+        
+        std_windows = sorted(set(combos['stddev_short']) | set(combos['stddev_long']))
+        stddev = np.column_stack([df['close'].rolling(window=w).std().to_numpy() for w in std_windows])
+        
+        vol_windows = sorted(set(combos['vol_ma_short']))
+        vol_ma = np.column_stack([vbt.MA.run(df['volume'], w).ma.to_numpy() for w in vol_windows])
+        if 'vol_ma_short_threshold' not in combos:
+            combos['vol_ma_short_threshold'] = self.vol_ma_short_threshold
+        vol_threshold = combos['vol_ma_short_threshold'].to_numpy()
+        
+        # 每組參數對應到指標矩陣的欄位位置
+        def positions(windows, values):
+            return np.searchsorted(windows, values.to_numpy())
+        
+        ma_s = positions(ma_windows, combos['ma_short'])
+        ma_m = positions(ma_windows, combos['ma_medium'])
+        ma_l = positions(ma_windows, combos['ma_long'])
+        std_s = positions(std_windows, combos['stddev_short'])
+        std_l = positions(std_windows, combos['stddev_long'])
+        vol = positions(vol_windows, combos['vol_ma_short'])
+        
+        results = []
+        for start in tqdm(range(0, len(combos), chunk_size), desc='Parameter chunks'):
+            cols = slice(start, start + chunk_size)
+            chunk = combos.iloc[cols]
+            
+            # 波動率與成交量條件、交易時段對多空進場相同
+            common = ((stddev[:, std_s[cols]] > stddev[:, std_l[cols]]) & 
+                      (vol_ma[:, vol[cols]] > vol_threshold[None, cols]) & 
+                      time_mask[:, None])
+            entries_long = above[:, ma_s[cols]] & above[:, ma_m[cols]] & above[:, ma_l[cols]] & common
+            entries_short = below[:, ma_s[cols]] & below[:, ma_m[cols]] & below[:, ma_l[cols]] & common
+            
+            columns = pd.RangeIndex(start, start + len(chunk))
+            portfolio = vbt.Portfolio.from_signals(
+                open=df['open'],
+                high=df['high'],
+                low=df['low'],
+                close=df['close'],
+                entries=pd.DataFrame(entries_long, index=df.index, columns=columns),
+                short_entries=pd.DataFrame(entries_short, index=df.index, columns=columns),
+                exits=exits,
+                size=20,
+                min_size=20,
+                size_type=SizeType.Amount,
+                init_cash=initial_capital,
+                fixed_fees=2.2,
+                # 每欄一組止損、止盈比例
+                sl_stop=chunk['stop_loss_pct'].to_numpy()[None, :],
+                tp_stop=chunk['take_profit_pct'].to_numpy()[None, :],
+                accumulate=False,
+                freq='1min'
+            )
+            
+            results.append(chunk.assign(
+                total_return=portfolio.total_return().to_numpy(),
+                sharpe_ratio=portfolio.sharpe_ratio().to_numpy(),
+                max_drawdown=portfolio.max_drawdown().to_numpy(),
+                win_rate=portfolio.trades.win_rate().to_numpy()
+            ))
+        
+        columns = ['ma_short', 'ma_medium', 'ma_long', 'stop_loss_pct', 'take_profit_pct',
+                   'stddev_short', 'stddev_long', 'vol_ma_short', 'vol_ma_short_threshold',
+                   'total_return', 'sharpe_ratio', 'max_drawdown', 'win_rate']
+        return pd.concat(results, ignore_index=True)[columns]
 
 # 使用示例
 def run_backtest(csv_file, initial_capital=100000.0):
@@ -0,0 +1,264 @@
+# 載入需要的套件
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from typing_extensions import Annotated
+
+# 台灣期貨交易所(TAIFEX)台指期/小台指的交易時段(以當天 00:00 起算的時間)
+DAY_SESSION = (pd.Timedelta(hours=8, minutes=45), pd.Timedelta(hours=13, minutes=45))
+# 夜盤 15:00 開盤，隔天 05:00 收盤
+NIGHT_SESSION = (pd.Timedelta(hours=15), pd.Timedelta(hours=29))
+# 結算日(每月第三個星期三)到期合約的日盤在 13:30 收盤
+SETTLEMENT_DAY_CLOSE = pd.Timedelta(hours=13, minutes=30)
+
+OHLCV_COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+
+
+def is_settlement_day(
+    dates: Annotated[pd.DatetimeIndex, "日期"],
+) -> Annotated[np.ndarray, "是否為結算日(每月第三個星期三)的布林陣列"]:
+    """
+    函式說明:
+    判斷日期是否為台指期的結算日，也就是每月的第三個星期三(15 ~ 21 日之間的星期三)。
+    遇到國定假日延後結算的情況不在此規則內。
+    """
+    return np.asarray((dates.weekday == 2) & (dates.day >= 15) & (dates.day <= 21))
+
+
+def taifex_session_bounds(
+    index: Annotated[pd.DatetimeIndex, "K 線時間(以 K 線結束時間標示)"],
+    sessions: Annotated[Sequence[str], "要保留的交易時段，day(日盤)、night(夜盤)"] = (
+        "day",
+        "night",
+    ),
+    settlement_close: Annotated[
+        bool, "結算日日盤是否在 13:30 收盤(到期合約)，連續月合約維持 13:45"
+    ] = False,
+) -> Annotated[
+    Tuple[np.ndarray, np.ndarray, np.ndarray],
+    "(每根 K 線所屬時段的開盤時間, 收盤時間, 是否在保留的時段內)",
+]:
+    """
+    函式說明:
+    以向量化的方式找出每根 K 線所屬的交易時段。
+    日盤為當天 08:45 ~ 13:45；夜盤為當天 15:00 ~ 隔天 05:00，
+    因此 00:00 ~ 05:00 的 K 線屬於前一天 15:00 開始的夜盤。
+    開盤時間當下的 K 線(例如 08:45 的集合競價)歸入該時段，不在任何時段內的 K 線會被排除。
+    """
+    # 以奈秒整數計算，避免 Timestamp 物件陣列
+    times = index.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    one_day = pd.Timedelta(days=1).value
+    dates = times - times % one_day
+    time_of_day = times - dates
+    day = (time_of_day >= DAY_SESSION[0].value) & (time_of_day <= DAY_SESSION[1].value)
+    night_late = time_of_day >= NIGHT_SESSION[0].value
+    night_early = time_of_day <= NIGHT_SESSION[1].value - one_day
+    night = night_late | night_early
+
+    start = np.where(
+        day,
+        dates + DAY_SESSION[0].value,
+        np.where(night_early, dates - one_day, dates) + NIGHT_SESSION[0].value,
+    )
+    day_close = DAY_SESSION[1].value
+    if settlement_close:
+        # 只對不重複的日期判斷是否為結算日
+        unique_dates, inverse = np.unique(dates, return_inverse=True)
+        settlement = is_settlement_day(pd.DatetimeIndex(unique_dates.view("M8[ns]")))
+        day_close = np.where(
+            settlement[inverse], SETTLEMENT_DAY_CLOSE.value, DAY_SESSION[1].value
+        )
+    end = np.where(
+        day,
+        dates + day_close,
+        start + (NIGHT_SESSION[1] - NIGHT_SESSION[0]).value,
+    )
+
+    keep = np.zeros(len(index), dtype=bool)
+    if "day" in sessions:
+        keep |= day
+    if "night" in sessions:
+        keep |= night
+    keep &= times <= end
+    return start.view("M8[ns]"), end.view("M8[ns]"), keep
+
+
+def session_bar_labels(
+    index: Annotated[pd.DatetimeIndex, "K 線時間(以 K 線結束時間標示)"],
+    freq: Annotated[str, "K 線週期，例如 30min、1h"] = "30min",
+    sessions: Annotated[Sequence[str], "要保留的交易時段"] = ("day", "night"),
+    settlement_close: Annotated[bool, "結算日日盤是否在 13:30 收盤"] = False,
+    separate_open_bar: Annotated[
+        bool, "開盤時間當下的 K 線(08:45、15:00)是否自成一根，False 表示併入第一根"
+    ] = False,
+) -> Annotated[
+    Tuple[np.ndarray, np.ndarray], "(每根 K 線所屬新 K 線的標籤時間, 是否保留)"
+]:
+    """
+    函式說明:
+    計算每根 1 分 K 所屬的新 K 線。新 K 線從每個交易時段的開盤時間起算，
+    每 freq 一根，包含右端點並以結束時間標示(closed='right', label='right')，
+    時段最後一根不足 freq 時以收盤時間標示。
+    日盤從 08:45 起算(相當於 offset='15min')，夜盤從 15:00 起算，跨過午夜也不會被切開。
+    開盤時間當下的 K 線(例如 08:45 的集合競價)預設併入第一根新 K 線；
+    separate_open_bar=True 時自成一根並以開盤時間標示，
+    與日盤、夜盤分別 between_time + resample(closed='right') 的結果相同。
+    """
+    step = pd.Timedelta(freq).to_timedelta64()
+    start, end, keep = taifex_session_bounds(index, sessions, settlement_close)
+    elapsed = index.to_numpy(dtype="datetime64[ns]") - start
+    # 右端點屬於前一根：(start + k * step, start + (k + 1) * step] 的 bucket 編號為 k
+    bucket = np.maximum(-(-elapsed // step) - 1, 0)
+    labels = np.minimum(start + (bucket + 1) * step, end)
+    if separate_open_bar:
+        labels = np.where(elapsed == np.timedelta64(0), start, labels)
+    return labels, keep
+
+
+def _aggregate_ohlcv(
+    values: np.ndarray, labels: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # 依標籤(已排序)切成連續區段，一次以 reduceat 計算每段的 OHLCV
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)] - 1
+    bars = np.column_stack(
+        [
+            values[starts, 0],
+            np.maximum.reduceat(values[:, 1], starts),
+            np.minimum.reduceat(values[:, 2], starts),
+            values[ends, 3],
+            np.add.reduceat(values[:, 4], starts),
+        ]
+    )
+    return labels[starts], bars
+
+
+def resample_futures_bars(
+    df: Annotated[pd.DataFrame, "1 分 K 資料，索引為 K 線結束時間"],
+    freq: Annotated[str, "K 線週期，例如 30min、1h"] = "30min",
+    sessions: Annotated[Sequence[str], "要保留的交易時段，day(日盤)、night(夜盤)"] = (
+        "day",
+        "night",
+    ),
+    settlement_close: Annotated[
+        bool, "結算日日盤是否在 13:30 收盤(到期合約)，連續月合約維持 13:45"
+    ] = False,
+    columns: Annotated[Sequence[str], "開高低收量的欄位名稱"] = OHLCV_COLUMNS,
+    separate_open_bar: Annotated[
+        bool, "開盤時間當下的 K 線(08:45、15:00)是否自成一根，False 表示併入第一根"
+    ] = False,
+) -> Annotated[pd.DataFrame, "新週期的 K 線，索引為 K 線結束時間(Date)"]:
+    """
+    函式說明:
+    依台指期的交易時段將 1 分 K 轉為任意週期的 K 線，取代日盤與夜盤分別
+    between_time + resample 後再合併排序的做法。
+    先一次算出每根 1 分 K 所屬的新 K 線(session_bar_labels)，
+    再以 np.maximum/minimum/add.reduceat 一次彙總所有 K 線，夜盤跨過午夜也不會被切開。
+    只輸出有資料的 K 線(假日與無成交的時段不會產生空的 K 線)。
+    開盤時間當下的 K 線預設併入第一根新 K 線，舊做法中它們會自成一根 08:45、15:00 的 K 線，
+    需要與舊做法完全相同時請設定 separate_open_bar=True。
+    """
+    columns = list(columns)
+    df = df[columns].dropna()
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+    index = pd.DatetimeIndex(df.index)
+    labels, keep = session_bar_labels(
+        index, freq, sessions, settlement_close, separate_open_bar
+    )
+    values = df.to_numpy(dtype=np.float64)[keep]
+    if len(values) == 0:
+        return pd.DataFrame(
+            np.empty((0, len(columns))),
+            index=pd.DatetimeIndex([], name="Date"),
+            columns=columns,
+        )
+    bar_labels, bars = _aggregate_ohlcv(values, labels[keep])
+    return pd.DataFrame(
+        bars, index=pd.DatetimeIndex(bar_labels, name="Date"), columns=columns
+    )
+
+
+class StreamingBarResampler(object):
+    """
+    類別說明:
+    即時交易使用的串流版本 resample_futures_bars。
+    每收到新的 1 分 K 就呼叫 update，回傳這次已經完成的新 K 線：
+    收到新 K 線最後一分鐘(時間等於標籤時間)或之後的 K 線時，該根 K 線即完成，
+    不必等到下一根 K 線開始。尚未完成的 K 線保留在內部，收盤後可用 flush 取出。
+    所有 update 與 flush 的結果合併後，與對整段資料呼叫 resample_futures_bars 相同。
+    """
+
+    def __init__(
+        self,
+        freq: Annotated[str, "K 線週期，例如 30min、1h"] = "30min",
+        sessions: Annotated[Sequence[str], "要保留的交易時段"] = ("day", "night"),
+        settlement_close: Annotated[bool, "結算日日盤是否在 13:30 收盤"] = False,
+        columns: Annotated[Sequence[str], "開高低收量的欄位名稱"] = OHLCV_COLUMNS,
+        separate_open_bar: Annotated[
+            bool, "開盤時間當下的 K 線是否自成一根，False 表示併入第一根"
+        ] = False,
+    ):
+        self.freq = freq
+        self.sessions = tuple(sessions)
+        self.settlement_close = settlement_close
+        self.columns = list(columns)
+        self.separate_open_bar = separate_open_bar
+        # 尚未完成的新 K 線所包含的 1 分 K
+        self._pending: Optional[pd.DataFrame] = None
+        self._pending_label: Optional[np.datetime64] = None
+
+    def _bars(self, df: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
+        if len(df) == 0:
+            return pd.DataFrame(
+                np.empty((0, len(self.columns))),
+                index=pd.DatetimeIndex([], name="Date"),
+                columns=self.columns,
+            )
+        bar_labels, bars = _aggregate_ohlcv(df.to_numpy(dtype=np.float64), labels)
+        return pd.DataFrame(
+            bars, index=pd.DatetimeIndex(bar_labels, name="Date"), columns=self.columns
+        )
+
+    def update(
+        self, bars: Annotated[pd.DataFrame, "新收到的 1 分 K，索引為 K 線結束時間"]
+    ) -> Annotated[pd.DataFrame, "這次完成的新 K 線(可能為空)"]:
+        df = bars[self.columns].dropna()
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index(kind="stable")
+        labels, keep = session_bar_labels(
+            pd.DatetimeIndex(df.index),
+            self.freq,
+            self.sessions,
+            self.settlement_close,
+            self.separate_open_bar,
+        )
+        df, labels = df[keep], labels[keep]
+        if self._pending is not None:
+            df = pd.concat([self._pending, df])
+            labels = np.r_[np.full(len(self._pending), self._pending_label), labels]
+        if len(df) == 0:
+            return self._bars(df, labels)
+
+        # 最後一根 1 分 K 的時間等於標籤時間時，最後一根新 K 線也已完成
+        last_label = labels[-1]
+        if df.index[-1] == last_label:
+            done = len(df)
+            self._pending = self._pending_label = None
+        else:
+            done = int(np.searchsorted(labels, last_label))
+            self._pending = df.iloc[done:]
+            self._pending_label = last_label
+        return self._bars(df.iloc[:done], labels[:done])
+
+    def flush(self) -> Annotated[pd.DataFrame, "尚未完成的最後一根 K 線(可能為空)"]:
+        """
+        函式說明:
+        取出尚未完成的 K 線，例如收盤後資料最後一根 K 線不完整時。
+        """
+        if self._pending is None:
+            return self._bars(pd.DataFrame(columns=self.columns), np.array([]))
+        df, label = self._pending, self._pending_label
+        self._pending = self._pending_label = None
+        return self._bars(df, np.full(len(df), label))
@@ -0,0 +1,120 @@
+"""
+1.如果還沒有安裝 xgboost 套件，先在終端機執行「pip install xgboost」
+"""
+
+# %%
+# 載入所需套件
+import os
+import sys
+
+import xgboost
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report
+
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+
+import Chapter4.utils as chap4_utils  # noqa: E402
+import Chapter4.walk_forward as chap4_walk_forward  # noqa: E402
+
+# %%
+# 使用多檔股票在 2015-01-01 至 2023-12-31 的資料進行 walk-forward 訓練與測試
+# 從本地快取一次讀取所有股票的價量資料（快取中沒有的股票一次下載）
+TICKERS = ["0050.TW", "2330.TW", "2317.TW", "2454.TW", "2412.TW"]
+panel_data = chap4_utils.load_panel_data(
+    tickers=TICKERS, start_date="2015-01-01", end_date="2023-12-31"
+)
+
+# 把所有股票接成一個依日期排序的特徵矩陣，之後每一折只要切片就能取出資料
+# 特徵欄位（開盤價、最高價、最低價、收盤價、交易量）
+# 目標欄位（隔日收盤價上漲或是下跌的方向，1 表示上漲，0 表示下跌）
+features_data, labels_data, meta_data = chap4_walk_forward.build_walk_forward_data(
+    panel_data, target="Pred_UpDown"
+)
+print(f"資料筆數: {len(meta_data)}")
+
+# %%
+# 切分 walk-forward 的折：以過去 250 個交易日訓練，預測接下來 20 個交易日，
+# 之後整個視窗往後移動 20 個交易日（滾動視窗），expanding=True 則改為擴張視窗
+folds = chap4_walk_forward.walk_forward_folds(
+    meta_data["Date"], train_size=250, test_size=20, expanding=False
+)
+print(f"折數: {len(folds)}")
+
+# 每 12 折（約一年的測試資料）為一個區塊，區塊內以上一折的模型繼續訓練（warm start），
+# 每個區塊的第一折從頭訓練；各區塊平行執行（n_jobs=-1），
+# 訊號只和 CHAIN_LENGTH 有關，不會因為電腦的核心數不同而改變
+CHAIN_LENGTH = 12
+
+# %%
+# XGBoost：整個特徵矩陣只建立一次 DMatrix，每一折以 DMatrix.slice 取出資料
+# 每個區塊的第一折訓練 100 棵樹，之後每一折接著上一折的模型再訓練 10 棵樹
+dall = xgboost.DMatrix(features_data, label=labels_data, nthread=1)
+params = {
+    "objective": "binary:logistic",  # 設定目標函數為二元邏輯回歸（適合二分類任務）
+    "eval_metric": "logloss",  # 評估指標使用 logloss
+    "eta": 0.01,  # 設定學習率
+    "max_depth": 3,  # 設定樹的最大深度
+    "subsample": 0.8,  # 設定子樣本比例，防止過擬合
+    "nthread": 1,  # 每一折只使用一個執行緒，由 run_walk_forward 平行執行多個區塊
+}
+xgboost_signals = chap4_walk_forward.run_walk_forward(
+    chap4_walk_forward.xgboost_fit_predict(
+        dall, params, num_boost_round=100, warm_start_rounds=10
+    ),
+    folds,
+    meta_data,
+    n_jobs=-1,
+    chain_length=CHAIN_LENGTH,
+)
+
+# %%
+# 隨機森林：每個區塊的第一折訓練 10 棵樹，之後每一折以新的訓練視窗再新增 2 棵樹
+random_forest_signals = chap4_walk_forward.run_walk_forward(
+    chap4_walk_forward.sklearn_fit_predict(
+        RandomForestClassifier(n_estimators=10, random_state=1326),
+        features_data,
+        labels_data,
+        predict_proba=True,
+        warm_start_estimators=2,
+    ),
+    folds,
+    meta_data,
+    n_jobs=-1,
+    chain_length=CHAIN_LENGTH,
+)
+
+# %%
+# 邏輯迴歸：以上一折的係數作為起始值（warm start）
+logistic_regression_signals = chap4_walk_forward.run_walk_forward(
+    chap4_walk_forward.sklearn_fit_predict(
+        LogisticRegression(random_state=1326, max_iter=1000),
+        features_data,
+        labels_data,
+        predict_proba=True,
+    ),
+    folds,
+    meta_data,
+    n_jobs=-1,
+    chain_length=CHAIN_LENGTH,
+)
+
+# %%
+# 評估所有折的樣本外預測，預測上漲的機率大於 0.5 視為上漲
+for name, signals in [
+    ("XGBoost", xgboost_signals),
+    ("Random Forest", random_forest_signals),
+    ("Logistic Regression", logistic_regression_signals),
+]:
+    print(f"{name} Out-of-Sample Classification Report: ")
+    print(
+        classification_report(
+            y_true=signals["label"], y_pred=(signals["prediction"] > 0.5).astype(int)
+        )
+    )
+
+# 訊號表：每一列為某檔股票某一天的樣本外預測
+print(xgboost_signals.head())
+
+# %%
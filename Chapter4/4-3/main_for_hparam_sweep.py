@@ -0,0 +1,193 @@
+# %%
+# 載入需要的套件
+import json
+import os
+import random
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+
+import Chapter4.sweep as chap4_sweep  # noqa: E402
+import Chapter4.utils as chap4_utils  # noqa: E402
+
+# %%
+""" 設置隨機種子以確保結果的可重現性 """
+# 設置 Python、NumPy 和 PyTorch 的隨機種子, 以確保隨機操作的可重現性。
+seed = 1326
+random.seed(seed)
+np.random.seed(seed)
+torch.manual_seed(seed)
+
+# %%
+""" 設置數據集時間範圍和搜尋設定 """
+# 從 train_config.json 中讀取 TICKERS 和日期範圍
+with open(
+    utils_folder_path + "/Chapter4/4-3/train_config.json", "r", encoding="utf-8"
+) as file:
+    train_config = json.load(file)
+# 從 sweep_config.json 中讀取要搜尋的模型、搜尋範圍與 successive halving 的設定
+with open(
+    utils_folder_path + "/Chapter4/4-3/sweep_config.json", "r", encoding="utf-8"
+) as file:
+    sweep_config = json.load(file)
+
+TICKERS = train_config["TICKERS"]
+TRAIN_START_DATE = train_config["TRAIN_START_DATE"]
+TRAIN_END_DATE = train_config["TRAIN_END_DATE"]
+VALID_START_DATE = train_config["VALID_START_DATE"]
+VALID_END_DATE = train_config["VALID_END_DATE"]
+
+MODEL = sweep_config["MODEL"]  # 要搜尋的模型：attention 或 lstm
+SEARCH = sweep_config["SEARCH"]  # 搜尋方式：grid 或 random
+N_TRIALS = sweep_config["N_TRIALS"]  # 隨機搜尋的組合數量
+SEARCH_SPACE = sweep_config["SEARCH_SPACE"][MODEL]  # 各超參數的候選值
+MIN_EPOCHS = sweep_config["MIN_EPOCHS"]  # 第一輪每個組合訓練的 epoch 數
+MAX_EPOCHS = sweep_config["MAX_EPOCHS"]  # 留到最後的組合訓練的 epoch 數
+ETA = sweep_config["ETA"]  # 每一輪只保留前 1/ETA 的組合
+WORKERS = sweep_config["WORKERS"]  # 同時訓練的行程數，None 表示依 CPU 核心數決定
+THREADS_PER_WORKER = sweep_config["THREADS_PER_WORKER"]  # 每個行程使用的執行緒數
+
+# 設置搜尋結果（results.csv、best.pth、best_config.json）保存的路徑
+SWEEP_PATH = utils_folder_path + f"/Chapter4/4-3/sweep/{MODEL}/"
+
+# %%
+""" 模型定義 """
+# 與 main_for_attention_model.py、main_for_lstm.py 相同的模型
+
+
+class AttentionModel(nn.Module):
+    def __init__(
+        self, input_size, attn_embed_dim, attn_num_heads, dropout, output_size
+    ):
+        super(AttentionModel, self).__init__()
+        self.linear1 = nn.Linear(in_features=input_size, out_features=attn_embed_dim)
+        self.self_attn = nn.MultiheadAttention(
+            embed_dim=attn_embed_dim,
+            num_heads=attn_num_heads,
+            dropout=dropout,
+            batch_first=True,
+        )
+        self.linear2 = nn.Linear(in_features=attn_embed_dim, out_features=output_size)
+
+    def forward(self, inputs):
+        # (batch_size, seq_length, features_nums) -> (batch_size, seq_length, attn_embed_dim)
+        outputs = self.linear1(inputs)
+        outputs, _ = self.self_attn(outputs, outputs, outputs)
+        # (batch_size, seq_length, attn_embed_dim) -> (batch_size, output_size)
+        outputs = self.linear2(outputs[:, -1, :])
+        return outputs
+
+
+class LSTMModel(nn.Module):
+    def __init__(self, input_size, hidden_size, num_layers, output_size):
+        super(LSTMModel, self).__init__()
+        self.lstm = nn.LSTM(
+            input_size=input_size,
+            hidden_size=hidden_size,
+            num_layers=num_layers,
+            batch_first=True,
+        )
+        self.linear = nn.Linear(in_features=hidden_size, out_features=output_size)
+
+    def forward(self, inputs):
+        # (batch_size, seq_length, features_nums) -> (batch_size, seq_length, hidden_size)
+        outputs, _ = self.lstm(inputs)
+        # (batch_size, seq_length, hidden_size) -> (batch_size, output_size)
+        outputs = self.linear(outputs[:, -1, :])
+        return outputs
+
+
+def build_model(config):
+    # 依超參數組合建立模型，在各個子行程中呼叫
+    if MODEL == "attention":
+        return AttentionModel(
+            input_size=5,
+            attn_embed_dim=config["attn_embed_dim"],
+            attn_num_heads=config["attn_num_heads"],
+            dropout=0.1,
+            output_size=1,
+        )
+    return LSTMModel(
+        input_size=5,
+        hidden_size=config["hidden_size"],
+        num_layers=config["num_layers"],
+        output_size=1,
+    )
+
+
+# %%
+""" 數據準備與平行搜尋超參數 """
+# 子行程使用 spawn 啟動時(Windows、macOS)會重新載入這個檔案，
+# 數據準備與搜尋必須放在 __main__ 區塊內，子行程只會用到上面的模型定義
+if __name__ == "__main__":
+    # 數據準備
+    # 從本地快取讀取價量資料，並以訓練期間的資料擬合縮放器
+    panel_data = chap4_utils.load_panel_data(
+        tickers=TICKERS,
+        start_date=TRAIN_START_DATE,
+        end_date=VALID_END_DATE,
+    )
+    features_scalers = chap4_utils.fit_panel_scalers(
+        panel_data, start_date=TRAIN_START_DATE, end_date=TRAIN_END_DATE
+    )
+    train_data = chap4_utils.transform_panel_data(
+        panel_data,
+        features_scalers,
+        start_date=TRAIN_START_DATE,
+        end_date=TRAIN_END_DATE,
+    )
+    valid_data = chap4_utils.transform_panel_data(
+        panel_data,
+        features_scalers,
+        start_date=VALID_START_DATE,
+        end_date=VALID_END_DATE,
+    )
+
+    # 每個序列長度只建立一次數據集，所有組合共用（測試資料不參與超參數搜尋）
+    datasets = chap4_sweep.build_windowed_datasets(
+        train_data,
+        valid_data,
+        seq_lengths=SEARCH_SPACE["SEQ_LENGTH"],
+        x_idx=[0, 1, 2, 3, 4],  # 特徵索引
+        y_idx=3,  # 預測目標為 Close 價格
+    )
+
+    # 產生超參數組合
+    # 多頭注意力的 attn_embed_dim 必須能被 attn_num_heads 整除
+    configs = chap4_sweep.build_search_space(
+        SEARCH_SPACE,
+        search=SEARCH,
+        n_trials=N_TRIALS,
+        seed=seed,
+        constraint=(
+            (lambda config: config["attn_embed_dim"] % config["attn_num_heads"] == 0)
+            if MODEL == "attention"
+            else None
+        ),
+    )
+    print(f"超參數組合數量: {len(configs)}")
+
+    # 以 successive halving 平行搜尋超參數
+    # 每一輪只保留驗證損失最低的 1/ETA 組合繼續訓練，表現差的組合提早停止
+    results = chap4_sweep.run_successive_halving(
+        configs,
+        model_fn=build_model,
+        datasets=datasets,
+        output_dir=SWEEP_PATH,
+        min_epochs=MIN_EPOCHS,
+        max_epochs=MAX_EPOCHS,
+        eta=ETA,
+        workers=WORKERS,
+        threads_per_worker=THREADS_PER_WORKER,
+        seed=seed,
+    )
+
+    # 顯示驗證損失最低的前 10 個組合
+    print(results.head(10).to_string())
+
+# %%
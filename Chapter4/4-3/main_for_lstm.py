@@ -8,13 +8,12 @@ import sys
 import numpy as np
 import torch
 import torch.nn as nn
-from sklearn.preprocessing import MinMaxScaler
-from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 
 utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(utils_folder_path)
 
+import Chapter4.trainer as chap4_trainer  # noqa: E402
 import Chapter4.utils as chap4_utils  # noqa: E402
 
 # %%
@@ -26,15 +25,15 @@ torch.manual_seed(seed)
 
 # %%
 """ 設置數據集時間範圍和訓練超參數 """
-# 從 train_config.json 中讀取配置，包括 TICKER、日期範圍和超參數
+# 從 train_config.json 中讀取配置，包括 TICKERS、日期範圍和超參數
 with open(
     utils_folder_path + "/Chapter4/4-3/train_config.json", "r", encoding="utf-8"
 ) as file:
     train_config = json.load(file)
 
 
-# 設定要訓練的股票代碼
-TICKER = train_config["TICKER"]
+# 設定要訓練的股票代碼，所有股票共同訓練一個模型
+TICKERS = train_config["TICKERS"]
 
 # 設定訓練、驗證、測試資料的開始和結束日期
 TRAIN_START_DATE = train_config["TRAIN_START_DATE"]
@@ -57,67 +56,66 @@ MODELPARAM_PATH = utils_folder_path + "/Chapter4/4-3/model_param/lstm/"
 
 # %%
 """ 數據準備 """
-# 生成訓練、驗證和測試數據
-train_data = chap4_utils.generate_ticker_data(
-    ticker=TICKER,
+# 從本地快取一次讀取所有股票的價量資料（快取中沒有的股票一次下載），再依日期切分
+panel_data = chap4_utils.load_panel_data(
+    tickers=TICKERS,
     start_date=TRAIN_START_DATE,
-    end_date=TRAIN_END_DATE,
-)[["Open", "High", "Low", "Close", "Volume"]]
-
-
-valid_data = chap4_utils.generate_ticker_data(
-    ticker=TICKER,
-    start_date=VALID_START_DATE,
-    end_date=VALID_END_DATE,
-)[["Open", "High", "Low", "Close", "Volume"]]
-
-
-test_data = chap4_utils.generate_ticker_data(
-    ticker=TICKER, start_date=TEST_START_DATE, end_date=TEST_END_DATE
-)[["Open", "High", "Low", "Close", "Volume"]]
-
+    end_date=TEST_END_DATE,
+)
 
-# 顯示訓練、驗證和測試集的資料筆數
-print(f"訓練集資料筆數: {train_data.shape[0]}")  # 訓練集資料筆數: 488
-print(f"測試集資料筆數: {valid_data.shape[0]}")  # 測試集資料筆數: 246
-print(f"驗證集資料筆數: {test_data.shape[0]}")  # 驗證集資料筆數: 239
+# 進行特徵縮放，每檔股票各自使用 MinMaxScaler 將特徵數據縮放到 [0, 1] 範圍內
+# 使用訓練期間的資料擬合縮放器，計算每檔股票每個特徵的最小值和最大值
+features_scalers = chap4_utils.fit_panel_scalers(
+    panel_data, start_date=TRAIN_START_DATE, end_date=TRAIN_END_DATE
+)
+# 使用與訓練資料相同的縮放規則，對訓練、驗證和測試資料進行縮放
+train_data = chap4_utils.transform_panel_data(
+    panel_data, features_scalers, start_date=TRAIN_START_DATE, end_date=TRAIN_END_DATE
+)
+valid_data = chap4_utils.transform_panel_data(
+    panel_data, features_scalers, start_date=VALID_START_DATE, end_date=VALID_END_DATE
+)
+test_data = chap4_utils.transform_panel_data(
+    panel_data, features_scalers, start_date=TEST_START_DATE, end_date=TEST_END_DATE
+)
 
-# 進行特徵縮放，使用 MinMaxScaler 將特徵數據縮放到 [0, 1] 範圍內
-features_scaler = MinMaxScaler()
-# 使用訓練資料擬合縮放器，計算每個特徵的最小值和最大值
-# 這一步是根據訓練資料計算縮放標準，並記錄下這些標準
-features_scaler.fit(train_data)
-# 使用之前計算出的標準，將訓練資料縮放到 [0, 1] 的範圍
-train_data = features_scaler.transform(train_data)
-# 使用與訓練資料使用相同的縮放規則對驗證資料進行縮放
-valid_data = features_scaler.transform(valid_data)
-# 使用與訓練資料使用相同的縮放規則對測試資料進行縮放
-test_data = features_scaler.transform(test_data)
+# 顯示訓練、驗證和測試集的資料筆數（所有股票加總）
+print(f"訓練集資料筆數: {sum(len(data) for data in train_data.values())}")
+print(f"驗證集資料筆數: {sum(len(data) for data in valid_data.values())}")
+print(f"測試集資料筆數: {sum(len(data) for data in test_data.values())}")
 
 
 # 創建訓練、驗證和測試數據集以及對應的數據加載器
-train_dataset = chap4_utils.StockDataset(
+# 所有股票的樣本放在同一個數據集中，訓練一個共用的模型
+train_dataset = chap4_utils.StockPanelDataset(
     train_data,
     SEQ_LENGTH,
     x_idx=[0, 1, 2, 3, 4],  # 特徵索引
     y_idx=3,  # 預測目標為 Close 價格
 )
-valid_dataset = chap4_utils.StockDataset(
+valid_dataset = chap4_utils.StockPanelDataset(
     valid_data,
     SEQ_LENGTH,
     x_idx=[0, 1, 2, 3, 4],
     y_idx=3,
 )
-test_dataset = chap4_utils.StockDataset(
+test_dataset = chap4_utils.StockPanelDataset(
     test_data,
     SEQ_LENGTH,
     x_idx=[0, 1, 2, 3, 4],
     y_idx=3,
 )
 # 建立數據加載器，batch_size 決定每次使用多少數據更新
-train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-valid_loader = DataLoader(valid_dataset, batch_size=BATCH_SIZE, shuffle=False)
-test_loader = DataLoader(test_dataset, batch_size=BATCH_SIZE, shuffle=False)
+# 數據集已預先轉為張量，每次直接以索引取出整個批次，不需要逐筆取樣本再合併
+train_loader = chap4_utils.create_batch_loader(
+    train_dataset, batch_size=BATCH_SIZE, shuffle=True
+)
+valid_loader = chap4_utils.create_batch_loader(
+    valid_dataset, batch_size=BATCH_SIZE, shuffle=False
+)
+test_loader = chap4_utils.create_batch_loader(
+    test_dataset, batch_size=BATCH_SIZE, shuffle=False
+)
 
 # %%
 """ 模型定義 """
@@ -171,95 +169,34 @@ hparams = {
 
 # %%
 """ 訓練循環 """
+# 使用共用的 Trainer 訓練模型：每個 epoch 評估驗證與測試資料，
+# 驗證損失創新低時儲存模型參數，並記錄每個 epoch 的時間與每秒樣本數到 TensorBoard
+trainer = chap4_trainer.Trainer(
+    model=model,
+    loss_fn=loss_fn,
+    optimizer=optimizer,
+    writer=writer,
+    checkpoint_path=MODELPARAM_PATH + "best.pth",
+    eval_every=1,
+)
 print("Start Training")
-for epoch in range(EPOCHS):  # 迭代每一個訓練週期
-    model.train()  # 將模型設置為訓練模式
-    train_loss = 0.0  # 初始化訓練損失為0
-    for batch_data in train_loader:  # 迭代每一個訓練批次資料
-        inputs, targets = batch_data  # 將批次資料分成特徵和目標
-        outputs = model(inputs)  # 透過模型進行前向傳播，獲取預測結果
-
-        # 計算損失值，將模型輸出的預測結果與真實目標進行比較
-        loss = loss_fn(outputs, targets.unsqueeze(-1))
-
-        optimizer.zero_grad()  # 將梯度緩衝器歸零，以便計算新的梯度
-        loss.backward()  # 執行反向傳播計算梯度
-        optimizer.step()  # 更新模型的參數
-
-        train_loss += loss.item()  # 將每個批次的損失值累加起來
-
-    train_loss = train_loss / len(train_loader)  # 計算平均訓練損失
-    print(f"Epoch {epoch+1}: Train Loss: {train_loss:.4f}")  # 輸出本輪訓練資料的損失值
-    writer.add_scalar(
-        tag="Train Loss", scalar_value=train_loss, global_step=epoch
-    )  # 將訓練損失值寫入 TensorBoard
-
-    model.eval()  # 將模型設置為評估模式
-    val_loss = 0.0  # 初始化驗證損失為0
-    with torch.no_grad():  # 停用梯度計算，進行驗證不需要更新參數
-        for batch_data in valid_loader:  # 迭代每一個驗證批次資料
-            inputs, targets = batch_data  # 將批次資料分成輸入和目標
-            outputs = model(inputs)  # 透過模型進行前向傳播，獲取預測結果
-            loss = loss_fn(outputs, targets.unsqueeze(-1))  # 計算驗證損失
-            val_loss += loss.item()  # 累加驗證損失
-
-    val_loss = val_loss / len(valid_loader.dataset)  # 計算平均驗證損失
-    print(f"Epoch {epoch+1}: Valid Loss: {val_loss:.4f}")  # 輸出本輪驗證資料的損失值
-    writer.add_scalar(
-        tag="Valid Loss", scalar_value=val_loss, global_step=epoch
-    )  # 將驗證損失值寫入 TensorBoard
-
-    model.eval()  # 確保模型處於評估模式
-    test_loss = 0.0  # 初始化測試損失為0
-    with torch.no_grad():  # 停用梯度計算，進行測試不需要更新參數
-        for batch_data in test_loader:  # 迭代每一個測試批次資料
-            inputs, targets = batch_data  # 將批次資料分成輸入和目標
-            outputs = model(inputs)  # 透過模型進行前向傳播，獲取預測結果
-            loss = loss_fn(outputs, targets.unsqueeze(-1))  # 計算測試損失
-            test_loss += loss.item()  # 累加測試損失
-
-    test_loss = test_loss / len(test_loader.dataset)  # 計算平均測試損失
-    print(f"Epoch {epoch}: Test Loss: {test_loss:.4f}")  # 輸出本輪測試資料的損失值
-    writer.add_scalar(
-        tag="Test Loss", scalar_value=test_loss, global_step=epoch
-    )  # 將測試損失值寫入 TensorBoard
-
-    # 每隔 10 個 epoch 保存一次模型參數
-    if epoch % 10 == 0 and epoch != 0:
-        torch.save(
-            model.state_dict(), MODELPARAM_PATH + f"epoch_{epoch+1}.pth"
-        )  # 儲存模型
+trainer.fit(train_loader, valid_loader, epochs=EPOCHS, test_loader=test_loader)
+print(f"Best Epoch: {trainer.best_epoch}, Valid Loss: {trainer.best_valid_loss:.4f}")
 
 # 最後記錄訓練、驗證和測試損失值
-final_metrics = {
-    "Train Loss": train_loss,
-    "Valid Loss": val_loss,
-    "Test Loss": test_loss,
-}
-writer.add_hparams(hparam_dict=hparams, metric_dict=final_metrics, global_step=epoch)
+writer.add_hparams(
+    hparam_dict=hparams,
+    metric_dict=trainer.final_metrics(),
+    global_step=EPOCHS - 1,
+)
 writer.close()
 
 # %%
 """ 繪製訓練集預測結果 """
-# 設置模型為評估模式
-model.eval()
-
-# 用來儲存訓練集的預測結果和真實值
-train_predicted_outputs = []
-train_true_outputs = []
-
-# 在不計算梯度下進行推論
-with torch.no_grad():
-    # 迭代訓練數據加載器中的每個批次數據
-    for batch_data in train_loader:
-        # 將批次資料分成特徵和目標
-        inputs, targets = batch_data
-        # 使用模型對輸入進行推論，得到預測結果
-        outputs = model(inputs)
-        train_predicted_outputs.extend(outputs.squeeze().detach().numpy())  # 預測值
-        train_true_outputs.extend(targets.numpy())  # 真實值
-
-# 繪製訓練集的真實值與預測值對比圖
+# 依時間順序對訓練集推論一次(訓練用的 train_loader 會打亂順序)
+train_predicted_outputs, train_true_outputs = trainer.predict(
+    chap4_utils.create_batch_loader(train_dataset, batch_size=BATCH_SIZE)
+)
 chap4_utils.lineplot_true_and_predicted_result(
     true_values=train_true_outputs,
     predicted_values=train_predicted_outputs,
@@ -268,17 +205,8 @@ chap4_utils.lineplot_true_and_predicted_result(
 
 # %%
 """ 繪製驗證集預測結果 """
-model.eval()
-valid_predicted_outputs = []
-valid_true_outputs = []
-
-with torch.no_grad():
-    for batch_data in valid_loader:
-        inputs, targets = batch_data
-        outputs = model(inputs)
-        valid_predicted_outputs.extend(outputs.squeeze().detach().numpy())
-        valid_true_outputs.extend(targets.numpy())
-
+# 直接使用最後一次評估時的預測結果，不需要再推論一次
+valid_predicted_outputs, valid_true_outputs = trainer.predictions["Valid"]
 chap4_utils.lineplot_true_and_predicted_result(
     true_values=valid_true_outputs,
     predicted_values=valid_predicted_outputs,
@@ -287,17 +215,7 @@ chap4_utils.lineplot_true_and_predicted_result(
 
 # %%
 """ 繪製測試集預測結果 """
-model.eval()
-test_predicted_outputs = []
-test_true_outputs = []
-
-with torch.no_grad():
-    for batch_data in test_loader:
-        inputs, targets = batch_data
-        outputs = model(inputs)
-        test_predicted_outputs.extend(outputs.squeeze().detach().numpy())
-        test_true_outputs.extend(targets.numpy())
-
+test_predicted_outputs, test_true_outputs = trainer.predictions["Test"]
 chap4_utils.lineplot_true_and_predicted_result(
     true_values=test_true_outputs,
     predicted_values=test_predicted_outputs,
@@ -0,0 +1,310 @@
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Dataset
+from typing_extensions import Annotated
+
+import Chapter4.trainer as chap4_trainer
+import Chapter4.utils as chap4_utils
+
+# 子行程中的共用狀態（數據集、建立模型的函式等），由 _init_worker 設定
+_WORKER_STATE = {}
+
+
+def build_search_space(
+    space: Annotated[
+        Dict[str, object],
+        "參數名稱 -> 候選值列表，或 {'low': 下限, 'high': 上限, 'log': 是否取對數} 的範圍",
+    ],
+    search: Annotated[str, "grid（網格搜尋）或 random（隨機搜尋）"] = "grid",
+    n_trials: Annotated[Optional[int], "隨機搜尋的組合數量"] = None,
+    seed: Annotated[int, "隨機搜尋使用的隨機種子"] = 1326,
+    constraint: Annotated[
+        Optional[Callable[[Dict[str, object]], bool]],
+        "回傳 False 的組合會被排除，例如 attn_embed_dim 不能被 attn_num_heads 整除",
+    ] = None,
+) -> Annotated[List[Dict[str, object]], "超參數組合列表"]:
+    """
+    產生要嘗試的超參數組合。
+    - grid: 列出所有候選值的組合（範圍只能用於隨機搜尋）。
+    - random: 每個參數各自從候選值中隨機選一個，或在範圍內隨機取值，
+      log=True 時在對數尺度上均勻取值（適合學習率）。
+    """
+    if search == "grid":
+        keys = list(space)
+        for key in keys:
+            if not isinstance(space[key], (list, tuple)):
+                raise ValueError(f"網格搜尋的 {key} 必須是候選值列表")
+        configs = [
+            dict(zip(keys, values))
+            for values in itertools.product(*(space[key] for key in keys))
+        ]
+    elif search == "random":
+        if n_trials is None:
+            raise ValueError("隨機搜尋需要設定 n_trials")
+        rng = np.random.default_rng(seed)
+        configs = []
+        # 被 constraint 排除的組合不算，最多嘗試 100 倍的次數
+        for _ in range(n_trials * 100):
+            if len(configs) >= n_trials:
+                break
+            config = {}
+            for key, values in space.items():
+                if isinstance(values, dict):
+                    low, high = values["low"], values["high"]
+                    if values.get("log", False):
+                        value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                    else:
+                        value = float(rng.uniform(low, high))
+                else:
+                    value = values[rng.integers(len(values))]
+                    # numpy 的整數、浮點數轉成 Python 型別，方便寫入 json
+                    value = value.item() if isinstance(value, np.generic) else value
+                config[key] = value
+            if constraint is None or constraint(config):
+                configs.append(config)
+        return configs
+    else:
+        raise ValueError(f"不支援的搜尋方式: {search}")
+
+    if constraint is not None:
+        configs = [config for config in configs if constraint(config)]
+    return configs
+
+
+def build_windowed_datasets(
+    train_data: Annotated[
+        Dict[str, np.ndarray], "訓練資料，transform_panel_data 的結果"
+    ],
+    valid_data: Annotated[
+        Dict[str, np.ndarray], "驗證資料，transform_panel_data 的結果"
+    ],
+    seq_lengths: Annotated[List[int], "要嘗試的序列長度"],
+    x_idx: Annotated[List[int], "特徵索引"],
+    y_idx: Annotated[int, "目標值索引"],
+) -> Annotated[
+    Dict[int, Tuple[Dataset, Dataset]], "序列長度 -> (訓練數據集, 驗證數據集)"
+]:
+    """
+    每個序列長度只建立一次訓練與驗證的 StockPanelDataset，
+    所有使用相同序列長度的組合共用，不需要每個組合重新下載與切分資料。
+    """
+    return {
+        seq_length: (
+            chap4_utils.StockPanelDataset(train_data, seq_length, x_idx, y_idx),
+            chap4_utils.StockPanelDataset(valid_data, seq_length, x_idx, y_idx),
+        )
+        for seq_length in sorted(set(seq_lengths))
+    }
+
+
+def _init_worker(model_fn, datasets, trial_dir, seed, threads_per_worker):
+    """
+    子行程的初始化：限制 PyTorch 使用的執行緒數量，避免多個行程互相搶 CPU，
+    並保存數據集與建立模型的函式，之後每個組合直接取用。
+    """
+    torch.set_num_threads(threads_per_worker)
+    _WORKER_STATE.update(
+        model_fn=model_fn,
+        datasets=datasets,
+        trial_dir=trial_dir,
+        seed=seed,
+    )
+
+
+def _trial_checkpoint_path(trial_dir, trial_id):
+    return os.path.join(trial_dir, f"trial_{trial_id}.pth")
+
+
+def _train_trial(trial_id, config, target_epochs):
+    """
+    讀取組合上一次的模型與優化器參數，繼續訓練到 target_epochs 個 epoch，
+    回傳驗證損失並把目前的參數存回硬碟，下一輪可以接著訓練。
+    """
+    train_dataset, valid_dataset = _WORKER_STATE["datasets"][config["SEQ_LENGTH"]]
+    seed = _WORKER_STATE["seed"]
+    path = _trial_checkpoint_path(_WORKER_STATE["trial_dir"], trial_id)
+
+    torch.manual_seed(seed + trial_id)
+    model = _WORKER_STATE["model_fn"](config)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config["LEARNING_RATE"])
+    epochs_done = 0
+    if os.path.exists(path):
+        checkpoint = torch.load(path)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        epochs_done = checkpoint["epochs"]
+
+    trainer = chap4_trainer.Trainer(model, torch.nn.MSELoss(), optimizer)
+    train_loader = chap4_utils.create_batch_loader(
+        train_dataset, batch_size=config["BATCH_SIZE"], shuffle=True
+    )
+    valid_loader = chap4_utils.create_batch_loader(
+        valid_dataset, batch_size=config["BATCH_SIZE"]
+    )
+    start_time = time.perf_counter()
+    train_loss = np.nan
+    for epoch in range(epochs_done, target_epochs):
+        # 打亂順序只取決於組合與 epoch，與哪個行程執行無關
+        torch.manual_seed(seed + trial_id * 100003 + epoch)
+        train_loss = trainer.train_epoch(train_loader)["loss"]
+    valid_loss = trainer.evaluate(valid_loader)["loss"]
+    seconds = time.perf_counter() - start_time
+
+    torch.save(
+        {
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "epochs": target_epochs,
+        },
+        path,
+    )
+    return {
+        "trial_id": trial_id,
+        "epochs": target_epochs,
+        "train_loss": train_loss,
+        "valid_loss": valid_loss,
+        "seconds": seconds,
+    }
+
+
+def run_successive_halving(
+    configs: Annotated[List[Dict[str, object]], "build_search_space 的結果"],
+    model_fn: Annotated[
+        Callable[[Dict[str, object]], torch.nn.Module],
+        "依超參數組合建立模型的函式（需定義在模組最上層，子行程才能取用）",
+    ],
+    datasets: Annotated[
+        Dict[int, Tuple[Dataset, Dataset]], "build_windowed_datasets 的結果"
+    ],
+    output_dir: Annotated[str, "結果表、最佳模型參數與各組合暫存參數的存放資料夾"],
+    min_epochs: Annotated[int, "第一輪每個組合訓練的 epoch 數"] = 3,
+    max_epochs: Annotated[int, "留到最後的組合訓練的 epoch 數"] = 27,
+    eta: Annotated[int, "每一輪只保留前 1/eta 的組合，下一輪的 epoch 數乘以 eta"] = 3,
+    workers: Annotated[
+        Optional[int], "同時訓練的行程數，None 表示 CPU 核心數 / 每個行程的執行緒數"
+    ] = None,
+    threads_per_worker: Annotated[int, "每個行程 PyTorch 使用的執行緒數"] = 1,
+    seed: Annotated[int, "隨機種子"] = 1326,
+) -> Annotated[
+    pd.DataFrame, "每個組合的超參數、訓練 epoch 數、損失與狀態，依驗證損失排序"
+]:
+    """
+    以 successive halving 搜尋超參數：
+    1. 所有組合各訓練 min_epochs 個 epoch，計算驗證損失。
+    2. 只保留驗證損失最低的 1/eta 組合，從上一輪的參數繼續訓練到 eta 倍的 epoch 數，
+       直到 max_epochs 為止，表現差的組合不會浪費時間訓練到最後。
+    每一輪的組合以多個行程平行訓練，每個行程只使用 threads_per_worker 個執行緒。
+    Linux 以外的平台(Windows、macOS)以 spawn 啟動子行程，呼叫端的數據準備與搜尋必須放在
+    if __name__ == "__main__": 區塊內，model_fn 必須定義在模組最上層。
+    結果表存成 {output_dir}/results.csv，驗證損失最低的模型參數存成
+    {output_dir}/best.pth（與 Trainer 儲存的格式相同），超參數存成 best_config.json。
+    """
+    trial_dir = os.path.join(output_dir, "trials")
+    os.makedirs(trial_dir, exist_ok=True)
+    # 清除上一次搜尋留下的暫存參數，避免新的組合接著舊的參數訓練
+    for filename in os.listdir(trial_dir):
+        if filename.startswith("trial_") and filename.endswith(".pth"):
+            os.remove(os.path.join(trial_dir, filename))
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    trials = {
+        trial_id: {
+            "trial_id": trial_id,
+            **config,
+            "rung": 0,
+            "epochs": 0,
+            "train_loss": np.nan,
+            "valid_loss": np.nan,
+            "seconds": 0.0,
+            "status": "running",
+        }
+        for trial_id, config in enumerate(configs)
+    }
+    active = list(trials)
+    # Linux 上使用 fork，子行程直接共用主行程已經建立好的數據集；
+    # 其他平台(Windows、macOS)使用 spawn，子行程會重新載入呼叫端的檔案，
+    # 呼叫端必須把數據準備與搜尋放在 if __name__ == "__main__": 區塊內
+    # (macOS 也有 fork，但在已載入 torch 等套件的行程中 fork 並不安全，Python 3.8 起預設為 spawn)
+    if sys.platform.startswith("linux"):
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+        try:
+            pickle.dumps(model_fn)
+        except (pickle.PicklingError, AttributeError, TypeError) as error:
+            raise ValueError(
+                "使用 spawn 啟動子行程時，model_fn 必須是定義在模組最上層的函式"
+                "（不能是 lambda 或巢狀函式）"
+            ) from error
+    rung, budget = 0, min(min_epochs, max_epochs)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(model_fn, datasets, trial_dir, seed, threads_per_worker),
+    ) as executor:
+        while active:
+            start_time = time.perf_counter()
+            results = executor.map(
+                _train_trial,
+                active,
+                [configs[trial_id] for trial_id in active],
+                [budget] * len(active),
+            )
+            for result in results:
+                trial = trials[result["trial_id"]]
+                trial.update(
+                    rung=rung,
+                    epochs=result["epochs"],
+                    train_loss=result["train_loss"],
+                    valid_loss=result["valid_loss"],
+                    seconds=trial["seconds"] + result["seconds"],
+                )
+            # 驗證損失由低到高排序，nan（例如訓練發散）排在最後
+            active.sort(
+                key=lambda trial_id: np.nan_to_num(
+                    trials[trial_id]["valid_loss"], nan=np.inf
+                )
+            )
+            best = trials[active[0]]
+            print(
+                f"Rung {rung}: {len(active)} trials x {budget} epochs "
+                f"({time.perf_counter() - start_time:.1f}s), "
+                f"Best Valid Loss: {best['valid_loss']:.4f} (trial {best['trial_id']})"
+            )
+            if budget >= max_epochs:
+                for trial_id in active:
+                    trials[trial_id]["status"] = "completed"
+                break
+            n_keep = max(1, len(active) // eta)
+            for trial_id in active[n_keep:]:
+                trials[trial_id]["status"] = "pruned"
+                os.remove(_trial_checkpoint_path(trial_dir, trial_id))
+            active = active[:n_keep]
+            rung, budget = rung + 1, min(budget * eta, max_epochs)
+
+    results = pd.DataFrame(list(trials.values()))
+    results = results.sort_values(
+        ["epochs", "valid_loss"], ascending=[False, True], na_position="last"
+    ).reset_index(drop=True)
+    results.to_csv(os.path.join(output_dir, "results.csv"), index=False)
+
+    # 訓練到最後的組合中驗證損失最低的即為最佳組合
+    best_trial_id = int(results.loc[0, "trial_id"])
+    checkpoint = torch.load(_trial_checkpoint_path(trial_dir, best_trial_id))
+    torch.save(checkpoint["model"], os.path.join(output_dir, "best.pth"))
+    with open(os.path.join(output_dir, "best_config.json"), "w", encoding="utf-8") as f:
+        json.dump(configs[best_trial_id], f, indent=4)
+    return results
@@ -0,0 +1,188 @@
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from typing_extensions import Annotated
+
+
+class Trainer:
+    """
+    4-3 各個模型共用的訓練與評估流程。
+    - 每 eval_every 個 epoch(以及最後一個 epoch)評估一次驗證與測試資料，
+      評估時使用 torch.inference_mode，並把預測值寫入預先配置的陣列，
+      最後一次評估的預測值保存在 predictions，畫圖時不需要再跑一次模型。
+    - 驗證損失創新低時才儲存模型參數(checkpoint_path)。
+    - 每個 epoch 的損失、花費時間與每秒處理的樣本數寫入 TensorBoard(writer)，
+      可以用每秒樣本數比較不同模型的速度。
+    """
+
+    def __init__(
+        self,
+        model: Annotated[torch.nn.Module, "要訓練的模型"],
+        loss_fn: Annotated[torch.nn.Module, "損失函數"],
+        optimizer: Annotated[torch.optim.Optimizer, "優化器"],
+        writer: Annotated[Optional[object], "TensorBoard 的 SummaryWriter"] = None,
+        checkpoint_path: Annotated[
+            Optional[str], "驗證損失最低的模型參數儲存路徑，None 表示不儲存"
+        ] = None,
+        eval_every: Annotated[int, "每幾個 epoch 評估一次驗證與測試資料"] = 1,
+    ):
+        self.model = model
+        self.loss_fn = loss_fn
+        self.optimizer = optimizer
+        self.writer = writer
+        self.checkpoint_path = checkpoint_path
+        self.eval_every = eval_every
+        # 每個 epoch 的紀錄，例如 {"epoch": 1, "Train Loss": ..., "Valid Loss": ...}
+        self.history: List[Dict[str, float]] = []
+        # 最後一次評估的 (預測值, 真實值)，鍵為 "Valid"、"Test"
+        self.predictions: Dict[str, tuple] = {}
+        self.best_valid_loss = np.inf
+        self.best_epoch = None
+
+    def _log(self, tag: str, value: float, epoch: int):
+        if self.writer is not None:
+            self.writer.add_scalar(tag=tag, scalar_value=value, global_step=epoch)
+
+    def train_epoch(
+        self, loader: Annotated[DataLoader, "訓練資料的數據加載器"]
+    ) -> Annotated[Dict[str, float], "平均訓練損失、花費秒數與每秒樣本數"]:
+        """
+        訓練一個 epoch，回傳各批次損失的平均(與原本 train_loss / len(train_loader) 相同)。
+        """
+        self.model.train()
+        total_loss, n_batches, n_samples = 0.0, 0, 0
+        start_time = time.perf_counter()
+        for inputs, targets in loader:
+            outputs = self.model(inputs)
+            loss = self.loss_fn(outputs, targets.unsqueeze(-1))
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+            total_loss += loss.item()
+            n_batches += 1
+            n_samples += len(targets)
+        seconds = time.perf_counter() - start_time
+        return {
+            "loss": total_loss / max(n_batches, 1),
+            "seconds": seconds,
+            "samples_per_second": n_samples / seconds if seconds > 0 else np.nan,
+        }
+
+    def evaluate(
+        self, loader: Annotated[DataLoader, "要評估的數據加載器(不要打亂順序)"]
+    ) -> Annotated[Dict[str, object], "平均損失、預測值、真實值、花費秒數與每秒樣本數"]:
+        """
+        以 torch.inference_mode 對整個數據集推論一次，同時計算損失與收集預測值。
+        預測值與真實值寫入依數據集大小預先配置的陣列，不需要每個批次 extend 串列。
+        損失為每個樣本損失的平均(依批次大小加權)。
+        """
+        self.model.eval()
+        n = len(loader.dataset)
+        predictions, true_values = None, np.empty(n, dtype=np.float32)
+        total_loss, position = 0.0, 0
+        start_time = time.perf_counter()
+        with torch.inference_mode():
+            for inputs, targets in loader:
+                outputs = self.model(inputs)
+                batch_size = len(targets)
+                total_loss += (
+                    self.loss_fn(outputs, targets.unsqueeze(-1)).item() * batch_size
+                )
+                if predictions is None:
+                    predictions = np.empty((n, *outputs.shape[1:]), dtype=np.float32)
+                predictions[position : position + batch_size] = outputs.numpy()
+                true_values[position : position + batch_size] = targets.numpy()
+                position += batch_size
+        seconds = time.perf_counter() - start_time
+        if predictions is None:
+            predictions = np.empty(0, dtype=np.float32)
+        elif predictions.ndim == 2 and predictions.shape[1] == 1:
+            # 單一輸出的模型 (n, 1) -> (n,)
+            predictions = predictions[:, 0]
+        return {
+            "loss": total_loss / n if n > 0 else np.nan,
+            "predictions": predictions,
+            "true_values": true_values,
+            "seconds": seconds,
+            "samples_per_second": n / seconds if seconds > 0 else np.nan,
+        }
+
+    def predict(
+        self, loader: Annotated[DataLoader, "要推論的數據加載器"]
+    ) -> Annotated[tuple, "(預測值, 真實值)"]:
+        """
+        回傳模型對 loader 中所有樣本的預測值與真實值。
+        """
+        result = self.evaluate(loader)
+        return result["predictions"], result["true_values"]
+
+    def fit(
+        self,
+        train_loader: Annotated[DataLoader, "訓練資料的數據加載器"],
+        valid_loader: Annotated[DataLoader, "驗證資料的數據加載器"],
+        epochs: Annotated[int, "訓練的次數"],
+        test_loader: Annotated[
+            Optional[DataLoader], "測試資料的數據加載器，None 表示不評估"
+        ] = None,
+    ) -> Annotated[List[Dict[str, float]], "每個 epoch 的紀錄"]:
+        """
+        訓練 epochs 次，每 eval_every 個 epoch 與最後一個 epoch 評估驗證與測試資料，
+        驗證損失創新低時儲存模型參數。
+        """
+        eval_loaders = {"Valid": valid_loader}
+        if test_loader is not None:
+            eval_loaders["Test"] = test_loader
+
+        for epoch in range(epochs):
+            epoch_start = time.perf_counter()
+            train_result = self.train_epoch(train_loader)
+            record = {"epoch": epoch + 1, "Train Loss": train_result["loss"]}
+            print(
+                f"Epoch {epoch+1}: Train Loss: {train_result['loss']:.4f} "
+                f"({train_result['samples_per_second']:.0f} samples/s)"
+            )
+            self._log("Train Loss", train_result["loss"], epoch)
+            self._log(
+                "Train Samples Per Second", train_result["samples_per_second"], epoch
+            )
+
+            if (epoch + 1) % self.eval_every == 0 or epoch == epochs - 1:
+                for name, loader in eval_loaders.items():
+                    result = self.evaluate(loader)
+                    record[f"{name} Loss"] = result["loss"]
+                    self.predictions[name] = (
+                        result["predictions"],
+                        result["true_values"],
+                    )
+                    print(f"Epoch {epoch+1}: {name} Loss: {result['loss']:.4f}")
+                    self._log(f"{name} Loss", result["loss"], epoch)
+                    self._log(
+                        f"{name} Samples Per Second",
+                        result["samples_per_second"],
+                        epoch,
+                    )
+                # 驗證損失創新低時才儲存模型參數
+                if record["Valid Loss"] < self.best_valid_loss:
+                    self.best_valid_loss = record["Valid Loss"]
+                    self.best_epoch = epoch + 1
+                    if self.checkpoint_path is not None:
+                        torch.save(self.model.state_dict(), self.checkpoint_path)
+
+            record["Epoch Seconds"] = time.perf_counter() - epoch_start
+            self._log("Epoch Seconds", record["Epoch Seconds"], epoch)
+            self.history.append(record)
+        return self.history
+
+    def final_metrics(self) -> Annotated[Dict[str, float], "最後一次評估的損失"]:
+        """
+        回傳最後一次評估時的訓練、驗證和測試損失，供 writer.add_hparams 使用。
+        """
+        metrics = {}
+        for record in self.history:
+            metrics.update(
+                {key: value for key, value in record.items() if key.endswith("Loss")}
+            )
+        return metrics
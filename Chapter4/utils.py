@@ -1,8 +1,20 @@
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import torch
 import yfinance as yf
-from torch.utils.data import Dataset
+from sklearn.preprocessing import MinMaxScaler
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    Dataset,
+    RandomSampler,
+    SequentialSampler,
+)
 from typing_extensions import Annotated
 
 
@@ -65,7 +77,7 @@ def lineplot_true_and_predicted_result(
 
 
 class StockDataset(Dataset):
-    def __init__(self, data, seq_length, x_idx, y_idx):
+    def __init__(self, data, seq_length, x_idx, y_idx, materialize=True):
         """
         初始化自定義數據集，將資料處理為模型的輸入格式。
 
@@ -74,11 +86,28 @@ class StockDataset(Dataset):
         - seq_length: 每個樣本的時間序列長度，即需要過去幾天的數據來預測下一天。
         - x_idx: 特徵欄位的索引（選擇哪些欄位作為模型的輸入）。
         - y_idx: 目標值的索引（選擇哪一欄位作為模型的預測目標）。
+        - materialize: 是否在初始化時就將資料轉為 float32 張量。
+          為 True 時所有樣本都是同一個張量的視圖（unfold），取樣本不需要再建立新的張量，
+          並且可以用一組索引一次取出整個批次（搭配 create_batch_loader）。
         """
         self.data = data  # 儲存傳入的資料
         self.seq_length = seq_length  # 設定每個樣本的時間序列長度
         self.x_idx = x_idx  # 特徵欄位的索引
         self.y_idx = y_idx  # 目標值欄位的索引
+        self.materialize = materialize
+
+        if materialize:
+            # 只轉換一次成 float32 張量，數值與每次取樣本時再轉換相同
+            tensor = torch.as_tensor(np.asarray(data), dtype=torch.float32)
+            features = tensor[:, x_idx]
+            # 不複製資料的滑動視窗：(資料筆數, 特徵數) -> (樣本數, 特徵數, seq_length)
+            windows = features.unfold(0, min(seq_length, len(features)), 1)
+            if windows.dim() == 3:
+                # (樣本數, 特徵數, seq_length) -> (樣本數, seq_length, 特徵數)
+                windows = windows.transpose(1, 2)
+            # 最後一個視窗沒有下一天的目標值，不是樣本
+            self.windows = windows[: max(len(features) - seq_length, 0)]
+            self.targets = tensor[seq_length:, y_idx]
 
     def __len__(self):
         """
@@ -91,8 +120,11 @@ class StockDataset(Dataset):
         根據索引回傳一個樣本及其對應的目標值。
 
         參數:
-        - idx: 樣本的起始索引。
+        - idx: 樣本的起始索引。materialize=True 時也可以是一組索引（list 或張量），
+          一次回傳整個批次 (batch_size, seq_length, 特徵數) 與 (batch_size,)。
         """
+        if self.materialize:
+            return self.windows[idx], self.targets[idx]
         # 取得特徵數據 x
         x = self.data[idx : (idx + self.seq_length), self.x_idx]  # noqa: E203
         x = torch.tensor(x, dtype=torch.float32)
@@ -100,3 +132,247 @@ class StockDataset(Dataset):
         y = self.data[idx + self.seq_length, self.y_idx]
         y = torch.tensor(y, dtype=torch.float32)
         return x, y
+
+
+def create_batch_loader(
+    dataset: Annotated[StockDataset, "materialize=True 的 StockDataset"],
+    batch_size: Annotated[int, "批次大小"],
+    shuffle: Annotated[bool, "是否打亂樣本順序"] = False,
+) -> Annotated[DataLoader, "每次迭代回傳一個批次 (inputs, targets) 的數據加載器"]:
+    """
+    建立以批次為單位取資料的數據加載器，取代 DataLoader(dataset, batch_size, shuffle)。
+    取樣器一次產生一整個批次的索引，直接以索引從 dataset 的滑動視窗取出整個批次，
+    不需要逐筆取樣本再合併（collate）。
+    批次的內容與順序和 DataLoader(dataset, batch_size=batch_size, shuffle=shuffle) 相同
+    （使用相同的隨機種子時）。
+    """
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    # batch_size=None 表示 dataset 回傳的就是一個批次，DataLoader 不再合併樣本
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=False),
+    )
+
+
+# 本地端價量資料快取的預設存放資料夾
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "prices"
+)
+# 價量資料的欄位名稱
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def download_panel_from_yfinance(
+    tickers: Annotated[List[str], "股票代碼列表"],
+    start_date: Annotated[str, "資料開始日期（格式：YYYY-MM-DD）"],
+    end_date: Annotated[str, "資料結束日期（格式：YYYY-MM-DD，不包含當天）"],
+) -> Annotated[Dict[str, pd.DataFrame], "股票代碼 -> 價量資料（索引是日期）"]:
+    """
+    一次呼叫 yf.download 下載多檔股票的價量資料，再拆成每檔股票一張資料表。
+    這是 load_panel_data 預設使用的下載函式（downloader）。
+    """
+    raw_data = pd.DataFrame(
+        yf.download(tickers, start=start_date, end=end_date, group_by="column")
+    )
+    panel = {}
+    for ticker in tickers:
+        ticker_data = raw_data.xs(ticker, axis=1, level="Ticker")[OHLCV_COLUMNS]
+        # 上市前（整列都是遺失值）的日期不保留，其餘遺失值使用前一日的數值填補
+        ticker_data = ticker_data.dropna(how="all").ffill()
+        ticker_data.columns.name = None
+        ticker_data.index.name = "Date"
+        panel[ticker] = ticker_data
+    return panel
+
+
+def load_panel_data(
+    tickers: Annotated[List[str], "股票代碼列表"],
+    start_date: Annotated[str, "資料開始日期（格式：YYYY-MM-DD）"],
+    end_date: Annotated[str, "資料結束日期（格式：YYYY-MM-DD，不包含當天）"],
+    cache_dir: Annotated[
+        Optional[str], "快取資料夾路徑，None 表示不使用快取"
+    ] = DEFAULT_CACHE_DIR,
+    downloader: Annotated[
+        Callable[[List[str], str, str], Dict[str, pd.DataFrame]],
+        "下載多檔股票價量資料的函式",
+    ] = download_panel_from_yfinance,
+) -> Annotated[Dict[str, pd.DataFrame], "股票代碼 -> 價量資料（索引是日期）"]:
+    """
+    讀取多檔股票在 start_date ~ end_date 的價量資料，取代每個資料集各自呼叫
+    generate_ticker_data 下載。每檔股票存成一個 Parquet 檔案（{cache_dir}/{ticker}.parquet），
+    _coverage.json 記錄已下載的日期區間（今天以後尚未收盤確定的日期不記錄，與 Chapter1 的
+    PriceCache 相同）；快取中沒有或日期區間不足的股票，
+    以一次 downloader 呼叫一起下載後寫回快取（下載結果是空的股票不寫入快取）。
+    訓練、驗證、測試的日期區間請用同一份資料切分（fit_panel_scalers、transform_panel_data）。
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    # 今天(含)以後的價量尚未收盤確定，不記錄為已快取的區間，下次讀取時會重新下載
+    settled_end = min(end, pd.Timestamp.today().normalize())
+    coverage = {}
+    coverage_path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        coverage_path = os.path.join(cache_dir, "_coverage.json")
+        if os.path.exists(coverage_path):
+            with open(coverage_path, encoding="utf-8") as f:
+                coverage = json.load(f)
+
+    panel, missing = {}, []
+    for ticker in tickers:
+        covered = coverage.get(ticker)
+        if (
+            covered
+            and pd.Timestamp(covered[0]) <= start
+            and end <= pd.Timestamp(covered[1])
+        ):
+            panel[ticker] = pd.read_parquet(
+                os.path.join(cache_dir, f"{ticker}.parquet")
+            )
+        else:
+            missing.append(ticker)
+
+    if missing:
+        downloaded = downloader(missing, start_date, end_date)
+        for ticker in missing:
+            panel[ticker] = downloaded[ticker]
+            # 下載失敗的股票會是空的資料表，不寫入快取，下次讀取時重新下載
+            if cache_dir is not None and not downloaded[ticker].empty:
+                path = os.path.join(cache_dir, f"{ticker}.parquet")
+                downloaded[ticker].to_parquet(f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+                coverage[ticker] = [start_date, settled_end.strftime("%Y-%m-%d")]
+        if coverage_path is not None:
+            with open(f"{coverage_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(coverage, f, indent=2)
+            os.replace(f"{coverage_path}.tmp", coverage_path)
+
+    # 快取中的資料可能比要求的日期區間長，只回傳 start_date ~ end_date（不包含）的部分
+    return {
+        ticker: panel[ticker][
+            (panel[ticker].index >= start) & (panel[ticker].index < end)
+        ]
+        for ticker in tickers
+    }
+
+
+def fit_panel_scalers(
+    panel: Annotated[Dict[str, pd.DataFrame], "股票代碼 -> 價量資料（索引是日期）"],
+    start_date: Annotated[str, "訓練資料開始日期（格式：YYYY-MM-DD）"],
+    end_date: Annotated[str, "訓練資料結束日期（格式：YYYY-MM-DD，包含當天）"],
+    columns: Annotated[List[str], "要縮放的欄位"] = OHLCV_COLUMNS,
+) -> Annotated[Dict[str, MinMaxScaler], "股票代碼 -> 以訓練期間擬合的縮放器"]:
+    """
+    每檔股票各自以訓練期間（start_date ~ end_date）的資料擬合一個 MinMaxScaler，
+    不同價位的股票縮放到相同的 [0, 1] 範圍，驗證與測試資料使用相同的縮放規則。
+    """
+    scalers = {}
+    for ticker, ticker_data in panel.items():
+        train_data = ticker_data.loc[start_date:end_date, columns]
+        if len(train_data) > 0:
+            scalers[ticker] = MinMaxScaler().fit(train_data)
+    return scalers
+
+
+def transform_panel_data(
+    panel: Annotated[Dict[str, pd.DataFrame], "股票代碼 -> 價量資料（索引是日期）"],
+    scalers: Annotated[Dict[str, MinMaxScaler], "fit_panel_scalers 的結果"],
+    start_date: Annotated[str, "開始日期（格式：YYYY-MM-DD）"],
+    end_date: Annotated[str, "結束日期（格式：YYYY-MM-DD，包含當天）"],
+    columns: Annotated[List[str], "要縮放的欄位"] = OHLCV_COLUMNS,
+) -> Annotated[Dict[str, np.ndarray], "股票代碼 -> 縮放後的資料（資料筆數 x 欄位數）"]:
+    """
+    取出每檔股票在 start_date ~ end_date 的資料，並以該股票的縮放器縮放。
+    沒有縮放器的股票（訓練期間沒有資料）不會出現在結果中。
+    """
+    panel_data = {}
+    for ticker, ticker_data in panel.items():
+        ticker_data = ticker_data.loc[start_date:end_date, columns]
+        if ticker in scalers and len(ticker_data) > 0:
+            panel_data[ticker] = scalers[ticker].transform(ticker_data)
+    return panel_data
+
+
+class StockPanelDataset(Dataset):
+    def __init__(self, data, seq_length, x_idx, y_idx, memmap_dir=None):
+        """
+        多檔股票的時間序列數據集，所有股票共用一個模型訓練。
+
+        參數:
+        - data: 股票代碼 -> 縮放後的資料（numpy array），例如 transform_panel_data 的結果。
+        - seq_length: 每個樣本的時間序列長度，即需要過去幾天的數據來預測下一天。
+        - x_idx: 特徵欄位的索引（選擇哪些欄位作為模型的輸入）。
+        - y_idx: 目標值的索引（選擇哪一欄位作為模型的預測目標）。
+        - memmap_dir: 資料放不進記憶體時，將資料寫成 .npy 檔並以記憶體映射（memmap）讀取，
+          只有取用到的批次才會從硬碟讀入。None 表示資料放在記憶體中。
+
+        所有股票的資料依序接在同一個 float32 陣列中，每個樣本只記錄起始列（不複製資料），
+        取樣本時才以起始列取出連續 seq_length 列，樣本不會跨越兩檔股票。
+        """
+        self.seq_length = seq_length
+        self.x_idx = x_idx
+        self.y_idx = y_idx
+        self.tickers = [ticker for ticker, values in data.items() if len(values) > 0]
+        lengths = np.array(
+            [len(data[ticker]) for ticker in self.tickers], dtype=np.int64
+        )
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        n_rows = int(offsets[-1])
+        n_features = len(np.atleast_1d(x_idx))
+
+        if memmap_dir is None:
+            self.features = np.empty((n_rows, n_features), dtype=np.float32)
+            self.targets = np.empty(n_rows, dtype=np.float32)
+        else:
+            # 逐檔寫入 .npy 檔，不需要一次把所有股票的資料放進記憶體
+            os.makedirs(memmap_dir, exist_ok=True)
+            self.features = np.lib.format.open_memmap(
+                os.path.join(memmap_dir, "features.npy"),
+                mode="w+",
+                dtype=np.float32,
+                shape=(n_rows, n_features),
+            )
+            self.targets = np.lib.format.open_memmap(
+                os.path.join(memmap_dir, "targets.npy"),
+                mode="w+",
+                dtype=np.float32,
+                shape=(n_rows,),
+            )
+        for ticker, start, end in zip(self.tickers, offsets[:-1], offsets[1:]):
+            values = np.asarray(data[ticker])
+            self.features[start:end] = values[:, x_idx].reshape(end - start, -1)
+            self.targets[start:end] = values[:, y_idx]
+        if memmap_dir is not None:
+            self.features.flush()
+            self.targets.flush()
+
+        # 每個樣本的起始列與所屬股票（每檔股票有 資料筆數 - seq_length 個樣本）
+        n_samples = np.maximum(lengths - seq_length, 0)
+        self.ticker_ids = np.repeat(np.arange(len(self.tickers)), n_samples)
+        self.starts = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [np.arange(n) + start for start, n in zip(offsets[:-1], n_samples)]
+        )
+        # 每個樣本在 features 中使用的列相對於起始列的位置
+        self._window_offsets = np.arange(seq_length)
+
+    def __len__(self):
+        """
+        回傳數據集中樣本的總數（所有股票的樣本數加總）。
+        """
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        """
+        根據索引回傳樣本及其對應的目標值。
+
+        參數:
+        - idx: 樣本的索引，也可以是一組索引（list 或張量），一次回傳整個批次
+          (batch_size, seq_length, 特徵數) 與 (batch_size,)，可搭配 create_batch_loader 使用。
+        """
+        starts = self.starts[np.asarray(idx)]
+        # 只有取出的批次會從 features 複製成新的張量
+        rows = np.expand_dims(starts, -1) + self._window_offsets
+        x = torch.from_numpy(np.asarray(self.features[rows]))
+        y = torch.from_numpy(np.asarray(self.targets[starts + self.seq_length]))
+        return x, y
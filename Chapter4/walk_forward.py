@@ -0,0 +1,244 @@
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, clone
+from typing_extensions import Annotated
+
+import Chapter4.utils as chap4_utils
+
+# 每一折（fold）訓練與測試資料在特徵矩陣中的列範圍 [start, end)
+Fold = namedtuple(
+    "Fold", ["fold_id", "train_start", "train_end", "test_start", "test_end"]
+)
+
+
+def build_walk_forward_data(
+    panel: Annotated[Dict[str, pd.DataFrame], "股票代碼 -> 價量資料（索引是日期）"],
+    target: Annotated[
+        str, "目標欄位：Pred_UpDown（漲跌方向）或 Pred_Close（隔日收盤價）"
+    ],
+    columns: Annotated[List[str], "特徵欄位"] = chap4_utils.OHLCV_COLUMNS,
+) -> Annotated[
+    Tuple[np.ndarray, np.ndarray, pd.DataFrame],
+    "(特徵矩陣, 目標值, 每一列的日期、股票代碼與目標值)",
+]:
+    """
+    把多檔股票的價量資料接成一個特徵矩陣，依日期（再依股票代碼）排序，
+    同一段日期的資料在矩陣中是連續的列，每一折只要切片（slice）就能取出，
+    不需要每一折重新篩選資料或重建矩陣。
+    目標欄位與 generate_ticker_data 相同：隔日收盤價與隔日收盤價的漲跌方向，
+    每檔股票最後一天沒有隔日資料，不會出現在結果中。
+    """
+    frames = []
+    for ticker, ticker_data in panel.items():
+        ticker_data = ticker_data[columns].copy()
+        ticker_data["Pred_Close"] = ticker_data["Close"].shift(-1)
+        ticker_data["Pred_UpDown"] = (
+            ticker_data["Pred_Close"] > ticker_data["Close"]
+        ).astype(int)
+        # 最後一天沒有隔日收盤價
+        frames.append(ticker_data.iloc[:-1].assign(Ticker=ticker))
+    all_data = (
+        pd.concat(frames)
+        .rename_axis("Date")
+        .reset_index()
+        .sort_values(["Date", "Ticker"], kind="stable")
+        .reset_index(drop=True)
+    )
+    features = all_data[columns].to_numpy(dtype=np.float64)
+    labels = all_data[target].to_numpy()
+    meta = all_data[["Date", "Ticker", target]].rename(columns={target: "label"})
+    return features, labels, meta
+
+
+def walk_forward_folds(
+    dates: Annotated[np.ndarray, "每一列的日期（已排序），例如 meta['Date']"],
+    train_size: Annotated[
+        int, "訓練資料的交易日數（expanding=True 時為第一折的交易日數）"
+    ],
+    test_size: Annotated[int, "每一折測試資料的交易日數"],
+    step: Annotated[
+        Optional[int], "相鄰兩折往後移動的交易日數，None 表示與 test_size 相同"
+    ] = None,
+    expanding: Annotated[
+        bool, "True 表示訓練資料從第一天開始逐折擴大，False 表示固定長度的滾動視窗"
+    ] = False,
+) -> Annotated[List[Fold], "依時間先後排列的折"]:
+    """
+    依交易日切分 walk-forward 的折：每一折以前 train_size 個交易日訓練，
+    預測接下來 test_size 個交易日，之後整個視窗往後移動 step 個交易日。
+    同一天所有股票的資料一定在同一折，訓練資料一定早於測試資料。
+    """
+    dates = np.asarray(dates)
+    step = test_size if step is None else step
+    # 每個交易日在矩陣中的第一列，最後補上總列數
+    _, first_rows = np.unique(dates, return_index=True)
+    boundaries = np.append(first_rows, len(dates))
+    n_dates = len(first_rows)
+
+    folds = []
+    for test_start in range(train_size, n_dates, step):
+        test_end = min(test_start + test_size, n_dates)
+        train_start = 0 if expanding else test_start - train_size
+        folds.append(
+            Fold(
+                fold_id=len(folds),
+                train_start=int(boundaries[train_start]),
+                train_end=int(boundaries[test_start]),
+                test_start=int(boundaries[test_start]),
+                test_end=int(boundaries[test_end]),
+            )
+        )
+    return folds
+
+
+def sklearn_fit_predict(
+    estimator: Annotated[
+        BaseEstimator, "scikit-learn 模型（每個平行區塊各自複製一份）"
+    ],
+    features: Annotated[np.ndarray, "build_walk_forward_data 的特徵矩陣"],
+    labels: Annotated[np.ndarray, "build_walk_forward_data 的目標值"],
+    predict_proba: Annotated[bool, "True 表示輸出上漲的機率（分類模型）"] = False,
+    warm_start_estimators: Annotated[
+        Optional[int],
+        "隨機森林等集成模型之後每一折只新增幾棵樹（warm_start），None 表示每一折重新訓練",
+    ] = None,
+) -> Annotated[Callable, "run_walk_forward 使用的 fit_predict 函式"]:
+    """
+    建立 scikit-learn 模型的 fit_predict 函式，每一折以切片取出訓練與測試資料。
+    - 有 warm_start 參數、沒有 n_estimators 的模型（例如 LogisticRegression）
+      以上一折的係數作為起始值，收斂得比較快。
+    - 集成模型在 warm_start_estimators 不是 None 時保留前面的樹，
+      每一折只以新的訓練視窗新增 warm_start_estimators 棵樹。
+    - 其他模型（例如 LinearRegression、DecisionTreeClassifier）每一折重新訓練。
+    """
+
+    def fit_predict(fold, model):
+        params = estimator.get_params()
+        if model is None:
+            model = clone(estimator)
+        elif "n_estimators" in params:
+            if warm_start_estimators is None:
+                model = clone(estimator)
+            else:
+                model.set_params(
+                    warm_start=True,
+                    n_estimators=model.n_estimators + warm_start_estimators,
+                )
+        elif "warm_start" in params:
+            model.set_params(warm_start=True)
+        else:
+            model = clone(estimator)
+
+        model.fit(
+            features[fold.train_start : fold.train_end],
+            labels[fold.train_start : fold.train_end],
+        )
+        test_features = features[fold.test_start : fold.test_end]
+        if predict_proba:
+            return model.predict_proba(test_features)[:, 1], model
+        return model.predict(test_features), model
+
+    return fit_predict
+
+
+def xgboost_fit_predict(
+    dmatrix: Annotated[object, "整個特徵矩陣建立一次的 xgboost.DMatrix（包含目標值）"],
+    params: Annotated[Dict[str, object], "xgboost.train 的參數"],
+    num_boost_round: Annotated[int, "每個區塊第一折訓練的樹的數量"] = 10,
+    warm_start_rounds: Annotated[
+        Optional[int],
+        "之後每一折接著上一折的模型再訓練幾棵樹，None 表示每一折重新訓練",
+    ] = None,
+) -> Annotated[Callable, "run_walk_forward 使用的 fit_predict 函式"]:
+    """
+    建立 XGBoost 的 fit_predict 函式。DMatrix 只建立一次，
+    每一折以 DMatrix.slice 取出訓練與測試的列，不需要重新轉換特徵矩陣。
+    warm_start_rounds 不是 None 時，以上一折的模型作為 xgb_model 繼續提升（boosting），
+    每一折只新增 warm_start_rounds 棵樹。
+    """
+    # xgboost 只有使用這個函式時才需要安裝
+    import xgboost
+
+    def fit_predict(fold, booster):
+        dtrain = dmatrix.slice(np.arange(fold.train_start, fold.train_end))
+        dtest = dmatrix.slice(np.arange(fold.test_start, fold.test_end))
+        if booster is None or warm_start_rounds is None:
+            booster = xgboost.train(params, dtrain, num_boost_round=num_boost_round)
+        else:
+            booster = xgboost.train(
+                params, dtrain, num_boost_round=warm_start_rounds, xgb_model=booster
+            )
+        return booster.predict(dtest), booster
+
+    return fit_predict
+
+
+def _run_folds(fit_predict, folds):
+    """
+    依序執行同一個區塊的折，上一折的模型傳給下一折（warm start）。
+    """
+    model, predictions = None, []
+    for fold in folds:
+        fold_predictions, model = fit_predict(fold, model)
+        predictions.append(np.asarray(fold_predictions))
+    return predictions
+
+
+def run_walk_forward(
+    fit_predict: Annotated[
+        Callable, "sklearn_fit_predict 或 xgboost_fit_predict 的結果"
+    ],
+    folds: Annotated[List[Fold], "walk_forward_folds 的結果"],
+    meta: Annotated[pd.DataFrame, "build_walk_forward_data 的日期、股票代碼與目標值"],
+    n_jobs: Annotated[int, "平行執行的區塊數，-1 表示 CPU 核心數"] = 1,
+    chain_length: Annotated[
+        Optional[int],
+        "每個區塊連續幾折（warm start 鏈的長度），None 表示所有折在同一個區塊依序執行",
+    ] = None,
+) -> Annotated[
+    pd.DataFrame, "所有折的樣本外預測（Date、Ticker、fold、label、prediction）"
+]:
+    """
+    執行 walk-forward 訓練與預測，把每一折的樣本外（out-of-sample）預測接成一張訊號表。
+    折依時間順序切成每 chain_length 折一個連續的區塊，區塊內依序執行並把上一折的模型
+    傳給下一折（warm start），每個區塊的第一折從頭訓練；n_jobs 個區塊同時平行執行。
+    使用 warm start 時訊號取決於 chain_length（每隔幾折重新訓練一次），與 n_jobs 無關，
+    不同核心數的電腦會得到相同的結果；chain_length=None 時只有一個區塊，無法平行執行。
+    使用執行緒（threads）平行，所有區塊共用同一份特徵矩陣與 DMatrix，不需要複製資料；
+    XGBoost 與 scikit-learn 的樹模型訓練時會釋放 GIL。
+    """
+    if not folds:
+        raise ValueError("資料的交易日數不足以切出任何一折")
+    if chain_length is None:
+        chain_length = len(folds)
+    if chain_length < 1:
+        raise ValueError("chain_length 必須是正整數")
+    chunks = [
+        folds[start : start + chain_length]
+        for start in range(0, len(folds), chain_length)
+    ]
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_run_folds)(fit_predict, chunk) for chunk in chunks
+    )
+    predictions = [
+        fold_predictions
+        for chunk_results in results
+        for fold_predictions in chunk_results
+    ]
+
+    rows = np.concatenate([np.arange(fold.test_start, fold.test_end) for fold in folds])
+    signals = meta.iloc[rows].reset_index(drop=True)
+    signals.insert(
+        2,
+        "fold",
+        np.repeat(
+            [fold.fold_id for fold in folds],
+            [fold.test_end - fold.test_start for fold in folds],
+        ),
+    )
+    signals["prediction"] = np.concatenate(predictions)
+    return signals
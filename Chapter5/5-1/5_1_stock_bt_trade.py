@@ -40,10 +40,12 @@ top_N_stocks = chap1_utils.get_top_stocks_by_market_value(
 
 # %%
 # 取得指定股票代碼列表在給定日期範圍內的每日 OHLCV 數據。
+# 使用本地價量快取，只下載快取中缺少的日期區間
 all_stock_data = chap1_utils.get_daily_OHLCV_data(
     stock_symbols=top_N_stocks,
     start_date=analysis_period_start_date,
     end_date=analysis_period_end_date,
+    price_cache=chap1_utils.PriceCache(),
 )
 all_stock_data["datetime"] = all_stock_data["datetime"].astype(str)
 all_stock_data["asset"] = all_stock_data["asset"].astype(str)
@@ -80,20 +82,21 @@ rank_factors_data_dict = {}
 trading_days = pd.date_range(
     start=analysis_period_start_date, end=analysis_period_end_date
 )
+# 以 as-of 方式一次取得所有因子數據，每個交易日對應到最近一期財報的因子值
+all_factors_data = chap1_utils.get_factor_data(
+    stock_symbols=top_N_stocks,
+    factor_name=all_factors,
+    trading_days=list(trading_days),
+    asof=True,
+)
 for factor in all_factors:
-    # 取得因子數據，並按股票代碼和日期進行排序與填充
+    # 取出單一因子數據，並移除尚未有財報資料的日期
     quarter_factor_data = (
-        chap1_utils.get_factor_data(
-            stock_symbols=top_N_stocks,
-            factor_name=factor,
-            trading_days=list(trading_days),
-        )
+        all_factors_data[factor]
+        .rename("value")
+        .dropna()
         .reset_index()
         .assign(factor_name=factor)
-        .sort_values(by=["asset", "datetime"])
-        .groupby("asset", group_keys=False)
-        .apply(lambda group: group.ffill())
-        .dropna()
     )
     # 根據因子值進行股票排序
     quarter_factor_data = chap1_utils.rank_stocks_by_factor(
@@ -13,6 +13,11 @@ warnings.filterwarnings('ignore')
 # 5-2 調整，登入 shioaji
 import shioaji as sj
 import os
+import sys
+# 5-2 調整，使用 Chapter3 的交易時段 K 線轉換
+utils_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(utils_folder_path)
+import Chapter3.utils as chap3_utils  # noqa: E402
 
 api = sj.Shioaji(simulation=True) 
 
@@ -205,14 +210,8 @@ data = data.rename(columns={'ts':'Date'})
 
 # 5-2 調整，只保留日盤並且做成 30 分 K
 data.index = pd.to_datetime(data['Date'])
-data = data.between_time('08:45', '13:45')
-data = data.resample('30min', closed='right', label='right', offset='15min').agg({
-        'Open': 'first',
-        'High': 'max',
-        'Low': 'min',
-        'Close': 'last',
-        'Volume': 'sum'
-    }).dropna()
+data = chap3_utils.resample_futures_bars(
+    data, '30min', sessions=('day',), separate_open_bar=True)
 data = data.reset_index()
 data = data.dropna()
 
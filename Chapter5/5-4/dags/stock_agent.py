@@ -1,6 +1,10 @@
 import pandas as pd
+import numpy as np
 import shioaji as sj
 import datetime
+import time
+from collections import Counter, namedtuple
+from types import SimpleNamespace
 
 class StockAPIWrapper:
     def __init__(self, api):
@@ -33,6 +37,24 @@ class StockAPIWrapper:
         price_data.ts = pd.to_datetime(price_data.ts)
         return price_data
 
+    # 獲取指定日期的 Ticks，直接回傳 numpy 陣列 (時間為奈秒整數)，不建立 DataFrame
+    # 供 TickBarAggregator.update 使用
+    def get_tick_arrays(self, stock_id, date):
+        ticks = self.api.ticks(
+            contract=self.api.Contracts.Stocks[stock_id],
+            date=date,
+        )
+        ts = np.asarray(ticks.ts, dtype=np.int64)
+        close = np.asarray(ticks.close, dtype=np.float64)
+        volume = np.asarray(ticks.volume, dtype=np.float64)
+        return ts, close, volume
+
+    # 將指定日期的 Ticks 存成 csv，供 replay_ticks 離線重播
+    def save_ticks(self, stock_id, date, path):
+        price_data = self.get_ticks(stock_id, date)
+        price_data.to_csv(path, index=False)
+        return path
+
     # 下單契約
     def get_contract(self, stock_id):
         return self.api.Contracts.Stocks[stock_id]
@@ -133,123 +155,111 @@ class StockAPIWrapper:
 
 
 class StockTradeManager(StockAPIWrapper):
-    def __init__(self, api, exclude_list=None):
+    def __init__(self, api, exclude_list=None, price_ttl=60):
         super().__init__(api)
         self.exclude_list = exclude_list if exclude_list else []
+        # 最新價格的快取 {股票代碼: (價格, 取得時間)}，price_ttl 秒內重複使用
+        self.price_ttl = price_ttl
+        self._price_cache = {}
+
+    # 真實倉位 {股票代碼: 股數}，融券 (direction 為 Action.Sell) 為負值
+    def get_signed_positions(self):
+        real_positions = self.get_positions()
+        if len(real_positions) == 0:
+            return pd.Series(dtype=np.float64)
+        quantity = np.where(real_positions['direction'] == sj.constant.Action.Sell,
+                            -real_positions['quantity'], real_positions['quantity'])
+        return pd.Series(quantity, index=real_positions['code'].astype(str)).groupby(level=0).sum()
+
+    # 一次取得多檔股票的最新價格 (snapshots 每次最多 500 檔)，快取中未過期的價格直接使用
+    # snapshots 沒有價格的股票 (例如當天尚未成交) 改用最近兩天 K 線的收盤價
+    def get_latest_prices(self, codes):
+        now = time.time()
+        codes = [str(code) for code in codes]
+        missing = [code for code in codes
+                   if code not in self._price_cache or now - self._price_cache[code][1] > self.price_ttl]
+        for i in range(0, len(missing), 500):
+            contracts = [self.get_contract(code) for code in missing[i:i + 500]]
+            for snapshot in self.api.snapshots(contracts):
+                if snapshot.close > 0:
+                    self._price_cache[str(snapshot.code)] = (float(snapshot.close), now)
 
-    # 比對模擬倉位與真實倉位
-    def sync_positions(self, simulated_position):
         start_date = (datetime.datetime.now() - datetime.timedelta(days=2)).strftime('%Y-%m-%d')
         end_date = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        for code in missing:
+            if code not in self._price_cache or self._price_cache[code][1] != now:
+                close = self.get_kbars(stock_id=code, start_date=start_date, end_date=end_date)['Close']
+                self._price_cache[code] = (float(close.iloc[-1]), now)
+        return pd.Series({code: self._price_cache[code][0] for code in codes}, dtype=np.float64)
+
+    # 計算模擬倉位與真實倉位的差異，回傳需要下的委託 (每檔最多兩筆，先平倉再建倉)
+    # 欄位：code、simulated_size、real_size (張)、action (下單函式名稱)、quantity (張)、price
+    def plan_orders(self, simulated_position):
+        columns = ['code', 'simulated_size', 'real_size', 'action', 'quantity', 'price']
         if len(simulated_position) == 0:
-            return
-        
-        simulated_position['股票'] = simulated_position['股票'].astype(str)
-        # 轉換成 dictionary 方便比對
-        simulated_dict = simulated_position.set_index('股票')['持倉'].to_dict()
-        real_positions = self.get_positions()
-        if len(real_positions) > 0:
-            real_positions['code'] = real_positions['code'].astype(str)
-            # 如果 direction 是 Action.Sell，將 quantity 轉為負值
-            real_positions['quantity'] = real_positions.apply(
-                lambda row: row['quantity'] * -1 
-                if row['direction'] == sj.constant.Action.Sell else row['quantity'],
-                axis=1
-            )
-            real_dict = real_positions.set_index('code')['quantity'].to_dict()
-        else:
-            real_dict = {}
-        all_codes = set(simulated_dict.keys()).union(set(real_dict.keys()))
-
-        for code in all_codes:
-            code = str(code)
-            if code in self.exclude_list:
-                continue  # 排除清單中的股票
-            simulated_size = int(simulated_dict.get(code, 0)/1000)
-            real_size = int(real_dict.get(code, 0)/1000)
-            contract = self.get_contract(code)
-            order_price = self.get_kbars(stock_id=code, 
-                                         start_date=start_date, 
-                                         end_date=end_date)['Close'].tolist()[-1]
-            print(f"""Processing stock {code}: 
-                  Simulated size = {simulated_size}, 
-                  Real size = {real_size}, 
-                  Order price = {order_price}""")
-
-            if simulated_size > 0:  # 模擬庫存 > 0
-                if real_size > 0:  # 真實庫存 > 0
-                    if simulated_size > real_size:  # 模擬庫存 > 真實庫存，買進補足
-                        print(f"""Condition: Simulated > Real (Buy). 
-                              Action: Market Buy {simulated_size - real_size} units.""")
-                        self.market_buy(contract, order_price, simulated_size - real_size)
-
-                    elif simulated_size < real_size:  # 模擬庫存 < 真實庫存，賣出補齊
-                        print(f"""Condition: Simulated < Real (Sell). 
-                              Action: Market Sell {real_size - simulated_size} units.""")
-                        self.market_sell(contract, order_price, real_size - simulated_size)
-
-                elif real_size < 0:  # 真實庫存 < 0
-                    print(f"""Condition: Simulated > 0, Real < 0. 
-                          Action: Short Cover {abs(real_size)} units, 
-                          Market Buy {simulated_size} units.""")
-                    self.short_cover(contract, order_price, abs(real_size))
-                    self.market_buy(contract, order_price, simulated_size)
-
-
-                elif real_size == 0:  # 真實庫存 = 0
-                    print(f"""Condition: Simulated > 0, Real = 0. 
-                          Action: Market Buy {simulated_size} units.""")
-                    self.market_buy(contract, order_price, simulated_size)
-
-            elif simulated_size < 0:  # 模擬庫存 < 0
-                if real_size > 0:  # 真實庫存 > 0
-                    print(f"""Condition: Simulated < 0, Real > 0. 
-                          Action: Market Sell {real_size} units, 
-                          Short Sell {abs(simulated_size)} units.""")
-                    self.market_sell(contract, order_price, real_size)
-                    self.short_sell(contract, order_price, abs(simulated_size))
-
-                elif real_size < 0:  # 真實庫存 < 0
-                    if simulated_size > real_size:  # 模擬庫存 > 真實庫存，融券回補
-                        print(f"""Condition: Simulated > Real (Short Cover). 
-                              Action: Short Cover {abs(real_size - simulated_size)} units.""")
-                        self.short_cover(contract, order_price, abs(real_size - simulated_size))
-
-                    elif simulated_size < real_size:  # 模擬庫存 < 真實庫存，融券放空補足
-                        print(f"""Condition: Simulated < Real (Short Sell). 
-                              Action: Short Sell {abs(real_size - simulated_size)} units.""")
-                        self.short_sell(contract, order_price, abs(real_size - simulated_size))
-
-                elif real_size == 0:  # 真實庫存 = 0
-                    print(f"""Condition: Simulated < 0, Real = 0. 
-                          Action: Short Sell {abs(simulated_size)} units.""")
-                    self.short_sell(contract, order_price, abs(simulated_size))
-
-            elif simulated_size == 0:  # 模擬庫存 = 0
-                if real_size != 0:
-                    print(f"""Condition: Simulated = 0, Real != 0. 
-                          Action: Skipping stock {code}.""")
-
-            print('==============================')
-        print("同步完成！")
+            return pd.DataFrame(columns=columns)
+
+        simulated = simulated_position.assign(股票=simulated_position['股票'].astype(str))
+        simulated = simulated.groupby('股票')['持倉'].sum()
+        real = self.get_signed_positions()
+        book = pd.concat([simulated.rename('simulated'), real.rename('real')], axis=1).fillna(0)
+        book = book[~book.index.isin([str(code) for code in self.exclude_list])].sort_index()
+
+        # 股數換算成張數 (無條件捨去到整張)
+        sim = np.trunc(book['simulated'].to_numpy() / 1000).astype(int)
+        real = np.trunc(book['real'].to_numpy() / 1000).astype(int)
+        long_sim, short_sim = np.maximum(sim, 0), np.minimum(sim, 0)
+        long_real, short_real = np.maximum(real, 0), np.minimum(real, 0)
+        # 模擬倉位為 0 時不調整 (與原本的做法相同，只提示不下單)
+        active = sim != 0
+        legs = [
+            # 先平倉：賣出多餘的現股、回補多餘的融券
+            ('market_sell', np.maximum(long_real - long_sim, 0) * active),
+            ('short_cover', np.maximum(short_sim - short_real, 0) * active),
+            # 再建倉：買進不足的現股、融券放空不足的部位
+            ('market_buy', np.maximum(long_sim - long_real, 0) * active),
+            ('short_sell', np.maximum(short_real - short_sim, 0) * active),
+        ]
+        plan = pd.concat([
+            pd.DataFrame({
+                'code': book.index, 'simulated_size': sim, 'real_size': real,
+                'action': action, 'quantity': quantity, 'leg': leg,
+            })[quantity > 0]
+            for leg, (action, quantity) in enumerate(legs)
+        ])
+        plan = plan.sort_values(['code', 'leg'], kind='stable').drop(columns='leg')
+        plan['price'] = self.get_latest_prices(plan['code'].unique()).reindex(plan['code']).to_numpy()
+
+        skipped = book.index[(sim == 0) & (real != 0)]
+        if len(skipped) > 0:
+            print(f"Condition: Simulated = 0, Real != 0. Action: Skipping stocks {list(skipped)}.")
+        return plan.reset_index(drop=True)[columns]
+
+    # 依 plan_orders 的結果下單，dry_run=True 時只印出委託不下單
+    def execute_plan(self, plan, dry_run=False):
+        for order in plan.itertuples(index=False):
+            print(f"""Processing stock {order.code}: 
+                  Simulated size = {order.simulated_size}, 
+                  Real size = {order.real_size}, 
+                  Action: {order.action} {order.quantity} units at price {order.price}.""")
+            if not dry_run:
+                getattr(self, order.action)(self.get_contract(order.code), order.price, int(order.quantity))
+        print('==============================')
+
+    # 比對模擬倉位與真實倉位，一次算出所有股票的差異後下單
+    # 只對需要下單的股票取得價格 (snapshots 一次取得)，回傳委託計畫
+    def sync_positions(self, simulated_position, dry_run=False):
+        plan = self.plan_orders(simulated_position)
+        self.execute_plan(plan, dry_run=dry_run)
+        print("同步完成！" if not dry_run else "同步計畫 (dry run，未下單)！")
+        return plan
 
 
 
     def execute_orders(self, order_df):
         if len(order_df)==0:
             return
-        real_positions = self.get_positions()
-
-        if len(real_positions) > 0:
-            real_positions['code'] = real_positions['code'].astype(str)
-            real_positions['quantity'] = real_positions.apply(
-                lambda row: row['quantity'] * -1 
-                if row['direction'] == sj.constant.Action.Sell else row['quantity'],
-                axis=1
-            )
-            position_dict = real_positions.set_index('code')['quantity'].to_dict()
-        else:
-            position_dict = {}
+        position_dict = self.get_signed_positions().to_dict()
 
         for _, order in order_df.iterrows():
             stock_id = str(order['股票'])
@@ -316,3 +326,249 @@ class StockTradeManager(StockAPIWrapper):
         print("All orders processed!")
 
 
+# 完成的 K 線，ts 為 K 線結束時間 (奈秒整數)
+Bar = namedtuple('Bar', ['ts', 'open', 'high', 'low', 'close', 'volume', 'vwap'])
+
+# 環狀緩衝區中每根 K 線的欄位順序 (ts 另外以整數陣列保存)
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'vwap')
+
+
+# 時間轉為奈秒整數，整數視為已經是奈秒
+def _to_ns(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).value
+
+
+class TickBarAggregator:
+    # 將逐筆成交 (Ticks) 增量彙總成多個週期的 K 線 (開高低收量與 VWAP)
+    # - 每個週期的 K 線保存在預先配置的環狀緩衝區，只保留最近 capacity 根，不重建 DataFrame
+    # - K 線包含左端點、以結束時間標示，例如 09:00:00 ~ 09:00:59 的成交屬於 09:01 的 1 分 K
+    # - K 線完成時 (收到下一根 K 線的成交，或呼叫 close_bars / flush) 呼叫 callbacks(freq, bar)
+    # - Ticks 需依時間順序送入，早於目前 K 線的成交 (延遲的資料) 會被略過並計入 late_ticks
+    def __init__(self, freqs=('1min', '5min', '30min'), capacity=1000, callbacks=None):
+        self.freqs = tuple(freqs)
+        self.capacity = capacity
+        self.callbacks = list(callbacks) if callbacks else []
+        self.late_ticks = 0
+        self._steps = {freq: pd.Timedelta(freq).value for freq in self.freqs}
+        self._ts = {freq: np.zeros(capacity, dtype=np.int64) for freq in self.freqs}
+        self._bars = {freq: np.zeros((capacity, len(BAR_FIELDS))) for freq in self.freqs}
+        self._count = dict.fromkeys(self.freqs, 0)
+        # 尚未完成的 K 線：label 與 [open, high, low, close, volume, 價格 x 成交量]
+        self._label = dict.fromkeys(self.freqs)
+        self._partial = dict.fromkeys(self.freqs)
+
+    # 新增 K 線完成時要呼叫的函式，呼叫方式為 callback(freq, bar)
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    # 將完成的 K 線寫入環狀緩衝區並通知 callbacks
+    # labels: K 線結束時間，values: (根數, 6) 的 [open, high, low, close, volume, 價格 x 成交量]
+    def _emit(self, freq, labels, values):
+        n = len(labels)
+        if n == 0:
+            return
+        volume, pv = values[:, 4], values[:, 5]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.where(volume > 0, pv / volume, values[:, 3])
+        bars = np.column_stack([values[:, :5], vwap])
+        # 一次完成的根數超過容量時，只需要寫入最後 capacity 根
+        start = max(n - self.capacity, 0)
+        pos = (self._count[freq] + np.arange(start, n)) % self.capacity
+        self._ts[freq][pos] = labels[start:]
+        self._bars[freq][pos] = bars[start:]
+        self._count[freq] += n
+        for callback in self.callbacks:
+            for label, row in zip(labels.tolist(), bars.tolist()):
+                callback(freq, Bar(label, *row))
+
+    # 批次送入 Ticks：ts 為奈秒整數 (或 datetime64)，price、volume 為成交價與成交量
+    # 每個週期以 reduceat 一次彙總整批成交，回傳這次完成的 K 線根數 {freq: 根數}
+    def update(self, ts, price, volume):
+        ts = np.asarray(ts).astype('datetime64[ns]').view(np.int64)
+        price = np.asarray(price, dtype=np.float64)
+        volume = np.asarray(volume, dtype=np.float64)
+        if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+            order = np.argsort(ts, kind='stable')
+            ts, price, volume = ts[order], price[order], volume[order]
+
+        count = dict(self._count)
+        if len(ts) < 32:
+            # 筆數很少時逐筆處理比陣列運算快
+            for tick in zip(ts.tolist(), price.tolist(), volume.tolist()):
+                self.add_tick(*tick)
+            return {freq: self._count[freq] - count[freq] for freq in self.freqs}
+
+        for freq in self.freqs:
+            step = self._steps[freq]
+            labels = (ts // step + 1) * step
+            p, v = price, volume
+            current = self._label[freq]
+            if current is not None:
+                late = labels < current
+                if late.any():
+                    self.late_ticks += int(late.sum())
+                    labels, p, v = labels[~late], p[~late], v[~late]
+            if len(labels) == 0:
+                continue
+
+            starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+            ends = np.r_[starts[1:], len(labels)] - 1
+            values = np.column_stack([
+                p[starts],
+                np.maximum.reduceat(p, starts),
+                np.minimum.reduceat(p, starts),
+                p[ends],
+                np.add.reduceat(v, starts),
+                np.add.reduceat(p * v, starts),
+            ])
+            run_labels = labels[starts]
+
+            if current is not None:
+                partial = self._partial[freq]
+                if run_labels[0] == current:
+                    # 第一段接續尚未完成的 K 線
+                    values[0, 0] = partial[0]
+                    values[0, 1] = max(values[0, 1], partial[1])
+                    values[0, 2] = min(values[0, 2], partial[2])
+                    values[0, 4] += partial[4]
+                    values[0, 5] += partial[5]
+                else:
+                    self._emit(freq, np.array([current]), np.array([partial]))
+
+            # 最後一段尚未完成，其餘的 K 線都已完成
+            self._emit(freq, run_labels[:-1], values[:-1])
+            self._label[freq] = int(run_labels[-1])
+            self._partial[freq] = values[-1].tolist()
+        return {freq: self._count[freq] - count[freq] for freq in self.freqs}
+
+    # 送入單筆 Ticks (即時行情使用)，不經過陣列運算
+    def add_tick(self, ts, price, volume):
+        ts = _to_ns(ts)
+        price, volume = float(price), float(volume)
+        for freq in self.freqs:
+            step = self._steps[freq]
+            label = (ts // step + 1) * step
+            current = self._label[freq]
+            if current is not None and label < current:
+                self.late_ticks += 1
+                continue
+            if label == current:
+                partial = self._partial[freq]
+                partial[1] = max(partial[1], price)
+                partial[2] = min(partial[2], price)
+                partial[3] = price
+                partial[4] += volume
+                partial[5] += price * volume
+                continue
+            if current is not None:
+                self._emit(freq, np.array([current]), np.array([self._partial[freq]]))
+            self._label[freq] = label
+            self._partial[freq] = [price, price, price, price, volume, price * volume]
+
+    # shioaji 即時行情的 callback，例如 api.quote.set_on_tick_stk_v1_callback(aggregator.on_tick)
+    def on_tick(self, exchange, tick):
+        self.add_tick(tick.datetime, tick.close, tick.volume)
+
+    # 時間到了但沒有新的成交時 (例如收盤)，結束標示時間 <= now 的 K 線
+    def close_bars(self, now):
+        now = _to_ns(now)
+        for freq in self.freqs:
+            current = self._label[freq]
+            if current is not None and current <= now:
+                self._emit(freq, np.array([current]), np.array([self._partial[freq]]))
+                self._label[freq] = self._partial[freq] = None
+
+    # 結束所有尚未完成的 K 線
+    def flush(self):
+        for freq in self.freqs:
+            if self._label[freq] is not None:
+                self._emit(freq, np.array([self._label[freq]]), np.array([self._partial[freq]]))
+                self._label[freq] = self._partial[freq] = None
+
+    # 取得最近 n 根完成的 K 線 (依時間排序)，回傳 (ts, 各欄位陣列 {欄位: 陣列})
+    def get_bars(self, freq, n=None):
+        count = min(self._count[freq], self.capacity)
+        n = count if n is None else min(n, count)
+        pos = (self._count[freq] - n + np.arange(n)) % self.capacity
+        bars = self._bars[freq][pos]
+        return self._ts[freq][pos], {field: bars[:, i] for i, field in enumerate(BAR_FIELDS)}
+
+    # 轉為 DataFrame 方便檢視 (策略運算請使用 get_bars 或 callbacks)
+    def to_frame(self, freq, n=None):
+        ts, bars = self.get_bars(freq, n)
+        price_data = pd.DataFrame(bars, index=pd.DatetimeIndex(ts.view('datetime64[ns]'), name='ts'))
+        return price_data.rename(columns=str.capitalize)
+
+
+# 重播 save_ticks 存下的 Ticks 檔案，用來離線測試策略與量測 TickBarAggregator 的速度
+# batch_size 為每次送入的筆數，None 表示逐筆送入 (模擬即時行情)
+def replay_ticks(path, aggregator, batch_size=None):
+    price_data = pd.read_csv(path, usecols=['ts', 'close', 'volume'])
+    ts = pd.to_datetime(price_data['ts']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    price = price_data['close'].to_numpy(dtype=np.float64)
+    volume = price_data['volume'].to_numpy(dtype=np.float64)
+
+    start_time = time.perf_counter()
+    if batch_size is None:
+        for tick in zip(ts.tolist(), price.tolist(), volume.tolist()):
+            aggregator.add_tick(*tick)
+    else:
+        for i in range(0, len(ts), batch_size):
+            aggregator.update(ts[i:i + batch_size], price[i:i + batch_size], volume[i:i + batch_size])
+    aggregator.flush()
+    seconds = time.perf_counter() - start_time
+    return {
+        'ticks': len(ts),
+        'seconds': seconds,
+        'ticks_per_second': len(ts) / seconds if seconds > 0 else np.inf,
+    }
+
+
+class FakeStockAPI:
+    # 模擬 shioaji 的 API，供離線測試 StockTradeManager 使用，不會連線也不會真的下單
+    # positions: {股票代碼: 股數}，負值表示融券；prices: {股票代碼: 最新價格}
+    # 下單紀錄保存在 orders，各 API 的呼叫次數保存在 calls
+    def __init__(self, positions=None, prices=None):
+        self.stock_account = 'fake_stock_account'
+        self.positions = {str(code): quantity for code, quantity in (positions or {}).items()}
+        self.prices = {str(code): price for code, price in (prices or {}).items()}
+        self.orders = []
+        self.calls = Counter()
+        self.Contracts = SimpleNamespace(Stocks=_FakeContracts())
+
+    def list_positions(self, account, unit=None):
+        self.calls['list_positions'] += 1
+        return [
+            SimpleNamespace(code=code, quantity=abs(quantity),
+                            direction=sj.constant.Action.Sell if quantity < 0 else sj.constant.Action.Buy)
+            for code, quantity in self.positions.items() if quantity != 0
+        ]
+
+    def snapshots(self, contracts):
+        self.calls['snapshots'] += 1
+        return [SimpleNamespace(code=c.code, close=self.prices.get(c.code, 0)) for c in contracts]
+
+    def kbars(self, contract, start, end):
+        self.calls['kbars'] += 1
+        price = self.prices.get(contract.code, 0)
+        return {'ts': [pd.Timestamp(end).value], 'Open': [price], 'High': [price],
+                'Low': [price], 'Close': [price], 'Volume': [0]}
+
+    def Order(self, **kwargs):
+        return SimpleNamespace(**kwargs)
+
+    def place_order(self, contract, order):
+        self.calls['place_order'] += 1
+        self.orders.append({'code': contract.code, **vars(order)})
+        return self.orders[-1]
+
+    def update_status(self, account):
+        self.calls['update_status'] += 1
+
+
+class _FakeContracts(dict):
+    # Contracts.Stocks[股票代碼]，回傳只有 code 屬性的契約
+    def __missing__(self, code):
+        return SimpleNamespace(code=str(code))